@@ -0,0 +1,508 @@
+"""
+Online backup and restore of bot data.
+Streams each table with COPY ... TO STDOUT (the SQLite backup API on
+SQLite) into chunked, gzip-compressed files with SHA-256 checksums, while
+the bot keeps running. Append-only tables can be backed up incrementally
+from the id watermarks of a previous backup.
+
+Usage:
+    python backup.py backup backups/2026-10-19
+    python backup.py backup backups/2026-10-20 --base backups/2026-10-19
+    python backup.py verify backups/2026-10-20
+    python backup.py restore backups/2026-10-20 --jobs 8
+    python backup.py restore backups/2026-10-20 --clean --bot-id 123456789
+
+Layout:
+    <dir>/<table>.<n>.csv.gz          (PostgreSQL)
+    <dir>/database.<n>.sqlite.gz      (SQLite)
+    <dir>/manifest.json               (written last; a backup without it is incomplete)
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, select, text
+from config import BACKUP_SETTINGS
+from database.db import db, EXPORT_TABLES, ROLLUP_LAG_SECONDS
+from database.models import Base
+from database.tenancy import current_tenant, tenant_schema, use_tenant
+from utils.logger import logger
+
+# Tables whose rows are never updated or deleted, backed up by id range
+# (game_history is not: its old rows are folded into game_history_daily)
+APPEND_ONLY_TABLES = ("transactions",)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+# CPU niceness of backups; also lowers their I/O priority on Linux (CFQ/BFQ)
+BACKUP_NICE = 10
+
+# SQLite pages copied per backup step
+SQLITE_PAGES_PER_STEP = 256
+
+FOREIGN_KEYS_SQL = """
+SELECT cl.relname, c.conname, pg_get_constraintdef(c.oid)
+FROM pg_constraint c
+JOIN pg_class cl ON cl.oid = c.conrelid
+JOIN pg_namespace n ON n.oid = cl.relnamespace
+WHERE c.contype = 'f' AND n.nspname = :schema AND cl.relname = ANY(:tables)
+"""
+
+# Indexes that do not back a primary key or unique constraint
+SECONDARY_INDEXES_SQL = """
+SELECT i.tablename, i.indexname, i.indexdef
+FROM pg_indexes i
+WHERE i.schemaname = :schema AND i.tablename = ANY(:tables)
+  AND NOT EXISTS (
+    SELECT 1 FROM pg_constraint c
+    WHERE c.conindid = (quote_ident(i.schemaname) || '.' || quote_ident(i.indexname))::regclass
+  )
+"""
+
+
+class BackupError(Exception):
+    """Raised when a backup is incomplete, corrupt or cannot be restored."""
+
+
+def write_chunk(path: str, data: bytes, level: int) -> str:
+    """Compress data into a file atomically; returns the SHA-256 of the file."""
+    compressed = gzip.compress(data, compresslevel=level)
+    with open(f"{path}.tmp", "wb") as stream:
+        stream.write(compressed)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(f"{path}.tmp", path)
+    return hashlib.sha256(compressed).hexdigest()
+
+
+def read_chunk(backup_dir: str, chunk: Dict) -> bytes:
+    """Read and decompress a chunk after checking its checksum."""
+    with open(os.path.join(backup_dir, chunk["file"]), "rb") as stream:
+        compressed = stream.read()
+    if hashlib.sha256(compressed).hexdigest() != chunk["sha256"]:
+        raise BackupError(f"Checksum mismatch in {os.path.join(backup_dir, chunk['file'])}")
+    return gzip.decompress(compressed)
+
+
+class ChunkWriter:
+    """Split a byte stream into compressed, checksummed chunk files.
+
+    ``write`` is used as the output of a COPY; sleeping in it when reads run
+    ahead of the rate limit holds back the server side of the COPY as well.
+    """
+
+    def __init__(self, out_dir: str, prefix: str, suffix: str,
+                 chunk_size: int = BACKUP_SETTINGS["chunk_mb"] * 1024 * 1024,
+                 level: int = BACKUP_SETTINGS["compression_level"],
+                 max_rate: float = BACKUP_SETTINGS["max_rate_mb"] * 1024 * 1024):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.suffix = suffix
+        self.chunk_size = chunk_size
+        self.level = level
+        self.max_rate = max_rate
+        self.chunks: List[Dict] = []
+        self._buffer = bytearray()
+        self._read = 0
+        self._started = time.monotonic()
+
+    async def write(self, data: bytes):
+        """Add data, writing a chunk file whenever a chunk is full."""
+        self._buffer += data
+        self._read += len(data)
+        if len(self._buffer) >= self.chunk_size:
+            await self._flush()
+        if self.max_rate:
+            ahead = self._read / self.max_rate - (time.monotonic() - self._started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+
+    async def close(self) -> List[Dict]:
+        """Write the last partial chunk; returns all chunks."""
+        if self._buffer:
+            await self._flush()
+        return self.chunks
+
+    async def _flush(self):
+        """Write the buffered data as the next chunk file."""
+        data = bytes(self._buffer)
+        self._buffer = bytearray()
+        name = f"{self.prefix}.{len(self.chunks):05d}{self.suffix}"
+        # Compression is CPU-bound, keep it off the event loop
+        checksum = await asyncio.to_thread(write_chunk, os.path.join(self.out_dir, name), data, self.level)
+        self.chunks.append({"file": name, "bytes": len(data), "sha256": checksum})
+
+
+def read_manifest(backup_dir: str) -> Dict:
+    """Read the manifest of a complete backup."""
+    path = os.path.join(backup_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        raise BackupError(f"{backup_dir} has no {MANIFEST_FILE} (missing or incomplete backup)")
+    with open(path, encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def write_manifest(backup_dir: str, manifest: Dict):
+    """Atomically write the manifest, marking the backup complete."""
+    path = os.path.join(backup_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as stream:
+        json.dump(manifest, stream, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def backup_chain(backup_dir: str) -> List[Tuple[str, Dict]]:
+    """Get (directory, manifest) of a backup and its bases, newest first."""
+    chain = []
+    while backup_dir:
+        manifest = read_manifest(backup_dir)
+        chain.append((backup_dir, manifest))
+        base = manifest.get("base")
+        backup_dir = os.path.normpath(os.path.join(backup_dir, base)) if base else None
+    return chain
+
+
+def table_chunks(backup_dir: str) -> Dict[str, Tuple[List[str], List[Tuple[str, Dict]]]]:
+    """Get the columns and (directory, chunk) list needed to restore each table.
+
+    Incremental tables are followed back through the base backups to
+    their last full copy.
+    """
+    chain = backup_chain(backup_dir)
+    tables = {}
+    for table_name, entry in chain[0][1]["tables"].items():
+        chunks = []
+        for chain_dir, manifest in chain:
+            chain_entry = manifest["tables"].get(table_name)
+            if chain_entry is None:
+                raise BackupError(f"Base backup {chain_dir} has no {table_name} table")
+            chunks[:0] = [(chain_dir, chunk) for chunk in chain_entry["chunks"]]
+            if chain_entry["mode"] == "full":
+                break
+        else:
+            raise BackupError(f"No full backup of {table_name} in the chain of {backup_dir}")
+        tables[table_name] = (entry["columns"], chunks)
+    return tables
+
+
+def verify_backup(backup_dir: str) -> int:
+    """Check the checksums of all chunks needed to restore a backup; returns the chunk count."""
+    chain = backup_chain(backup_dir)
+    if chain[0][1]["dialect"] == "sqlite":
+        chunks = [(backup_dir, chunk) for chunk in chain[0][1]["database"]["chunks"]]
+    else:
+        chunks = [chunk for _, table in table_chunks(backup_dir).values() for chunk in table]
+    for chunk_dir, chunk in chunks:
+        read_chunk(chunk_dir, chunk)
+    return len(chunks)
+
+
+def _qualified(schema: str, table_name: str) -> str:
+    """Get the quoted schema-qualified name of a table."""
+    return f'"{schema}"."{table_name}"'
+
+
+async def append_only_watermark(conn, table_name: str) -> int:
+    """Get the id up to which an append-only table can be backed up.
+
+    Ids are taken before commit, so a row younger than ROLLUP_LAG_SECONDS
+    may still be missing below the highest committed id. Capping at the
+    newest row older than the lag leaves those rows for the next backup
+    instead of skipping them for good.
+    """
+    model, date_column = EXPORT_TABLES[table_name]
+    cutoff = datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+    result = await conn.execute(select(func.coalesce(func.max(model.id), 0)).where(date_column < cutoff))
+    return result.scalar()
+
+
+async def backup_postgres(out_dir: str, base_dir: Optional[str] = None) -> Dict:
+    """Copy all tables from one consistent snapshot into chunk files.
+
+    Append-only tables are copied up to their lagged id watermark (see
+    append_only_watermark); with a base backup, only rows after the base's
+    watermark. Other tables are always copied in full.
+    """
+    tenant = current_tenant.get()
+    schema = tenant or "public"
+    base_tables = read_manifest(base_dir)["tables"] if base_dir else {}
+    tables = {}
+
+    async with db.bind.connect() as conn:
+        # One read-only snapshot for all tables, like pg_dump
+        conn = await conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        async with conn.begin():
+            last_ids = {table_name: await append_only_watermark(conn, table_name) for table_name in APPEND_ONLY_TABLES}
+
+            driver = (await conn.get_raw_connection()).driver_connection
+            for table in Base.metadata.sorted_tables:
+                started_at = time.monotonic()
+                columns = [column.name for column in table.columns]
+                writer = ChunkWriter(out_dir, table.name, ".csv.gz")
+                entry = {"columns": columns, "mode": "full"}
+
+                if table.name in APPEND_ONLY_TABLES:
+                    base = base_tables.get(table.name)
+                    incremental = base is not None and base["columns"] == columns
+                    after_id = base["last_id"] if incremental else 0
+                    entry.update(mode="incremental" if incremental else "full",
+                                 after_id=after_id, last_id=last_ids[table.name])
+                    column_list = ", ".join(f'"{column}"' for column in columns)
+                    await driver.copy_from_query(
+                        f"SELECT {column_list} FROM {_qualified(schema, table.name)} "
+                        f"WHERE id > $1 AND id <= $2 ORDER BY id",
+                        after_id, last_ids[table.name], output=writer.write, format="csv"
+                    )
+                else:
+                    await driver.copy_from_table(
+                        table.name, schema_name=schema, columns=columns, output=writer.write, format="csv"
+                    )
+
+                entry["chunks"] = await writer.close()
+                tables[table.name] = entry
+                size = sum(chunk["bytes"] for chunk in entry["chunks"])
+                print(f"💾 {table.name}: {size / 1024 / 1024:.1f} MB in {len(entry['chunks'])} chunks "
+                      f"({entry['mode']}, {time.monotonic() - started_at:.1f}s)")
+
+    return {"dialect": "postgresql", "tenant": tenant, "tables": tables}
+
+
+def copy_sqlite_database(source_path: str, target_path: str, max_rate: float):
+    """Copy a live SQLite database with the backup API, in rate-limited steps."""
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        page_size = source.execute("PRAGMA page_size").fetchone()[0]
+        sleep = page_size * SQLITE_PAGES_PER_STEP / max_rate if max_rate else 0
+        source.backup(target, pages=SQLITE_PAGES_PER_STEP, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+
+
+async def backup_sqlite(out_dir: str) -> Dict:
+    """Copy the SQLite database file into chunk files."""
+    source_path = db.engine.url.database
+    max_rate = BACKUP_SETTINGS["max_rate_mb"] * 1024 * 1024
+    fd, copy_path = tempfile.mkstemp(prefix="backup_", suffix=".sqlite", dir=out_dir)
+    os.close(fd)
+    try:
+        await asyncio.to_thread(copy_sqlite_database, source_path, copy_path, max_rate)
+        # The copy is already rate limited, so chunks are written at full speed
+        writer = ChunkWriter(out_dir, "database", ".sqlite.gz", max_rate=0)
+        with open(copy_path, "rb") as stream:
+            while True:
+                data = stream.read(writer.chunk_size)
+                if not data:
+                    break
+                await writer.write(data)
+        chunks = await writer.close()
+    finally:
+        os.remove(copy_path)
+
+    print(f"💾 {source_path}: {sum(chunk['bytes'] for chunk in chunks) / 1024 / 1024:.1f} MB in {len(chunks)} chunks")
+    return {"dialect": "sqlite", "tenant": None, "database": {"chunks": chunks}, "tables": {}}
+
+
+async def backup(out_dir: str, base_dir: Optional[str] = None) -> Dict:
+    """Write a full or incremental backup of the current tenant into out_dir."""
+    if os.path.exists(os.path.join(out_dir, MANIFEST_FILE)):
+        raise BackupError(f"{out_dir} already contains a backup")
+    os.makedirs(out_dir, exist_ok=True)
+    if base_dir and read_manifest(base_dir).get("tenant") != current_tenant.get():
+        raise BackupError(f"Base backup {base_dir} belongs to another bot")
+
+    started_at = datetime.utcnow()
+    if db.is_sqlite:
+        manifest = await backup_sqlite(out_dir)
+    else:
+        manifest = await backup_postgres(out_dir, base_dir)
+
+    manifest.update(
+        version=MANIFEST_VERSION,
+        created_at=started_at.isoformat(),
+        base=os.path.relpath(base_dir, out_dir) if base_dir else None,
+    )
+    write_manifest(out_dir, manifest)
+    return manifest
+
+
+async def _load_table(table_name: str, columns: List[str], chunks: List[Tuple[str, Dict]], schema: str):
+    """Stream the chunks of a table into it with one COPY."""
+    async def source():
+        for chunk_dir, chunk in chunks:
+            yield await asyncio.to_thread(read_chunk, chunk_dir, chunk)
+
+    started_at = time.monotonic()
+    async with db.bind.connect() as conn:
+        driver = (await conn.get_raw_connection()).driver_connection
+        await driver.copy_to_table(table_name, source=source(), columns=columns, schema_name=schema, format="csv")
+    print(f"📥 {table_name}: loaded {len(chunks)} chunks in {time.monotonic() - started_at:.1f}s")
+
+
+async def _run_parallel(coroutines: List, jobs: int):
+    """Run coroutines with at most jobs running at a time."""
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def run(coroutine):
+        async with semaphore:
+            await coroutine
+
+    await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+async def _execute(statement: str):
+    """Run one DDL statement in its own transaction."""
+    async with db.bind.begin() as conn:
+        await conn.execute(text(statement))
+
+
+async def restore_postgres(backup_dir: str, jobs: int, clean: bool = False):
+    """Load all tables of a backup concurrently, then rebuild indexes.
+
+    Foreign keys and secondary indexes are dropped before the load and
+    recreated afterwards (also when the load fails), so tables load in any
+    order without per-row index maintenance.
+    """
+    tenant = current_tenant.get()
+    schema = tenant or "public"
+    tables = table_chunks(backup_dir)
+    table_names = list(tables)
+
+    await db.create_tables()
+    async with db.bind.begin() as conn:
+        if clean:
+            await conn.execute(text(
+                f"TRUNCATE {', '.join(_qualified(schema, name) for name in table_names)} RESTART IDENTITY CASCADE"
+            ))
+        else:
+            for table_name in table_names:
+                result = await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {_qualified(schema, table_name)})"))
+                if result.scalar():
+                    raise BackupError(f"Table {table_name} is not empty (use --clean to replace its data)")
+
+        params = {"schema": schema, "tables": table_names}
+        foreign_keys = (await conn.execute(text(FOREIGN_KEYS_SQL), params)).all()
+        indexes = (await conn.execute(text(SECONDARY_INDEXES_SQL), params)).all()
+        for table_name, name, definition in foreign_keys:
+            logger.info(f"Dropping {table_name}.{name} for restore: {definition}")
+            await conn.execute(text(f'ALTER TABLE {_qualified(schema, table_name)} DROP CONSTRAINT "{name}"'))
+        for _, name, definition in indexes:
+            logger.info(f"Dropping index {name} for restore: {definition}")
+            await conn.execute(text(f'DROP INDEX "{schema}"."{name}"'))
+
+    try:
+        # Largest tables first, so the slowest load starts right away
+        order = sorted(table_names, key=lambda name: -sum(chunk["bytes"] for _, chunk in tables[name][1]))
+        await _run_parallel([_load_table(name, *tables[name], schema) for name in order], jobs)
+    finally:
+        started_at = time.monotonic()
+        await _run_parallel([_execute(definition) for _, _, definition in indexes], jobs)
+        for table_name, name, definition in foreign_keys:
+            await _execute(f'ALTER TABLE {_qualified(schema, table_name)} ADD CONSTRAINT "{name}" {definition}')
+        print(f"🔧 Rebuilt {len(indexes)} indexes and {len(foreign_keys)} foreign keys "
+              f"in {time.monotonic() - started_at:.1f}s")
+
+    async with db.bind.begin() as conn:
+        for table_name in table_names:
+            qualified = _qualified(schema, table_name)
+            # Ids keep counting from the restored rows
+            await conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{qualified}', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                f"FROM {qualified}"
+            ))
+    for table_name in table_names:
+        await _execute(f"ANALYZE {_qualified(schema, table_name)}")
+
+
+def restore_sqlite(backup_dir: str, clean: bool = False):
+    """Reassemble the SQLite database file of a backup (the bot must be stopped)."""
+    manifest = read_manifest(backup_dir)
+    target_path = db.engine.url.database
+    if os.path.exists(target_path) and not clean:
+        raise BackupError(f"{target_path} exists (use --clean to replace it)")
+
+    with open(f"{target_path}.restore", "wb") as stream:
+        for chunk in manifest["database"]["chunks"]:
+            stream.write(read_chunk(backup_dir, chunk))
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(f"{target_path}{suffix}"):
+            os.remove(f"{target_path}{suffix}")
+    os.replace(f"{target_path}.restore", target_path)
+
+
+async def restore(backup_dir: str, jobs: int = BACKUP_SETTINGS["jobs"], clean: bool = False):
+    """Restore a backup (and its base backups) into the current tenant."""
+    manifest = read_manifest(backup_dir)
+    dialect = "sqlite" if db.is_sqlite else "postgresql"
+    if manifest["dialect"] != dialect:
+        raise BackupError(f"Cannot restore a {manifest['dialect']} backup into {dialect}")
+
+    # Fail before touching the database if any chunk is missing or corrupt
+    chunk_count = await asyncio.to_thread(verify_backup, backup_dir)
+    print(f"✅ Verified {chunk_count} chunks")
+
+    if db.is_sqlite:
+        await asyncio.to_thread(restore_sqlite, backup_dir, clean)
+    else:
+        await restore_postgres(backup_dir, jobs, clean)
+
+
+async def main():
+    """Main backup function."""
+    parser = argparse.ArgumentParser(description="Online backup and restore of bot data.")
+    parser.add_argument("--bot-id", type=int, help="Use the schema of a white-label bot (Postgres only)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="Write a backup into a new directory")
+    backup_parser.add_argument("dir", help="Backup directory")
+    backup_parser.add_argument("--base", help="Previous backup; append-only tables only copy newer rows")
+
+    verify_parser = commands.add_parser("verify", help="Check the checksums of a backup and its bases")
+    verify_parser.add_argument("dir", help="Backup directory")
+
+    restore_parser = commands.add_parser("restore", help="Restore a backup and its bases")
+    restore_parser.add_argument("dir", help="Backup directory")
+    restore_parser.add_argument("--jobs", type=int, default=BACKUP_SETTINGS["jobs"],
+                                help="Tables loaded in parallel")
+    restore_parser.add_argument("--clean", action="store_true", help="Replace existing data")
+    args = parser.parse_args()
+
+    if args.bot_id and db.is_sqlite:
+        parser.error("--bot-id requires PostgreSQL")
+    if args.command == "backup" and args.base and db.is_sqlite:
+        parser.error("--base requires PostgreSQL (SQLite backups are always full)")
+    tenant = tenant_schema(args.bot_id) if args.bot_id else None
+
+    started_at = time.monotonic()
+    try:
+        with use_tenant(tenant):
+            if args.command == "backup":
+                if hasattr(os, "nice"):
+                    os.nice(BACKUP_NICE)
+                manifest = await backup(args.dir, args.base)
+                kind = "incremental" if manifest["base"] else "full"
+                print(f"✅ Wrote {kind} backup to {args.dir} in {time.monotonic() - started_at:.1f}s")
+            elif args.command == "verify":
+                chunk_count = await asyncio.to_thread(verify_backup, args.dir)
+                print(f"✅ {args.dir}: {chunk_count} chunks verified")
+            else:
+                await restore(args.dir, args.jobs, args.clean)
+                print(f"✅ Restored {args.dir} in {time.monotonic() - started_at:.1f}s")
+    except BackupError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        logger.error(f"❌ Backup command failed: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
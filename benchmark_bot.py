@@ -0,0 +1,313 @@
+"""
+Micro-benchmark suite for hot paths of the bot.
+Measures latency and peak allocations of database operations, helpers and
+keyboard builders, and compares them against the baseline stored in
+benchmark_baseline.json. Exits with a non-zero status on regressions.
+
+Run it against a local database only: it creates a benchmark user and
+writes benchmark transactions, which are removed afterwards.
+
+Usage:
+    python benchmark_bot.py                     # compare against the baseline
+    python benchmark_bot.py --update-baseline   # store current results
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import delete
+from database.db import db
+from database.models import User, Transaction, WithdrawRequest
+from utils import helpers, keyboards
+from utils.logger import logger
+
+BASELINE_PATH = Path(__file__).with_name("benchmark_baseline.json")
+
+BENCH_USER_ID = 990000001
+BENCH_TRANSACTIONS = 50
+
+# A benchmark regresses when it is this many times slower (or allocates this
+# many times more) than its baseline and the absolute difference is above
+# the noise floor.
+LATENCY_THRESHOLD = 1.5
+ALLOCATION_THRESHOLD = 1.2
+LATENCY_NOISE_US = 2.0
+ALLOCATION_NOISE_BYTES = 256
+
+BENCHMARKS = []
+
+
+def benchmark(group: str, iterations: int):
+    """Register a benchmark function."""
+    def decorator(func):
+        BENCHMARKS.append((group, func.__name__.replace("bench_", ""), func, iterations))
+        return func
+    return decorator
+
+
+def _sample_user() -> User:
+    """Build a transient user for formatter benchmarks."""
+    return User(
+        user_id=BENCH_USER_ID, username="bench_user", first_name="Bench",
+        balance=12345.67, total_earned=23456.78, referral_count=12,
+        join_date=datetime(2024, 1, 1, 12, 0, 0), daily_rolls_count=3
+    )
+
+
+def _sample_transaction() -> Transaction:
+    """Build a transient transaction for formatter benchmarks."""
+    return Transaction(
+        id=1, user_id=BENCH_USER_ID, transaction_type="game", amount=60.0,
+        description="Dice roll: 6", created_at=datetime(2024, 1, 1, 12, 0, 0)
+    )
+
+
+def _sample_withdrawal() -> WithdrawRequest:
+    """Build a transient withdrawal request for formatter benchmarks."""
+    return WithdrawRequest(
+        id=1, user_id=BENCH_USER_ID, amount=1500.0, status="pending",
+        created_at=datetime(2024, 1, 1, 12, 0, 0)
+    )
+
+
+SAMPLE_USER = _sample_user()
+SAMPLE_TRANSACTION = _sample_transaction()
+SAMPLE_WITHDRAWAL = _sample_withdrawal()
+
+
+# Database benchmarks
+
+@benchmark("database", 200)
+async def bench_get_user():
+    await db.get_user(BENCH_USER_ID)
+
+
+@benchmark("database", 200)
+async def bench_get_user_snapshot():
+    await db.get_user_snapshot(BENCH_USER_ID)
+
+
+@benchmark("database", 100)
+async def bench_update_user_balance():
+    await db.update_user_balance(BENCH_USER_ID, 0.0, "benchmark", "Benchmark")
+
+
+@benchmark("database", 200)
+async def bench_get_config():
+    await db.get_config("currency_symbol", "₦")
+
+
+@benchmark("database", 200)
+async def bench_get_user_transactions():
+    await db.get_user_transactions(BENCH_USER_ID, 10)
+
+
+# Helper benchmarks
+
+@benchmark("python", 20000)
+def bench_format_currency():
+    helpers.format_currency(12345.678, "₦")
+
+
+@benchmark("python", 20000)
+def bench_format_datetime():
+    helpers.format_datetime(SAMPLE_TRANSACTION.created_at)
+
+
+@benchmark("python", 10000)
+def bench_format_user_profile():
+    helpers.format_user_profile(SAMPLE_USER)
+
+
+@benchmark("python", 10000)
+def bench_format_transaction():
+    helpers.format_transaction(SAMPLE_TRANSACTION, "₦")
+
+
+@benchmark("python", 10000)
+def bench_format_withdrawal_request():
+    helpers.format_withdrawal_request(SAMPLE_WITHDRAWAL)
+
+
+@benchmark("python", 10000)
+def bench_can_roll_dice():
+    helpers.can_roll_dice(SAMPLE_USER, 300)
+
+
+# Keyboard benchmarks
+
+@benchmark("python", 2000)
+def bench_get_main_keyboard():
+    keyboards.get_main_keyboard()
+
+
+@benchmark("python", 2000)
+def bench_get_admin_keyboard():
+    keyboards.get_admin_keyboard()
+
+
+@benchmark("python", 2000)
+def bench_get_dice_keyboard():
+    keyboards.get_dice_keyboard()
+
+
+@benchmark("python", 2000)
+def bench_get_admin_panel_keyboard():
+    keyboards.get_admin_panel_keyboard()
+
+
+@benchmark("python", 2000)
+def bench_get_settings_keyboard():
+    keyboards.get_settings_keyboard()
+
+
+@benchmark("python", 2000)
+def bench_get_transactions_keyboard():
+    keyboards.get_transactions_keyboard("1704110400000000_10", "1704110400000000_20")
+
+
+async def _call(func):
+    """Call a sync or async benchmark function."""
+    result = func()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def measure(func, iterations: int, repeat: int = 5) -> dict:
+    """Measure median latency and peak allocation of one call."""
+    # Warm up caches, pools and lazy imports
+    for _ in range(min(iterations, 20)):
+        await _call(func)
+
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            await _call(func)
+        timings.append((time.perf_counter() - started_at) / iterations * 1e6)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(min(iterations, 50)):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            await _call(func)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - current)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_us": round(statistics.median(timings), 3),
+        "peak_alloc_bytes": int(statistics.median(peaks)),
+    }
+
+
+async def setup_database():
+    """Create the benchmark user and its transaction history."""
+    await db.create_tables()
+    await db.init_default_config()
+    await cleanup_database()
+    await db.create_user(BENCH_USER_ID, username="bench_user", first_name="Bench")
+    for _ in range(BENCH_TRANSACTIONS):
+        await db.update_user_balance(BENCH_USER_ID, 10.0, "benchmark", "Benchmark")
+
+
+async def cleanup_database():
+    """Remove the benchmark user and its transactions."""
+    async with db.session_factory() as session:
+        await session.execute(delete(Transaction).where(Transaction.user_id == BENCH_USER_ID))
+        await session.execute(delete(User).where(User.user_id == BENCH_USER_ID))
+        await session.commit()
+
+
+async def run_benchmarks(groups) -> dict:
+    """Run all benchmarks of the selected groups."""
+    backend = db.engine.dialect.name
+    results = {}
+
+    if "database" in groups:
+        await setup_database()
+
+    try:
+        for group, name, func, iterations in BENCHMARKS:
+            if group not in groups:
+                continue
+            key = backend if group == "database" else group
+            results.setdefault(key, {})[name] = await measure(func, iterations)
+            print(f"⏱️ {key}.{name}: {results[key][name]['median_us']:.1f}µs, "
+                  f"{results[key][name]['peak_alloc_bytes']} B peak")
+    finally:
+        if "database" in groups:
+            await cleanup_database()
+
+    return results
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Compare results against the baseline and return regressions."""
+    regressions = []
+    for key, benchmarks in results.items():
+        for name, current in benchmarks.items():
+            base = baseline.get(key, {}).get(name)
+            if not base:
+                print(f"🆕 {key}.{name}: no baseline")
+                continue
+
+            latency_delta = current["median_us"] - base["median_us"]
+            if (current["median_us"] > base["median_us"] * LATENCY_THRESHOLD
+                    and latency_delta > LATENCY_NOISE_US):
+                regressions.append(
+                    f"{key}.{name}: latency {base['median_us']:.1f}µs → {current['median_us']:.1f}µs"
+                )
+
+            allocation_delta = current["peak_alloc_bytes"] - base["peak_alloc_bytes"]
+            if (current["peak_alloc_bytes"] > base["peak_alloc_bytes"] * ALLOCATION_THRESHOLD
+                    and allocation_delta > ALLOCATION_NOISE_BYTES):
+                regressions.append(
+                    f"{key}.{name}: allocations {base['peak_alloc_bytes']} B → {current['peak_alloc_bytes']} B"
+                )
+    return regressions
+
+
+async def main():
+    """Main benchmark function."""
+    parser = argparse.ArgumentParser(description="Run micro-benchmarks and check for regressions.")
+    parser.add_argument("--update-baseline", action="store_true", help="Store current results as the baseline")
+    parser.add_argument("--skip-database", action="store_true", help="Only run helper and keyboard benchmarks")
+    args = parser.parse_args()
+
+    groups = {"python"} if args.skip_database else {"python", "database"}
+    results = await run_benchmarks(groups)
+
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+
+    if args.update_baseline:
+        for key, benchmarks in results.items():
+            baseline.setdefault(key, {}).update(benchmarks)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"✅ Baseline updated: {BASELINE_PATH.name}")
+        return True
+
+    regressions = compare(results, baseline)
+    for regression in regressions:
+        print(f"❌ {regression}")
+        logger.warning(f"Benchmark regression: {regression}")
+
+    if regressions:
+        print("❌ Performance regressions detected!")
+        return False
+    print("✅ No performance regressions!")
+    return True
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    sys.exit(0 if success else 1)
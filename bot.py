@@ -3,12 +3,21 @@ Main bot file for the Telegram bot.
 """
 import asyncio
 import logging
+from typing import Awaitable, Callable, Optional
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN, ADMIN_ID
+from config import BOT_TOKEN, BOT_TOKENS, ADMIN_ID, JOB_INTERVALS
 from database.db import db
+from database.tracer import query_tracer
+from database.tenancy import tenant_schema, use_tenant
 from handlers import register_user_handlers, register_admin_handlers, register_game_handlers, register_withdrawal_handlers
+from utils.helpers import format_ledger_alert
 from utils.logger import logger
+from utils.middlewares import callback_coalescer, degraded_mode, tenant_middleware
+from utils.reminders import reminder_scheduler
+from utils.routing import routes
+from utils.tasks import start_background, start_periodic, stop_background_tasks
 
 # Configure logging
 logging.basicConfig(
@@ -16,45 +25,140 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-# Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
+# Initialize bots and dispatcher; all bots share one HTTP session
+session = AiohttpSession()
+bot = Bot(token=BOT_TOKEN, session=session)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
-# Register handlers
+# (bot, tenant schema) pairs served by this process; the main bot uses the default schema
+tenants = [(bot, None)]
+for token in BOT_TOKENS:
+    white_label_bot = Bot(token=token, session=session)
+    tenants.append((white_label_bot, tenant_schema(white_label_bot.id)))
+
+# Register middlewares
+for tenant_bot, tenant in tenants:
+    tenant_middleware.register(tenant_bot.id, tenant)
+dp.update.outer_middleware(tenant_middleware)
+dp.callback_query.outer_middleware(callback_coalescer)
+# Degraded mode answers first, so it also covers failures in the tracer
+dp.message.middleware(degraded_mode)
+dp.callback_query.middleware(degraded_mode)
+dp.message.middleware(query_tracer)
+dp.callback_query.middleware(query_tracer)
+
+# Register handlers; the compiled routing table is checked before the routers
+dp.include_router(routes.router)
 register_user_handlers(dp)
 register_admin_handlers(dp)
 register_game_handlers(dp)
 register_withdrawal_handlers(dp)
+routes.check()
+
+
+async def run_for_tenants(job: str, run: Callable[[Optional[str]], Awaitable[None]]):
+    """Run a background job for every tenant.
+    
+    A tenant whose run fails is logged and skipped, so the tenants after
+    it still run. Stops early when the database circuit opens.
+    """
+    for _, tenant in tenants:
+        if db.circuit.is_open:
+            return
+        with use_tenant(tenant):
+            try:
+                await run(tenant)
+            except Exception as e:
+                logger.error(f"Job {job} failed for {tenant or 'default schema'}: {e!r}")
+
+
+async def refresh_rollups():
+    """Refresh activity rollups of every tenant."""
+    async def run(tenant: Optional[str]):
+        await db.refresh_rollups()
+    
+    await run_for_tenants("rollups", run)
+
+
+async def compact_game_history():
+    """Fold old game history of every tenant into daily aggregates."""
+    async def run(tenant: Optional[str]):
+        folded = await db.compact_game_history()
+        if folded:
+            logger.info(f"Folded {folded} game history rows into daily aggregates ({tenant or 'default schema'})")
+    
+    await run_for_tenants("game_history", run)
+
+
+async def reconcile_ledger():
+    """Reconcile balances with the transaction ledger and alert the admin.
+    
+    Alerts of every tenant go to ADMIN_ID through the main bot, labelled
+    with the tenant schema: the admin may never have started a white-label bot.
+    """
+    async def run(tenant: Optional[str]):
+        mismatches = await db.reconcile_ledger()
+        if mismatches and ADMIN_ID:
+            currency_symbol = await db.get_config("currency_symbol", "₦")
+            await bot.send_message(ADMIN_ID, format_ledger_alert(mismatches, currency_symbol, tenant), parse_mode="HTML")
+    
+    await run_for_tenants("ledger", run)
 
 
 async def on_startup():
     """Bot startup handler."""
     logger.info("Starting bot...")
     
-    # Create database tables
-    await db.create_tables()
-    logger.info("Database tables created/verified")
+    if len(tenants) > 1 and db.is_sqlite:
+        raise RuntimeError("BOT_TOKENS requires PostgreSQL")
+    
+    for tenant_bot, tenant in tenants:
+        with use_tenant(tenant):
+            # Create database tables
+            await db.create_tables()
+            logger.info(f"Database tables created/verified ({tenant or 'default schema'})")
+            
+            # Initialize default configuration
+            await db.init_default_config()
+            logger.info(f"Default configuration initialized ({tenant or 'default schema'})")
+            
+            # Load cooldowns for database-free "too soon" answers
+            indexed = await db.load_eligibility_index()
+            logger.info(f"Eligibility index loaded with {indexed} users ({tenant or 'default schema'})")
+            
+            # Schedule reminders of opted-in users
+            reminder_users = await reminder_scheduler.rebuild(tenant_bot)
+            logger.info(f"Reminders scheduled for {reminder_users} users ({tenant or 'default schema'})")
+    
+    # Receive cache invalidations from other bot processes
+    if not db.is_sqlite:
+        start_background(db.events.listen(db.engine.url), "events")
     
-    # Initialize default configuration
-    await db.init_default_config()
-    logger.info("Default configuration initialized")
+    # Start background jobs
+    start_periodic(refresh_rollups, JOB_INTERVALS["rollups"], "rollups")
+    start_periodic(reconcile_ledger, JOB_INTERVALS["ledger"], "ledger")
+    start_periodic(compact_game_history, JOB_INTERVALS["game_history"], "game_history")
+    start_periodic(reminder_scheduler.send_due, reminder_scheduler.wheel.tick, "reminders")
     
     # Set bot commands
     from aiogram.types import BotCommand
     commands = [
         BotCommand(command="start", description="Start the bot"),
         BotCommand(command="help", description="Show help information"),
+        BotCommand(command="reminders", description="Turn bonus reminders on or off"),
     ]
-    await bot.set_my_commands(commands)
+    for tenant_bot, _ in tenants:
+        await tenant_bot.set_my_commands(commands)
     
-    logger.info("Bot started successfully!")
+    logger.info(f"Bot started successfully! Serving {len(tenants)} bot(s)")
 
 
 async def on_shutdown():
     """Bot shutdown handler."""
     logger.info("Shutting down bot...")
-    await bot.session.close()
+    await stop_background_tasks()
+    await session.close()
     logger.info("Bot shutdown complete")
 
 
@@ -66,7 +170,7 @@ async def main():
         dp.shutdown.register(on_shutdown)
         
         # Start polling
-        await dp.start_polling(bot)
+        await dp.start_polling(*(tenant_bot for tenant_bot, _ in tenants))
         
     except Exception as e:
         logger.error(f"Bot error: {e}")
@@ -13,6 +13,10 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN environment variable is required")
 
+# Extra white-label bot tokens served by the same process (comma separated).
+# Each of these bots keeps its data in its own PostgreSQL schema.
+BOT_TOKENS = [token.strip() for token in os.getenv("BOT_TOKENS", "").split(",") if token.strip()]
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
@@ -38,6 +42,79 @@ RATE_LIMIT = {
     "withdrawal": 3600,  # 1 hour
 }
 
+# In-memory caches (TTL in seconds). Entries are invalidated through the
+# database event bus, so the TTL only bounds staleness of missed events.
+# SQLite has no cross-process events: writes of other processes
+# (import_users.py, restores, manual edits) only show once entries expire
+# after sqlite_ttl, which replaces the other TTLs there.
+CACHE_SETTINGS = {
+    "user_max_size": 100000,
+    "user_ttl": 3600,
+    "config_ttl": 3600,
+    "summary_max_size": 10000,  # Users whose transaction totals and game stats are cached
+    "sqlite_ttl": 30,
+}
+
+# Background job intervals (seconds)
+JOB_INTERVALS = {
+    "rollups": 60,
+    "ledger": 300,
+    "game_history": 3600,
+}
+
+# Withdrawal work queue
+WITHDRAWAL_QUEUE = {
+    "claim_size": 5,  # Requests claimed per batch
+    "lease_seconds": 900,  # Claimed requests return to the queue after this
+}
+
+# Ledger reconciliation
+LEDGER_SETTINGS = {
+    "batch_size": 5000,  # New transactions checked per batch
+    "sweep_size": 1000,  # Users re-checked per run even without new transactions
+    "tolerance": 0.01,  # Largest balance difference treated as rounding
+}
+
+# Query budgets: statements a handler may run per update before it is
+# reported. Mode "raise" fails the update instead of logging (for development
+# and CI); per-handler limits go in "handlers", e.g. {"stats_callback": 12}.
+QUERY_BUDGET = {
+    "default": 10,
+    "mode": os.getenv("QUERY_BUDGET_MODE", "log"),
+    "handlers": {},
+}
+
+# Opt-in "bonus ready" reminders
+REMINDER_SETTINGS = {
+    "tick": 1,  # Timing wheel resolution (seconds)
+    "rate": 20,  # Reminders sent per second, across all bots
+    "batch_size": 500,  # Due users re-checked per query before sending
+}
+
+# Database circuit breaker: per-operation timeouts (seconds), consecutive
+# failures before the bot switches to degraded mode, and seconds between
+# recovery probes while degraded
+CIRCUIT_SETTINGS = {
+    "timeouts": {"read": 2.0, "write": 5.0},
+    "failure_threshold": 5,
+    "probe_interval": 5.0,
+}
+
+# Game history downsampling: rows older than raw_days are folded into
+# per-user daily aggregates (game_history_daily) and deleted
+GAME_HISTORY_SETTINGS = {
+    "raw_days": 30,  # Days of per-roll history kept
+    "batch_size": 5000,  # Rows folded per transaction
+}
+
+# Online backups (backup.py)
+BACKUP_SETTINGS = {
+    "chunk_mb": 64,  # Uncompressed data per backup file
+    "compression_level": 6,  # gzip level
+    "max_rate_mb": 20,  # Read rate limit in MB/s (0 for unlimited)
+    "jobs": 4,  # Tables restored in parallel
+}
+
 # Game rewards
 DICE_REWARDS = {
     1: 10,
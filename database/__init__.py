@@ -2,6 +2,12 @@
 Database package initialization.
 """
 from .db import Database
-from .models import User, Transaction, GameHistory, WithdrawRequest, Config
+from .models import (
+    User, Transaction, GameHistory, GameHistoryDaily, WithdrawRequest, Config,
+    Watermark, ActivityRollup, DailyActiveUser, LedgerCheckpoint
+)
 
-__all__ = ["Database", "User", "Transaction", "GameHistory", "WithdrawRequest", "Config"]
\ No newline at end of file
+__all__ = [
+    "Database", "User", "Transaction", "GameHistory", "GameHistoryDaily", "WithdrawRequest",
+    "Config", "Watermark", "ActivityRollup", "DailyActiveUser", "LedgerCheckpoint"
+]
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Circuit breaker and per-operation timeouts for database calls.
+"""
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from config import CIRCUIT_SETTINGS
+from utils.logger import logger
+from utils.tasks import start_background
+
+# Timeout of the guarded write running in this task, applied by write_deadline()
+_write_timeout: ContextVar[Optional[float]] = ContextVar("write_timeout", default=None)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when a database operation timed out, failed to connect or was rejected by the open circuit."""
+
+    def __init__(self, operation: str, kind: str, reason: str):
+        super().__init__(f"{operation} ({kind}): {reason}")
+        self.operation = operation
+        self.kind = kind  # read, write
+        self.reason = reason  # timeout, error, circuit_open
+
+    @property
+    def outcome_unknown(self) -> bool:
+        """Check whether the failed operation is a write that may still have been applied."""
+        return self.kind == "write" and self.reason != "circuit_open"
+
+
+def is_outage(error: BaseException) -> bool:
+    """Check whether an error means the database is unreachable or failing (not a bad statement)."""
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError, OSError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class CircuitBreaker:
+    """Bound the time spent waiting for the database and stop calling it while it fails.
+
+    Every guarded call runs with the timeout of its kind (read or write).
+    Writes are only timed from the moment they hold a session until COMMIT
+    (see write_deadline), so neither the SQLite writer queue nor a slow
+    commit counts against them.
+    After ``failure_threshold`` consecutive timeouts or connection errors the
+    circuit opens: calls fail at once with DatabaseUnavailable instead of
+    queueing behind a database that does not answer. While open, a probe
+    (``SELECT 1``) runs every ``probe_interval`` seconds and the first
+    successful probe closes the circuit again.
+    """
+
+    def __init__(self, probe: Callable[[], Awaitable[Any]], settings: Dict[str, Any] = CIRCUIT_SETTINGS):
+        self.probe = probe
+        self.timeouts: Dict[str, float] = dict(settings["timeouts"])
+        self.failure_threshold = settings["failure_threshold"]
+        self.probe_interval = settings["probe_interval"]
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.stats = {"timeouts": 0, "errors": 0, "rejected": 0, "trips": 0}
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        """Check whether calls are currently rejected."""
+        return self.opened_at is not None
+
+    async def call(self, operation: str, kind: str, run: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a database operation through the breaker."""
+        if self.is_open:
+            self.stats["rejected"] += 1
+            raise DatabaseUnavailable(operation, kind, "circuit_open")
+
+        try:
+            if kind == "write":
+                token = _write_timeout.set(self.timeouts[kind])
+                try:
+                    result = await run()
+                finally:
+                    _write_timeout.reset(token)
+            else:
+                result = await asyncio.wait_for(run(), self.timeouts[kind])
+        except DatabaseUnavailable:
+            # Raised by a nested guarded call, which already counted it
+            raise
+        except asyncio.TimeoutError as e:
+            self.stats["timeouts"] += 1
+            self._record_failure(operation)
+            raise DatabaseUnavailable(operation, kind, "timeout") from e
+        except Exception as e:
+            if not is_outage(e):
+                # The database answered; the statement itself failed
+                self.failures = 0
+                raise
+            self.stats["errors"] += 1
+            self._record_failure(operation)
+            raise DatabaseUnavailable(operation, kind, "error") from e
+
+        self.failures = 0
+        return result
+
+    def _record_failure(self, operation: str):
+        """Count a failure and open the circuit at the threshold."""
+        self.failures += 1
+        if self.failures >= self.failure_threshold and not self.is_open:
+            self.opened_at = time.monotonic()
+            self.stats["trips"] += 1
+            logger.error(f"Database circuit opened after {self.failures} failures (last: {operation}); "
+                         f"serving degraded mode")
+            if self._probe_task is None or self._probe_task.done():
+                self._probe_task = start_background(self._probe_until_closed(), "database_probe")
+
+    async def _probe_until_closed(self):
+        """Probe the database until it answers, then close the circuit."""
+        while self.is_open:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await asyncio.wait_for(self.probe(), self.timeouts["read"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Database probe failed: {e!r}")
+                continue
+            logger.info(f"Database circuit closed after {time.monotonic() - self.opened_at:.1f}s")
+            self.opened_at = None
+            self.failures = 0
+
+
+@asynccontextmanager
+async def write_deadline(session):
+    """Cancel a guarded write that has not reached COMMIT within its timeout.
+
+    The deadline is disarmed when the session starts committing: cancelling
+    then would leave the outcome unknown to the caller. Outside guarded
+    writes (background jobs) this does nothing.
+    """
+    timeout = _write_timeout.get()
+    if timeout is None:
+        yield
+        return
+
+    task = asyncio.current_task()
+    expired = False
+
+    def expire():
+        nonlocal expired
+        expired = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_later(timeout, expire)
+
+    def disarm(_session):
+        handle.cancel()
+
+    event.listen(session.sync_session, "before_commit", disarm)
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not expired:
+            raise
+        if hasattr(task, "uncancel"):
+            task.uncancel()
+        raise asyncio.TimeoutError() from None
+    finally:
+        handle.cancel()
+        event.remove(session.sync_session, "before_commit", disarm)
+
+
+def guarded(kind: str):
+    """Run a Database method through its circuit breaker with the timeout of kind."""
+    def decorator(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            return await self.circuit.call(method.__name__, kind, lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -2,19 +2,103 @@
 Database connection and session management.
 """
 import asyncio
-from typing import AsyncGenerator
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncGenerator, Dict, List, NamedTuple, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from config import DATABASE_URL, DEFAULT_CONFIG
-from .models import Base, User, Config
+from config import (
+    DATABASE_URL, DEFAULT_CONFIG, CACHE_SETTINGS, LEDGER_SETTINGS, WITHDRAWAL_QUEUE, GAME_HISTORY_SETTINGS
+)
+from utils.helpers import can_roll_dice, can_claim_daily_bonus, get_daily_rolls
+from utils.logger import logger
+from .events import EventBus, ConfigChanged, UserUpdated, WithdrawalChanged, EVENT_CHANNEL
+from .circuit import CircuitBreaker, DatabaseUnavailable, guarded, write_deadline
+from .eligibility import EligibilityIndex
+from .tenancy import current_tenant
+from .models import (
+    Base, User, Transaction, GameHistory, GameHistoryDaily, WithdrawRequest, Config,
+    Watermark, ActivityRollup, DailyActiveUser, LedgerCheckpoint
+)
+
+# Tables that can be exported, with the column used for date ranges
+EXPORT_TABLES = {
+    "transactions": (Transaction, Transaction.created_at),
+    "game_history": (GameHistory, GameHistory.played_at),
+    "withdraw_requests": (WithdrawRequest, WithdrawRequest.created_at),
+    "users": (User, User.join_date),
+}
+
+# Watermark of the Parquet export (export_parquet.py) of a table; game history
+# compaction does not fold rows the export has not written yet
+EXPORT_WATERMARK = "export_{table}"
+
+# Rollup granularities and how far back trends are kept in view
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+# Rows younger than this are left for the next rollup run, so rows that
+# commit slightly out of id order are not skipped by the watermark
+ROLLUP_LAG_SECONDS = 30
+
+# Days of daily_active_users kept before the current one. The rows only tell
+# first sightings of a user per day apart; the counts live in activity_rollups
+ACTIVE_USER_DAYS = 1
+
+# Columns added to existing tables after their first release, created on
+# startup when missing (create_all only creates missing tables); missing
+# indexes of these tables are created as well
+ADDED_COLUMNS = {
+    "withdraw_requests": ["claimed_by", "lease_expires_at"],
+    "users": ["reminders_enabled"],
+    "game_history": [],
+    "transactions": [],  # ix_transactions_created_at, ix_transactions_user_created_id
+}
+
+# Dice value distribution columns of game_history_daily
+DICE_COLUMNS = [f"dice_{value}" for value in range(1, 7)]
+
+# SQLite connection settings: WAL lets readers run alongside the single
+# writer, NORMAL sync is durable across application crashes in WAL mode
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+    "cache_size": -64000,  # 64 MB
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,  # 256 MB
+}
+
+
+def get_database_url(url: str) -> str:
+    """Get SQLAlchemy async driver URL for DATABASE_URL."""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url.replace("postgresql://", "postgresql+asyncpg://")
+
 
 # Create async engine
 engine = create_async_engine(
-    DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
+    get_database_url(DATABASE_URL),
     echo=False,
     future=True
 )
 
+IS_SQLITE = engine.dialect.name == "sqlite"
+
+if IS_SQLITE:
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Apply SQLite pragmas to every new connection."""
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
 # Create async session factory
 async_session = async_sessionmaker(
     engine, 
@@ -23,17 +107,287 @@ async_session = async_sessionmaker(
 )
 
 
+class WithdrawalError(Exception):
+    """Raised when a withdrawal request cannot be created."""
+    
+    def __init__(self, reason: str, balance: float = 0.0, minimum: float = 0.0):
+        super().__init__(reason)
+        self.reason = reason  # user_not_found, invalid_amount, below_minimum, insufficient_balance
+        self.balance = balance
+        self.minimum = minimum
+
+
+class UserSnapshot(NamedTuple):
+    """Compact read-only copy of a user row for display screens."""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    balance: float
+    total_earned: float
+    referral_count: int
+    join_date: Optional[datetime]
+    last_dice_roll: Optional[datetime]
+    last_daily_bonus: Optional[datetime]
+    daily_rolls_count: int
+    
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        """Create snapshot from a User row."""
+        return cls(
+            user.user_id, user.username, user.first_name,
+            user.balance or 0.0, user.total_earned or 0.0, user.referral_count or 0,
+            user.join_date, user.last_dice_roll, user.last_daily_bonus,
+            user.daily_rolls_count or 0
+        )
+
+
+class UserCache:
+    """Bounded LRU cache of user snapshots with a TTL.
+    
+    Entries are refreshed by the database write paths (write-through) and
+    dropped on UserUpdated events from other processes, so the TTL only
+    bounds staleness when events are missed. Entries are keyed by tenant
+    and user_id, so all bots of a process share one cache.
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Bumped on every invalidation, so reads that started before one
+        # do not store a stale snapshot
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        """Get cached snapshot, or None if missing or expired."""
+        key = (current_tenant.get(), user_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            # Expired entries stay until evicted, for get_stale
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def get_stale(self, user_id: int) -> Optional[UserSnapshot]:
+        """Get cached snapshot even if expired (degraded mode), or None if missing."""
+        entry = self._entries.get((current_tenant.get(), user_id))
+        return entry[1] if entry else None
+    
+    def put(self, snapshot: UserSnapshot, generation: Optional[int] = None):
+        """Store snapshot, evicting the least recently used entries.
+        
+        If generation is given, the snapshot is only stored when nothing
+        was invalidated since that generation was read.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        key = (current_tenant.get(), snapshot.user_id)
+        self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, user_id: int):
+        """Drop cached snapshot of a user."""
+        self.generation += 1
+        self._entries.pop((current_tenant.get(), user_id), None)
+    
+    def clear(self):
+        """Drop all cached snapshots."""
+        self.generation += 1
+        self._entries.clear()
+    
+    def on_user_updated(self, event: UserUpdated):
+        """Drop snapshots changed by another process."""
+        if event.user_id is None:
+            self.clear()
+        else:
+            self.invalidate(event.user_id)
+    
+    def stats(self) -> Dict[str, float]:
+        """Get cache metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class UserTotalsCache:
+    """Bounded LRU cache of per-user aggregates (transaction totals, game stats).
+    
+    The aggregates only change when the user's rows change, and those
+    writes publish UserUpdated, which drops the entry in every process.
+    Entries are keyed by tenant and user_id, like UserCache, and only
+    expire when a ttl is given.
+    """
+    
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Bumped on every invalidation, so reads that started before one
+        # do not store stale totals
+        self.generation = 0
+    
+    def get(self, user_id: int) -> Optional[Any]:
+        """Get cached totals, or None if missing or expired."""
+        key = (current_tenant.get(), user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def put(self, user_id: int, value: Any, generation: int):
+        """Store totals read at generation, evicting the least recently used entries."""
+        if generation != self.generation:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[(current_tenant.get(), user_id)] = (expires_at, value)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all cached totals."""
+        self.generation += 1
+        self._entries.clear()
+    
+    def on_user_updated(self, event: UserUpdated):
+        """Drop totals of users changed by any process."""
+        self.generation += 1
+        if event.user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop((current_tenant.get(), event.user_id), None)
+
+
 class Database:
     """Database manager class."""
     
     def __init__(self):
         self.engine = engine
-        self.session_factory = async_session
+        self.is_sqlite = IS_SQLITE
+        # Engines of tenant schemas; they share the pool of the main engine
+        self._tenant_engines: Dict[str, AsyncEngine] = {}
+        # SQLite allows a single writer; queue writers here instead of
+        # letting them fail with "database is locked"
+        self._write_lock = asyncio.Lock() if IS_SQLITE else None
+        # Without LISTEN/NOTIFY, changes of other processes are only seen
+        # once cached entries expire
+        sqlite_ttl = CACHE_SETTINGS["sqlite_ttl"] if IS_SQLITE else None
+        self.user_cache = UserCache(CACHE_SETTINGS["user_max_size"], sqlite_ttl or CACHE_SETTINGS["user_ttl"])
+        # Cooldown state of all users, by tenant
+        self._eligibility: Dict[Optional[str], EligibilityIndex] = {}
+        # Raw config values by (tenant, key) with their expiry time
+        self._config_cache: Dict[tuple, tuple] = {}
+        self._config_ttl = sqlite_ttl or CACHE_SETTINGS["config_ttl"]
+        # Per-user transaction totals and game stats of read-only screens
+        self.transaction_totals = UserTotalsCache(CACHE_SETTINGS["summary_max_size"], sqlite_ttl)
+        self.game_stats = UserTotalsCache(CACHE_SETTINGS["summary_max_size"], sqlite_ttl)
+        # Timeouts and degraded mode while the database fails
+        self.circuit = CircuitBreaker(self._ping)
+        
+        self.events = EventBus(notify=not IS_SQLITE)
+        self.events.subscribe(UserUpdated, self.user_cache.on_user_updated)
+        self.events.subscribe(ConfigChanged, self._on_config_changed)
+        self.events.subscribe(UserUpdated, self.transaction_totals.on_user_updated)
+        self.events.subscribe(UserUpdated, self.game_stats.on_user_updated)
+    
+    @property
+    def bind(self) -> AsyncEngine:
+        """Get the engine of the current tenant's schema."""
+        tenant = current_tenant.get()
+        if tenant is None:
+            return self.engine
+        
+        tenant_engine = self._tenant_engines.get(tenant)
+        if tenant_engine is None:
+            # Rewrites unqualified table names to the tenant schema when
+            # statements are compiled; connections still come from the shared pool
+            tenant_engine = self.engine.execution_options(schema_translate_map={None: tenant})
+            self._tenant_engines[tenant] = tenant_engine
+        return tenant_engine
+    
+    @property
+    def eligibility(self) -> EligibilityIndex:
+        """Get the eligibility index of the current tenant."""
+        tenant = current_tenant.get()
+        index = self._eligibility.get(tenant)
+        if index is None:
+            index = self._eligibility[tenant] = EligibilityIndex()
+        return index
+    
+    async def _ping(self):
+        """Check that the database answers (circuit breaker recovery probe)."""
+        from sqlalchemy import text
+        
+        async with self.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    def session_factory(self) -> AsyncSession:
+        """Create a session bound to the current tenant's schema."""
+        return async_session(bind=self.bind)
     
     async def create_tables(self):
         """Create all database tables."""
-        async with self.engine.begin() as conn:
+        from sqlalchemy import text
+        
+        tenant = current_tenant.get()
+        if tenant is not None:
+            async with self.engine.begin() as conn:
+                await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{tenant}"'))
+        
+        if not self.is_sqlite:
+            # Trigram operator classes used by the admin search indexes
+            async with self.engine.begin() as conn:
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        
+        async with self.bind.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(self._add_missing_columns, tenant)
+    
+    @staticmethod
+    def _add_missing_columns(connection, schema: Optional[str] = None):
+        """Add ADDED_COLUMNS that are missing from existing tables."""
+        from sqlalchemy import inspect, text
+        
+        inspector = inspect(connection)
+        for table_name, column_names in ADDED_COLUMNS.items():
+            existing = {column["name"] for column in inspector.get_columns(table_name, schema=schema)}
+            table = Base.metadata.tables[table_name]
+            qualified_name = f'"{schema}".{table_name}' if schema else table_name
+            for column_name in column_names:
+                if column_name not in existing:
+                    # Added columns are nullable, so no default or backfill is needed
+                    column_type = table.c[column_name].type.compile(dialect=connection.dialect)
+                    connection.execute(text(f"ALTER TABLE {qualified_name} ADD COLUMN {column_name} {column_type}"))
+                    logger.info(f"Added column {qualified_name}.{column_name}")
+            
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table_name, schema=schema)}
+            for index in table.indexes:
+                # Skip indexes limited to another dialect with ddl_if()
+                ddl_if = getattr(index, "_ddl_if", None)
+                if ddl_if is not None and ddl_if.dialect not in (None, connection.dialect.name):
+                    continue
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    logger.info(f"Added index {index.name} on {qualified_name}")
     
     async def get_session(self) -> AsyncGenerator[AsyncSession, None]:
         """Get database session."""
@@ -43,55 +397,148 @@ class Database:
             finally:
                 await session.close()
     
+    @asynccontextmanager
+    async def write_session(self) -> AsyncGenerator[AsyncSession, None]:
+        """Get database session for an operation that writes.
+        
+        On SQLite, writers wait for each other in FIFO order while readers
+        using plain sessions keep running. On PostgreSQL this is a plain session.
+        """
+        if self._write_lock is None:
+            async with self.session_factory() as session, write_deadline(session):
+                yield session
+            return
+        
+        # The write timeout starts once the lock is held
+        async with self._write_lock:
+            async with self.session_factory() as session, write_deadline(session):
+                yield session
+    
     async def init_default_config(self):
         """Initialize default configuration values."""
-        async with self.session_factory() as session:
+        async with self.write_session() as session:
             for key, value in DEFAULT_CONFIG.items():
                 # Check if config already exists
-                existing = await session.get(Config, key)
+                existing = await self._get_config_row(session, key)
                 if not existing:
                     config = Config(key=key, value=str(value))
                     session.add(config)
             await session.commit()
     
+    @staticmethod
+    async def _get_config_row(session: AsyncSession, key: str):
+        """Get configuration row by key."""
+        from sqlalchemy import select
+        
+        result = await session.execute(select(Config).where(Config.key == key))
+        return result.scalar_one_or_none()
+    
+    @guarded("read")
+    async def _read_config(self, key: str) -> Optional[str]:
+        """Read a raw configuration value from the database."""
+        async with self.session_factory() as session:
+            config = await self._get_config_row(session, key)
+            return config.value if config else None
+    
     async def get_config(self, key: str, default_value=None):
         """Get configuration value."""
-        async with self.session_factory() as session:
-            config = await session.get(Config, key)
-            if config:
-                # Try to convert to appropriate type
-                value = config.value
-                if isinstance(default_value, int):
-                    return int(value)
-                elif isinstance(default_value, float):
-                    return float(value)
-                elif isinstance(default_value, bool):
-                    return value.lower() in ('true', '1', 'yes', 'on')
-                return value
-            return default_value
+        cache_key = (current_tenant.get(), key)
+        cached = self._config_cache.get(cache_key)
+        if cached and cached[0] >= time.monotonic():
+            value = cached[1]
+        else:
+            try:
+                value = await self._read_config(key)
+                self._config_cache[cache_key] = (time.monotonic() + self._config_ttl, value)
+            except DatabaseUnavailable:
+                # Degraded mode: last known value, else the default
+                if cached:
+                    value = cached[1]
+                else:
+                    value = str(DEFAULT_CONFIG[key]) if key in DEFAULT_CONFIG else None
+        
+        if value is not None:
+            # Try to convert to appropriate type
+            if isinstance(default_value, bool):
+                return value.lower() in ('true', '1', 'yes', 'on')
+            elif isinstance(default_value, int):
+                return int(float(value))
+            elif isinstance(default_value, float):
+                return float(value)
+            return value
+        return default_value
     
+    @guarded("write")
     async def set_config(self, key: str, value):
         """Set configuration value."""
-        async with self.session_factory() as session:
-            config = await session.get(Config, key)
+        async with self.write_session() as session:
+            config = await self._get_config_row(session, key)
             if config:
                 config.value = str(value)
+                config.updated_at = datetime.utcnow()
             else:
                 config = Config(key=key, value=str(value))
                 session.add(config)
+            await self.events.publish(session, ConfigChanged(key))
             await session.commit()
+        self._config_cache[(current_tenant.get(), key)] = (time.monotonic() + self._config_ttl, str(value))
+    
+    def _on_config_changed(self, event: ConfigChanged):
+        """Drop config values changed by another process."""
+        if event.key is None:
+            self._config_cache.clear()
+        else:
+            self._config_cache.pop((current_tenant.get(), event.key), None)
+    
+    @staticmethod
+    async def _get_user_row(session: AsyncSession, user_id: int, for_update: bool = False) -> Optional[User]:
+        """Get user row by Telegram user_id, optionally locking it."""
+        from sqlalchemy import select
+        
+        stmt = select(User).where(User.user_id == user_id)
+        if for_update:
+            stmt = stmt.with_for_update()
+        result = await session.execute(stmt)
+        return result.scalar_one_or_none()
     
+    @guarded("read")
     async def get_user(self, user_id: int) -> User:
-        """Get user by user_id."""
+        """Get user by user_id.
+        
+        Always reads the database; use this for balance checks.
+        """
+        generation = self.user_cache.generation
         async with self.session_factory() as session:
-            user = await session.get(User, user_id)
+            user = await self._get_user_row(session, user_id)
+            if user:
+                self.user_cache.put(UserSnapshot.from_user(user), generation)
+                self.eligibility.update(user)
             return user
     
+    async def get_user_snapshot(self, user_id: int) -> Optional[UserSnapshot]:
+        """Get user snapshot for read-only screens, from cache when possible.
+        
+        In degraded mode the last known snapshot is returned, even if expired.
+        """
+        snapshot = self.user_cache.get(user_id)
+        if snapshot:
+            return snapshot
+        
+        try:
+            user = await self.get_user(user_id)
+        except DatabaseUnavailable:
+            snapshot = self.user_cache.get_stale(user_id)
+            if snapshot is None:
+                raise
+            return snapshot
+        return UserSnapshot.from_user(user) if user else None
+    
+    @guarded("write")
     async def create_user(self, user_id: int, username: str = None, 
                          first_name: str = None, last_name: str = None, 
                          referrer_id: int = None) -> User:
         """Create a new user."""
-        async with self.session_factory() as session:
+        async with self.write_session() as session:
             user = User(
                 user_id=user_id,
                 username=username,
@@ -100,32 +547,300 @@ class Database:
                 referrer_id=referrer_id
             )
             session.add(user)
+            await self.events.publish(session, UserUpdated(user_id))
             await session.commit()
             await session.refresh(user)
+            self.user_cache.put(UserSnapshot.from_user(user))
+            self.eligibility.update(user)
             return user
     
+    @guarded("write")
     async def update_user_balance(self, user_id: int, amount: float, 
                                  transaction_type: str, description: str = None):
         """Update user balance and create transaction record."""
-        async with self.session_factory() as session:
-            user = await session.get(User, user_id)
+        async with self.write_session() as session:
+            user = await self._get_user_row(session, user_id, for_update=True)
             if user:
-                user.balance += amount
-                if amount > 0:
-                    user.total_earned += amount
-                
-                # Create transaction record
-                transaction = Transaction(
-                    user_id=user_id,
-                    transaction_type=transaction_type,
-                    amount=amount,
-                    description=description
-                )
-                session.add(transaction)
+                await self._apply_balance_change(session, user, amount, transaction_type, description)
                 await session.commit()
+                self.user_cache.put(UserSnapshot.from_user(user))
                 return True
             return False
     
+    async def _apply_balance_change(self, session: AsyncSession, user: User, amount: float,
+                                    transaction_type: str, description: str = None):
+        """Change a locked user's balance and record the transaction in the session."""
+        user.balance += amount
+        if amount > 0:
+            user.total_earned += amount
+        
+        # Create transaction record
+        transaction = Transaction(
+            user_id=user.user_id,
+            transaction_type=transaction_type,
+            amount=amount,
+            description=description
+        )
+        session.add(transaction)
+        await self.events.publish(session, UserUpdated(user.user_id))
+    
+    @guarded("write")
+    async def register_user(self, user_id: int, username: str = None, first_name: str = None,
+                            last_name: str = None, referrer_id: int = None,
+                            referral_reward: float = 0.0) -> Optional[UserSnapshot]:
+        """Register a new user and credit the referral in one transaction.
+        
+        The user is inserted with ON CONFLICT DO NOTHING. Only if the row was
+        created and the referrer exists, both parties are credited, the
+        referrer's referral_count is incremented and both transaction rows
+        are written. On Postgres all of this, including the event
+        notifications, is a single statement (one round trip). Returns the
+        new user's snapshot, or None if the user already existed.
+        """
+        from sqlalchemy import select, update, insert, case, literal, true, Integer, String, Float, DateTime, Boolean
+        
+        now = datetime.utcnow()
+        if referrer_id == user_id:
+            referrer_id = None
+        
+        # Unknown referrers are dropped, so the bonus is only paid for real ones
+        referrer = select(User.user_id).where(User.user_id == referrer_id).scalar_subquery()
+        bonus = case((referrer.is_not(None), literal(referral_reward, Float)), else_=literal(0.0, Float))
+        
+        columns = [
+            "user_id", "username", "first_name", "last_name", "balance", "total_earned",
+            "referral_count", "referrer_id", "join_date", "daily_rolls_count", "is_active"
+        ]
+        new_user_insert = self._insert(User).from_select(columns, select(
+            literal(user_id, Integer), literal(username, String), literal(first_name, String),
+            literal(last_name, String), bonus, bonus, literal(0, Integer), referrer,
+            literal(now, DateTime), literal(0, Integer), literal(True, Boolean)
+        ).where(true())).on_conflict_do_nothing(index_elements=["user_id"]).returning(
+            User.user_id, User.referrer_id
+        )
+        
+        referrer_description = f"Referral bonus for {username or user_id}"
+        welcome_description = "Welcome bonus from referral"
+        
+        async with self.write_session() as session:
+            if self.is_sqlite:
+                row = (await session.execute(new_user_insert)).first()
+                created = row is not None
+                credited = created and row.referrer_id is not None
+                if credited:
+                    await session.execute(update(User).where(User.user_id == referrer_id).values(
+                        balance=User.balance + referral_reward,
+                        total_earned=User.total_earned + referral_reward,
+                        referral_count=User.referral_count + 1
+                    ))
+                    await session.execute(insert(Transaction), [
+                        {"user_id": referrer_id, "transaction_type": "referral", "amount": referral_reward,
+                         "description": referrer_description, "created_at": now},
+                        {"user_id": user_id, "transaction_type": "referral", "amount": referral_reward,
+                         "description": welcome_description, "created_at": now},
+                    ])
+            else:
+                created, credited = await self._register_user_statement(
+                    session, new_user_insert, user_id, referrer_id, referral_reward,
+                    referrer_description, welcome_description, now
+                )
+            
+            if not created:
+                await session.rollback()
+                return None
+            
+            await self.events.publish(session, UserUpdated(user_id), notified=not self.is_sqlite)
+            if credited:
+                await self.events.publish(session, UserUpdated(referrer_id), notified=not self.is_sqlite)
+            await session.commit()
+        
+        # Build the snapshot from known values instead of reading the row back
+        balance = referral_reward if credited else 0.0
+        snapshot = UserSnapshot(
+            user_id, username, first_name, balance, balance, 0, now, None, None, 0
+        )
+        self.user_cache.put(snapshot)
+        self.eligibility.update(snapshot)
+        return snapshot
+    
+    async def _register_user_statement(self, session: AsyncSession, new_user_insert, user_id: int,
+                                       referrer_id: Optional[int], referral_reward: float,
+                                       referrer_description: str, welcome_description: str,
+                                       now: datetime) -> tuple[bool, bool]:
+        """Run the whole registration as one statement of data-modifying CTEs (Postgres)."""
+        from sqlalchemy import select, update, insert, exists, literal, union_all, func, Float, String, DateTime
+        
+        new_user = new_user_insert.cte("new_user")
+        credited = update(User).where(User.user_id == new_user.c.referrer_id).values(
+            balance=User.balance + referral_reward,
+            total_earned=User.total_earned + referral_reward,
+            referral_count=User.referral_count + 1
+        ).returning(User.user_id).cte("credited")
+        
+        def ledger_row(source, description):
+            return select(
+                source.c.user_id, literal("referral", String), literal(referral_reward, Float),
+                literal(description, String), literal(now, DateTime)
+            )
+        
+        ledger = insert(Transaction).from_select(
+            ["user_id", "transaction_type", "amount", "description", "created_at"],
+            union_all(
+                ledger_row(credited, referrer_description),
+                ledger_row(new_user, welcome_description).where(exists(select(credited.c.user_id)))
+            )
+        ).returning(Transaction.id).cte("ledger")
+        
+        # Notifications are only sent for rows the statement actually changed
+        notify_user = select(func.pg_notify(EVENT_CHANNEL, self.events.payload(UserUpdated(user_id)))).select_from(new_user)
+        notify_referrer = select(func.pg_notify(EVENT_CHANNEL, self.events.payload(UserUpdated(referrer_id)))).select_from(credited)
+        
+        stmt = select(
+            exists(select(new_user.c.user_id)),
+            exists(select(credited.c.user_id)),
+            select(func.count()).select_from(ledger).scalar_subquery(),
+            notify_user.scalar_subquery(),
+            notify_referrer.scalar_subquery()
+        )
+        created, credited_referrer, _, _, _ = (await session.execute(stmt)).one()
+        return created, credited_referrer
+    
+    @guarded("write")
+    async def record_dice_roll(self, user_id: int, dice_value: int, reward: float,
+                               cooldown: int, max_rolls: int) -> Optional[UserSnapshot]:
+        """Credit a dice roll and update roll stats in one transaction.
+        
+        Cooldown and daily limit are checked again on the locked row, so
+        concurrent rolls cannot both pass. Returns the updated snapshot, or
+        None if the user is missing or not allowed to roll.
+        """
+        async with self.write_session() as session:
+            user = await self._get_user_row(session, user_id, for_update=True)
+            if not user:
+                return None
+            
+            now = datetime.utcnow()
+            can_roll, _ = can_roll_dice(user, cooldown)
+            if not can_roll or get_daily_rolls(user, now) >= max_rolls:
+                return None
+            
+            user.daily_rolls_count = get_daily_rolls(user, now) + 1
+            user.last_dice_roll = now
+            user.balance += reward
+            user.total_earned += reward
+            
+            session.add(Transaction(
+                user_id=user_id,
+                transaction_type="game",
+                amount=reward,
+                description=f"Dice roll: {dice_value}"
+            ))
+            session.add(GameHistory(
+                user_id=user_id,
+                game_type="dice",
+                dice_value=dice_value,
+                reward=reward
+            ))
+            await self.events.publish(session, UserUpdated(user_id))
+            await session.commit()
+            
+            snapshot = UserSnapshot.from_user(user)
+            self.user_cache.put(snapshot)
+            self.eligibility.update(snapshot)
+            return snapshot
+    
+    @guarded("write")
+    async def claim_daily_bonus(self, user_id: int, amount: float) -> Optional[UserSnapshot]:
+        """Credit the daily bonus in one transaction.
+        
+        Returns the updated snapshot, or None if the user is missing or the
+        bonus was already claimed within the last 24 hours.
+        """
+        async with self.write_session() as session:
+            user = await self._get_user_row(session, user_id, for_update=True)
+            if not user:
+                return None
+            
+            can_claim, _ = can_claim_daily_bonus(user)
+            if not can_claim:
+                return None
+            
+            user.last_daily_bonus = datetime.utcnow()
+            user.balance += amount
+            user.total_earned += amount
+            
+            session.add(Transaction(
+                user_id=user_id,
+                transaction_type="bonus",
+                amount=amount,
+                description="Daily bonus"
+            ))
+            await self.events.publish(session, UserUpdated(user_id))
+            await session.commit()
+            
+            snapshot = UserSnapshot.from_user(user)
+            self.user_cache.put(snapshot)
+            self.eligibility.update(snapshot)
+            return snapshot
+    
+    @guarded("write")
+    async def set_reminders(self, user_id: int, enabled: bool) -> Optional[UserSnapshot]:
+        """Turn "bonus ready" reminders on or off; returns the updated snapshot."""
+        async with self.write_session() as session:
+            user = await self._get_user_row(session, user_id, for_update=True)
+            if not user:
+                return None
+            
+            user.reminders_enabled = enabled
+            await self.events.publish(session, UserUpdated(user_id))
+            await session.commit()
+            
+            snapshot = UserSnapshot.from_user(user)
+            self.user_cache.put(snapshot)
+            return snapshot
+    
+    async def get_reminder_users(self):
+        """Get (user_id, last_dice_roll, last_daily_bonus) of users with reminders on."""
+        from sqlalchemy import select
+        
+        # Served by the partial index on opted-in users
+        stmt = select(User.user_id, User.last_dice_roll, User.last_daily_bonus).where(
+            User.reminders_enabled == True
+        )
+        async with self.session_factory() as session:
+            result = await session.execute(stmt)
+            return result.all()
+    
+    @guarded("read")
+    async def get_due_reminders(self, kind: str, user_ids: List[int], cooldown: int,
+                                max_rolls: int = None) -> List[int]:
+        """Get users of a batch that still have reminders on and are eligible now.
+        
+        ``kind`` is ``"dice"`` or ``"bonus"``. Re-checking the batch in one
+        query drops users that acted in another process since they were
+        scheduled, or turned reminders off.
+        """
+        from sqlalchemy import select, or_
+        
+        now = datetime.utcnow()
+        stmt = select(User.user_id).where(
+            User.user_id.in_(user_ids),
+            User.reminders_enabled == True
+        )
+        if kind == "dice":
+            today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            stmt = stmt.where(
+                User.last_dice_roll <= now - timedelta(seconds=cooldown),
+                or_(User.daily_rolls_count < max_rolls, User.last_dice_roll < today)
+            )
+        else:
+            stmt = stmt.where(User.last_daily_bonus <= now - timedelta(seconds=cooldown))
+        
+        async with self.session_factory() as session:
+            result = await session.execute(stmt)
+            return list(result.scalars().all())
+    
+    @guarded("read")
     async def get_user_transactions(self, user_id: int, limit: int = 10):
         """Get user's recent transactions."""
         async with self.session_factory() as session:
@@ -139,19 +854,218 @@ class Database:
             result = await session.execute(stmt)
             return result.scalars().all()
     
+    @guarded("read")
+    async def get_user_transactions_page(self, user_id: int, limit: int = 10,
+                                         before: tuple = None, after: tuple = None):
+        """Get one page of user's transactions, newest first.
+        
+        Pages are addressed by a ``(created_at, id)`` keyset cursor: ``before``
+        returns the page of older transactions, ``after`` the page of newer
+        ones. Returns ``(transactions, has_older, has_newer)``.
+        """
+        from sqlalchemy import select, tuple_
+        
+        key = tuple_(Transaction.created_at, Transaction.id)
+        stmt = select(Transaction).where(Transaction.user_id == user_id)
+        
+        if after:
+            # Walk forward from the cursor, then flip back to newest first
+            stmt = stmt.where(key > tuple_(*after)).order_by(
+                Transaction.created_at.asc(), Transaction.id.asc()
+            )
+        else:
+            if before:
+                stmt = stmt.where(key < tuple_(*before))
+            stmt = stmt.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        
+        # Fetch one extra row to know whether another page exists
+        async with self.session_factory() as session:
+            result = await session.execute(stmt.limit(limit + 1))
+            transactions = list(result.scalars().all())
+        
+        has_more = len(transactions) > limit
+        transactions = transactions[:limit]
+        
+        if after:
+            transactions.reverse()
+            return transactions, True, has_more
+        return transactions, has_more, before is not None
+    
+    async def get_user_transaction_summary(self, user_id: int) -> Dict[str, float]:
+        """Get user's transaction totals by type, from cache when possible.
+        
+        Every write that adds a transaction publishes UserUpdated, which drops
+        the cached totals, so paging through history aggregates it only once.
+        """
+        totals = self.transaction_totals.get(user_id)
+        if totals is None:
+            generation = self.transaction_totals.generation
+            totals = await self._read_transaction_summary(user_id)
+            self.transaction_totals.put(user_id, totals, generation)
+        return totals
+    
+    @guarded("read")
+    async def _read_transaction_summary(self, user_id: int) -> Dict[str, float]:
+        """Aggregate user's transaction totals by type."""
+        async with self.session_factory() as session:
+            from sqlalchemy import select, func
+            
+            stmt = select(
+                Transaction.transaction_type, func.sum(Transaction.amount)
+            ).where(
+                Transaction.user_id == user_id
+            ).group_by(Transaction.transaction_type)
+            
+            result = await session.execute(stmt)
+            return {transaction_type: total for transaction_type, total in result.all()}
+    
+    @guarded("read")
     async def get_pending_withdrawals(self):
-        """Get all pending withdrawal requests."""
+        """Get all open (pending or claimed) withdrawal requests."""
         async with self.session_factory() as session:
             from sqlalchemy import select
             from .models import WithdrawRequest
             
             stmt = select(WithdrawRequest).where(
-                WithdrawRequest.status == "pending"
+                WithdrawRequest.status.in_(("pending", "processing"))
             ).order_by(WithdrawRequest.created_at.desc())
             
             result = await session.execute(stmt)
             return result.scalars().all()
     
+    @guarded("write")
+    async def request_withdrawal(self, user_id: int, amount: float) -> int:
+        """Create a withdrawal request and debit the balance in one transaction.
+        
+        The user row is locked while the minimum and balance are checked, so
+        concurrent requests cannot overdraw. Returns the request id; raises
+        WithdrawalError with the reason if the request is not allowed.
+        """
+        min_withdrawal = await self.get_config("min_withdrawal", 1000)
+        if not math.isfinite(amount) or amount <= 0:
+            raise WithdrawalError("invalid_amount", minimum=min_withdrawal)
+        
+        async with self.write_session() as session:
+            user = await self._get_user_row(session, user_id, for_update=True)
+            if not user:
+                raise WithdrawalError("user_not_found")
+            if amount < min_withdrawal:
+                raise WithdrawalError("below_minimum", user.balance, min_withdrawal)
+            if amount > user.balance:
+                raise WithdrawalError("insufficient_balance", user.balance, min_withdrawal)
+            
+            withdraw_request = WithdrawRequest(user_id=user_id, amount=amount, status="pending")
+            session.add(withdraw_request)
+            await session.flush()
+            
+            await self._apply_balance_change(
+                session, user, -amount, "withdrawal", f"Withdrawal request #{withdraw_request.id}"
+            )
+            await self.events.publish(session, WithdrawalChanged(withdraw_request.id, user_id, "pending"))
+            await session.commit()
+            
+            self.user_cache.put(UserSnapshot.from_user(user))
+            return withdraw_request.id
+    
+    @guarded("write")
+    async def claim_withdrawals(self, worker: str, limit: int = None,
+                                lease_seconds: int = None) -> List[WithdrawRequest]:
+        """Claim the oldest open withdrawal requests for a worker.
+        
+        Claimable requests are pending ones, ones whose lease expired and
+        ones already claimed by the same worker (their lease is renewed).
+        Rows locked by a concurrent claim are skipped instead of waited on,
+        so several workers can drain the queue in parallel without getting
+        the same request.
+        """
+        from sqlalchemy import select, update, or_, and_
+        
+        limit = limit or WITHDRAWAL_QUEUE["claim_size"]
+        lease_seconds = lease_seconds or WITHDRAWAL_QUEUE["lease_seconds"]
+        now = datetime.utcnow()
+        
+        claimable = select(WithdrawRequest.id).where(or_(
+            WithdrawRequest.status == "pending",
+            and_(
+                WithdrawRequest.status == "processing",
+                or_(WithdrawRequest.lease_expires_at < now, WithdrawRequest.claimed_by == worker)
+            )
+        )).order_by(WithdrawRequest.created_at, WithdrawRequest.id).limit(limit).with_for_update(skip_locked=True)
+        
+        stmt = update(WithdrawRequest).where(
+            WithdrawRequest.id.in_(claimable.scalar_subquery())
+        ).values(
+            status="processing",
+            claimed_by=worker,
+            lease_expires_at=now + timedelta(seconds=lease_seconds)
+        ).returning(WithdrawRequest).execution_options(synchronize_session=False)
+        
+        async with self.write_session() as session:
+            claimed = list((await session.execute(stmt)).scalars().all())
+            for request in claimed:
+                await self.events.publish(session, WithdrawalChanged(request.id, request.user_id, "processing"))
+            await session.commit()
+        
+        claimed.sort(key=lambda request: (request.created_at, request.id))
+        return claimed
+    
+    @guarded("write")
+    async def finish_withdrawal(self, request_id: int, worker: str, approve: bool) -> Optional[WithdrawRequest]:
+        """Mark a withdrawal request paid or rejected, refunding rejections.
+        
+        The status change is a single conditional update, so a request is
+        finished at most once: it must be pending, claimed by this worker,
+        or claimed under an expired lease. The refund of a rejected request
+        is committed in the same transaction (there is none if the user no
+        longer exists). Returns the finished request,
+        or None if it was not found or not finishable by this worker.
+        """
+        from sqlalchemy import update, or_, and_
+        
+        now = datetime.utcnow()
+        status = "paid" if approve else "rejected"
+        
+        stmt = update(WithdrawRequest).where(
+            WithdrawRequest.id == request_id,
+            or_(
+                WithdrawRequest.status == "pending",
+                and_(
+                    WithdrawRequest.status == "processing",
+                    or_(WithdrawRequest.claimed_by == worker, WithdrawRequest.lease_expires_at < now)
+                )
+            )
+        ).values(
+            status=status,
+            processed_at=now,
+            claimed_by=worker,
+            lease_expires_at=None
+        ).returning(WithdrawRequest).execution_options(synchronize_session=False)
+        
+        async with self.write_session() as session:
+            request = (await session.execute(stmt)).scalar_one_or_none()
+            if not request:
+                return None
+            
+            user = None
+            if not approve:
+                user = await self._get_user_row(session, request.user_id, for_update=True)
+                if user:
+                    await self._apply_balance_change(
+                        session, user, request.amount, "withdrawal_refund",
+                        f"Withdrawal request #{request_id} rejected - refunded"
+                    )
+                else:
+                    # Nobody to refund; the request is still rejected
+                    logger.warning(f"Withdrawal request #{request_id} rejected without refund: "
+                                   f"user {request.user_id} not found")
+            await self.events.publish(session, WithdrawalChanged(request.id, request.user_id, status))
+            await session.commit()
+            
+            if user:
+                self.user_cache.put(UserSnapshot.from_user(user))
+            return request
+    
+    @guarded("read")
     async def get_all_users(self, limit: int = 100):
         """Get all users (for admin)."""
         async with self.session_factory() as session:
@@ -160,6 +1074,607 @@ class Database:
             stmt = select(User).order_by(User.join_date.desc()).limit(limit)
             result = await session.execute(stmt)
             return result.scalars().all()
+    
+    @guarded("read")
+    async def search_users(self, query: str, limit: int = 10, withdrawals: int = 3) -> List[tuple]:
+        """Find users by id, @username or name, with their recent withdrawals.
+        
+        Digits match the Telegram user id exactly, "@handle" matches
+        usernames starting with handle, anything else matches usernames and
+        first names (containing the text on PostgreSQL, starting with it on
+        SQLite, so the trigram or NOCASE indexes are used). Exact matches
+        come first. Users and their last ``withdrawals`` requests are loaded
+        in one statement. Returns ``(user, [withdrawal, ...])`` tuples.
+        """
+        from sqlalchemy import and_, case, func, or_, select
+        from sqlalchemy.orm import aliased
+        
+        query = query.strip()
+        if not query:
+            return []
+        
+        if query.isdigit():
+            condition = User.user_id == int(query)
+            exact = condition
+        else:
+            handle = query.startswith("@")
+            text_query = query.lstrip("@")
+            if not text_query:
+                return []
+            escaped = text_query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            pattern = f"{escaped}%" if handle or self.is_sqlite else f"%{escaped}%"
+            columns = [User.username] if handle else [User.username, User.first_name]
+        
+            if self.is_sqlite:
+                # LIKE is case-insensitive on SQLite and can use the NOCASE indexes
+                condition = or_(*(column.like(pattern, escape="\\") for column in columns))
+            else:
+                condition = or_(*(column.ilike(pattern, escape="\\") for column in columns))
+            exact = or_(*(func.lower(column) == text_query.lower() for column in columns))
+        
+        match_order = case((exact, 0), else_=1).label("match_order")
+        matched = select(User, match_order).where(condition).order_by(
+            match_order, User.join_date.desc()
+        ).limit(limit).subquery()
+        
+        recent = select(
+            WithdrawRequest,
+            func.row_number().over(
+                partition_by=WithdrawRequest.user_id,
+                order_by=(WithdrawRequest.created_at.desc(), WithdrawRequest.id.desc())
+            ).label("position")
+        ).where(WithdrawRequest.user_id.in_(select(matched.c.user_id))).subquery()
+        
+        matched_user = aliased(User, matched)
+        recent_withdrawal = aliased(WithdrawRequest, recent)
+        stmt = select(matched_user, recent_withdrawal).outerjoin(
+            recent, and_(recent.c.user_id == matched.c.user_id, recent.c.position <= withdrawals)
+        ).order_by(matched.c.match_order, matched.c.join_date.desc(), matched.c.user_id, recent.c.position)
+        
+        async with self.session_factory() as session:
+            result = await session.execute(stmt)
+            found: Dict[int, tuple] = {}
+            for user, withdrawal in result.all():
+                entry = found.setdefault(user.user_id, (user, []))
+                if withdrawal is not None:
+                    entry[1].append(withdrawal)
+            return list(found.values())
+
+    def _insert(self, model):
+        """Get dialect-specific INSERT supporting ON CONFLICT clauses."""
+        if self.is_sqlite:
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        return insert(model)
+    
+    def _bucket(self, column, granularity: str):
+        """Get SQL expression truncating a timestamp to an hour or day bucket."""
+        from sqlalchemy import func, literal_column
+        
+        if self.is_sqlite:
+            # Same text format SQLAlchemy uses for DateTime values on SQLite
+            fmt = "%Y-%m-%d %H:00:00.000000" if granularity == "hour" else "%Y-%m-%d 00:00:00.000000"
+            return func.strftime(fmt, column)
+        # Inline the unit so GROUP BY matches the selected expression
+        return func.date_trunc(literal_column(f"'{granularity}'"), column)
+    
+    @staticmethod
+    def _as_datetime(value) -> datetime:
+        """Convert a bucket value returned by the database to datetime."""
+        if isinstance(value, str):
+            return datetime.fromisoformat(value)
+        return value
+    
+    @staticmethod
+    async def _get_watermark(session: AsyncSession, name: str) -> Watermark:
+        """Get watermark row by name, creating it if needed."""
+        from sqlalchemy import select
+        
+        result = await session.execute(select(Watermark).where(Watermark.name == name))
+        watermark = result.scalar_one_or_none()
+        if not watermark:
+            watermark = Watermark(name=name, last_id=0)
+            session.add(watermark)
+        return watermark
+    
+    async def _add_rollups(self, session: AsyncSession, values: Dict[tuple, float]):
+        """Add values to rollup rows keyed by (granularity, bucket, metric)."""
+        if not values:
+            return
+        
+        stmt = self._insert(ActivityRollup)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["granularity", "bucket", "metric"],
+            set_={"value": ActivityRollup.value + stmt.excluded.value}
+        )
+        await session.execute(stmt, [
+            {"granularity": granularity, "bucket": bucket, "metric": metric, "value": value}
+            for (granularity, bucket, metric), value in values.items()
+        ])
+    
+    async def _rollup_transactions(self, session: AsyncSession, batch_size: int, cutoff: datetime) -> int:
+        """Fold the next batch of transactions into the rollups."""
+        from sqlalchemy import select, func
+        
+        watermark = await self._get_watermark(session, "rollups_transactions")
+        last_id = watermark.last_id or 0
+        
+        batch = select(Transaction.id).where(
+            Transaction.id > last_id, Transaction.created_at < cutoff
+        ).order_by(Transaction.id).limit(batch_size).subquery()
+        upper_id = (await session.execute(select(func.max(batch.c.id)))).scalar()
+        if upper_id is None:
+            return 0
+        
+        in_batch = (Transaction.id > last_id, Transaction.id <= upper_id)
+        values = {}
+        row_count = 0
+        
+        for granularity in ROLLUP_GRANULARITIES:
+            bucket = self._bucket(Transaction.created_at, granularity)
+            stmt = select(
+                bucket, Transaction.transaction_type,
+                func.count(Transaction.id), func.sum(Transaction.amount)
+            ).where(*in_batch).group_by(bucket, Transaction.transaction_type)
+            
+            for bucket_value, transaction_type, count, total in await session.execute(stmt):
+                bucket_value = self._as_datetime(bucket_value)
+                values[(granularity, bucket_value, f"{transaction_type}_count")] = count
+                values[(granularity, bucket_value, f"{transaction_type}_amount")] = total
+                if granularity == "day":
+                    row_count += count
+        
+        # Distinct active users per day: only first sightings are inserted
+        day = self._bucket(Transaction.created_at, "day")
+        stmt = self._insert(DailyActiveUser).from_select(
+            ["day", "user_id"],
+            select(day, Transaction.user_id).where(*in_batch).distinct()
+        ).on_conflict_do_nothing(index_elements=["day", "user_id"]).returning(DailyActiveUser.day)
+        for (day_value,) in await session.execute(stmt):
+            key = ("day", self._as_datetime(day_value), "active_users")
+            values[key] = values.get(key, 0) + 1
+        
+        await self._add_rollups(session, values)
+        watermark.last_id = upper_id
+        watermark.updated_at = datetime.utcnow()
+        return row_count
+    
+    async def _rollup_users(self, session: AsyncSession, batch_size: int, cutoff: datetime) -> int:
+        """Fold the next batch of new users into the rollups."""
+        from sqlalchemy import select, func
+        
+        watermark = await self._get_watermark(session, "rollups_users")
+        last_id = watermark.last_id or 0
+        
+        batch = select(User.id).where(
+            User.id > last_id, User.join_date < cutoff
+        ).order_by(User.id).limit(batch_size).subquery()
+        upper_id = (await session.execute(select(func.max(batch.c.id)))).scalar()
+        if upper_id is None:
+            return 0
+        
+        values = {}
+        row_count = 0
+        for granularity in ROLLUP_GRANULARITIES:
+            bucket = self._bucket(User.join_date, granularity)
+            stmt = select(bucket, func.count(User.id)).where(
+                User.id > last_id, User.id <= upper_id
+            ).group_by(bucket)
+            for bucket_value, count in await session.execute(stmt):
+                values[(granularity, self._as_datetime(bucket_value), "new_users")] = count
+                if granularity == "day":
+                    row_count += count
+        
+        await self._add_rollups(session, values)
+        watermark.last_id = upper_id
+        watermark.updated_at = datetime.utcnow()
+        return row_count
+    
+    async def _prune_active_users(self, session: AsyncSession, cutoff: datetime) -> int:
+        """Delete active user rows of days the rollups no longer add to."""
+        from sqlalchemy import delete
+        
+        # Every transaction before the cutoff has been rolled up; older days
+        # are kept for a margin in case of late commits
+        keep_from = datetime(cutoff.year, cutoff.month, cutoff.day) - timedelta(days=ACTIVE_USER_DAYS)
+        result = await session.execute(delete(DailyActiveUser).where(DailyActiveUser.day < keep_from))
+        return result.rowcount
+    
+    async def refresh_rollups(self, batch_size: int = 10000) -> int:
+        """Fold rows added since the last run into the activity rollups.
+        
+        Each batch is aggregated and committed together with its watermark,
+        so a run only reads new rows and an interrupted run resumes where it
+        stopped. Per-user active rows of finished days are deleted afterwards.
+        Returns the number of rows processed.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+        processed = 0
+        
+        for rollup in (self._rollup_transactions, self._rollup_users):
+            while True:
+                async with self.write_session() as session:
+                    row_count = await rollup(session, batch_size, cutoff)
+                    await session.commit()
+                processed += row_count
+                if row_count == 0:
+                    break
+        
+        async with self.write_session() as session:
+            await self._prune_active_users(session, cutoff)
+            await session.commit()
+        
+        return processed
+    
+    async def _check_ledger(self, session: AsyncSession, users_clause) -> List[Dict[str, float]]:
+        """Check balances of the selected users against their transactions.
+        
+        Only transactions after each user's checkpoint are summed. Users whose
+        balance does not match are recomputed from all their transactions
+        before being reported, so a transaction that committed late with an
+        id below the checkpoint does not raise a false alarm. Checkpoints are
+        moved forward to the current balance either way; a confirmed
+        difference is added to the checkpoint's drift and returned.
+        """
+        from sqlalchemy import select, func, and_
+        
+        tolerance = LEDGER_SETTINGS["tolerance"]
+        checkpoint_id = func.coalesce(LedgerCheckpoint.last_transaction_id, 0)
+        
+        # Balance and transaction sum come from the same statement, so they
+        # see the same snapshot
+        stmt = select(
+            User.user_id, User.balance, LedgerCheckpoint.balance_at_checkpoint,
+            LedgerCheckpoint.last_transaction_id,
+            func.sum(Transaction.amount), func.max(Transaction.id)
+        ).select_from(User).outerjoin(
+            LedgerCheckpoint, LedgerCheckpoint.user_id == User.user_id
+        ).outerjoin(
+            Transaction, and_(Transaction.user_id == User.user_id, Transaction.id > checkpoint_id)
+        ).where(users_clause).group_by(
+            User.user_id, User.balance, LedgerCheckpoint.balance_at_checkpoint,
+            LedgerCheckpoint.last_transaction_id
+        )
+        
+        checkpoints = {}
+        suspects = []
+        for user_id, balance, checkpoint_balance, last_id, amount, max_id in (await session.execute(stmt)).all():
+            balance = balance or 0.0
+            expected = (checkpoint_balance or 0.0) + (amount or 0.0)
+            checkpoints[user_id] = {
+                "user_id": user_id,
+                "last_transaction_id": max_id or last_id or 0,
+                "balance_at_checkpoint": balance,
+                "drift": 0.0,
+            }
+            if abs(balance - expected) > tolerance:
+                suspects.append(user_id)
+        
+        mismatches = []
+        if suspects:
+            stmt = select(
+                User.user_id, User.balance, func.sum(Transaction.amount), func.max(Transaction.id)
+            ).select_from(User).outerjoin(
+                Transaction, Transaction.user_id == User.user_id
+            ).where(User.user_id.in_(suspects)).group_by(User.user_id, User.balance)
+            
+            for user_id, balance, amount, max_id in (await session.execute(stmt)).all():
+                balance = balance or 0.0
+                expected = amount or 0.0
+                checkpoint = checkpoints[user_id]
+                checkpoint["last_transaction_id"] = max_id or 0
+                checkpoint["balance_at_checkpoint"] = balance
+                if abs(balance - expected) > tolerance:
+                    checkpoint["drift"] = balance - expected
+                    mismatches.append({
+                        "user_id": user_id,
+                        "expected": expected,
+                        "actual": balance,
+                        "difference": balance - expected,
+                    })
+        
+        if checkpoints:
+            now = datetime.utcnow()
+            stmt = self._insert(LedgerCheckpoint)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={
+                    "last_transaction_id": stmt.excluded.last_transaction_id,
+                    "balance_at_checkpoint": stmt.excluded.balance_at_checkpoint,
+                    "drift": LedgerCheckpoint.drift + stmt.excluded.drift,
+                    "checked_at": stmt.excluded.checked_at,
+                }
+            )
+            await session.execute(stmt, [
+                dict(checkpoint, checked_at=now) for checkpoint in checkpoints.values()
+            ])
+        
+        return mismatches
+    
+    async def _reconcile_transactions(self, session: AsyncSession, batch_size: int,
+                                      cutoff: datetime) -> tuple[int, List[Dict[str, float]]]:
+        """Check users with transactions in the next batch after the watermark."""
+        from sqlalchemy import select, func
+        
+        watermark = await self._get_watermark(session, "ledger_transactions")
+        last_id = watermark.last_id or 0
+        
+        batch = select(Transaction.id).where(
+            Transaction.id > last_id, Transaction.created_at < cutoff
+        ).order_by(Transaction.id).limit(batch_size).subquery()
+        upper_id = (await session.execute(select(func.max(batch.c.id)))).scalar()
+        if upper_id is None:
+            return 0, []
+        
+        changed_users = select(Transaction.user_id).where(
+            Transaction.id > last_id, Transaction.id <= upper_id
+        ).distinct()
+        mismatches = await self._check_ledger(session, User.user_id.in_(changed_users))
+        
+        watermark.last_id = upper_id
+        watermark.updated_at = datetime.utcnow()
+        return upper_id - last_id, mismatches
+    
+    async def _reconcile_sweep(self, session: AsyncSession, sweep_size: int) -> List[Dict[str, float]]:
+        """Check the next slice of users, wrapping around after the last one.
+        
+        Catches balance changes made without any transaction record, which
+        the transaction watermark alone would never see.
+        """
+        from sqlalchemy import select, func, and_
+        
+        watermark = await self._get_watermark(session, "ledger_sweep")
+        last_id = watermark.last_id or 0
+        
+        batch = select(User.id).where(User.id > last_id).order_by(User.id).limit(sweep_size).subquery()
+        row_count, upper_id = (await session.execute(
+            select(func.count(batch.c.id), func.max(batch.c.id))
+        )).one()
+        
+        mismatches = []
+        if upper_id is not None:
+            mismatches = await self._check_ledger(session, and_(User.id > last_id, User.id <= upper_id))
+        
+        watermark.last_id = upper_id if row_count == sweep_size else 0
+        watermark.updated_at = datetime.utcnow()
+        return mismatches
+    
+    async def reconcile_ledger(self, batch_size: int = None, sweep_size: int = None) -> List[Dict[str, float]]:
+        """Check user balances against the transaction ledger.
+        
+        Users with transactions since the last run are checked from their
+        checkpoints, and a rotating slice of all users is re-checked on every
+        run. Returns the balance mismatches found.
+        """
+        batch_size = batch_size or LEDGER_SETTINGS["batch_size"]
+        sweep_size = sweep_size or LEDGER_SETTINGS["sweep_size"]
+        cutoff = datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+        mismatches = []
+        
+        while True:
+            async with self.write_session() as session:
+                row_count, found = await self._reconcile_transactions(session, batch_size, cutoff)
+                await session.commit()
+            mismatches.extend(found)
+            if row_count == 0:
+                break
+        
+        async with self.write_session() as session:
+            mismatches.extend(await self._reconcile_sweep(session, sweep_size))
+            await session.commit()
+        
+        for mismatch in mismatches:
+            logger.warning(
+                f"Ledger mismatch for user {mismatch['user_id']}: balance {mismatch['actual']:.2f}, "
+                f"transactions {mismatch['expected']:.2f}"
+            )
+        return mismatches
+    
+    @guarded("read")
+    async def get_rollups(self, granularity: str, since: datetime) -> Dict[datetime, Dict[str, float]]:
+        """Get rollup values by bucket and metric since a given time."""
+        async with self.session_factory() as session:
+            from sqlalchemy import select
+            
+            stmt = select(
+                ActivityRollup.bucket, ActivityRollup.metric, ActivityRollup.value
+            ).where(
+                ActivityRollup.granularity == granularity,
+                ActivityRollup.bucket >= since
+            ).order_by(ActivityRollup.bucket)
+            
+            rollups = {}
+            for bucket, metric, value in await session.execute(stmt):
+                rollups.setdefault(bucket, {})[metric] = value
+            return rollups
+    
+    async def save_export_watermark(self, table_name: str, last_id: int):
+        """Record the last id of a table written by the Parquet export."""
+        async with self.write_session() as session:
+            watermark = await self._get_watermark(session, EXPORT_WATERMARK.format(table=table_name))
+            watermark.last_id = last_id
+            watermark.updated_at = datetime.utcnow()
+            await session.commit()
+    
+    async def _compact_game_history_batch(self, session: AsyncSession, batch_size: int, cutoff: datetime,
+                                          max_id: Optional[int] = None) -> int:
+        """Fold the oldest batch of raw game history up to max_id into the daily aggregates."""
+        from sqlalchemy import case, delete, func, select
+        
+        batch = select(GameHistory.id).where(GameHistory.played_at < cutoff)
+        if max_id is not None:
+            batch = batch.where(GameHistory.id <= max_id)
+        batch = batch.order_by(GameHistory.id).limit(batch_size).subquery()
+        upper_id = (await session.execute(select(func.max(batch.c.id)))).scalar()
+        if upper_id is None:
+            return 0
+        
+        in_batch = (GameHistory.id <= upper_id, GameHistory.played_at < cutoff)
+        day = self._bucket(GameHistory.played_at, "day")
+        game_type = func.coalesce(GameHistory.game_type, "dice")
+        aggregate = select(
+            day, GameHistory.user_id, game_type, func.count(GameHistory.id), func.sum(GameHistory.reward),
+            *(func.sum(case((GameHistory.dice_value == value, 1), else_=0)) for value in range(1, 7))
+        ).where(*in_batch).group_by(day, GameHistory.user_id, game_type)
+        
+        totals = ["plays", "reward", *DICE_COLUMNS]
+        stmt = self._insert(GameHistoryDaily).from_select(["day", "user_id", "game_type", *totals], aggregate)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "day", "game_type"],
+            set_={column: getattr(GameHistoryDaily, column) + getattr(stmt.excluded, column) for column in totals}
+        )
+        await session.execute(stmt)
+        
+        result = await session.execute(
+            delete(GameHistory).where(*in_batch).execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+    
+    async def compact_game_history(self, raw_days: int = None, batch_size: int = None) -> int:
+        """Fold game history older than raw_days into per-user daily aggregates.
+        
+        Rows are aggregated, upserted into game_history_daily and deleted in
+        batches, each in one transaction, so an interrupted run loses no
+        plays and the next run continues with the remaining rows. Only whole
+        days are folded. Once game history has been exported to Parquet,
+        rows after the export watermark are kept until the export has
+        written them. Returns the number of rows folded.
+        """
+        from sqlalchemy import select
+        
+        raw_days = raw_days if raw_days is not None else GAME_HISTORY_SETTINGS["raw_days"]
+        batch_size = batch_size or GAME_HISTORY_SETTINGS["batch_size"]
+        cutoff = (datetime.utcnow() - timedelta(days=raw_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        folded = 0
+        
+        async with self.session_factory() as session:
+            exported_id = (await session.execute(
+                select(Watermark.last_id).where(Watermark.name == EXPORT_WATERMARK.format(table="game_history"))
+            )).scalar()
+        
+        while True:
+            async with self.write_session() as session:
+                row_count = await self._compact_game_history_batch(session, batch_size, cutoff, exported_id)
+                await session.commit()
+            folded += row_count
+            if row_count == 0:
+                break
+            # Re-read cached stats from the new split of raw and daily rows
+            self.game_stats.clear()
+        
+        return folded
+    
+    def _game_history_tiers(self, user_id: Optional[int] = None, since: Optional[datetime] = None):
+        """Get a subquery of game history from both tiers, one row per raw play or daily aggregate.
+        
+        Columns are day, user_id, game_type, plays, reward and dice_1 to
+        dice_6; aggregate rows count from the start of their day.
+        """
+        from sqlalchemy import case, func, literal, select, union_all
+        
+        raw = select(
+            GameHistory.played_at.label("day"), GameHistory.user_id,
+            func.coalesce(GameHistory.game_type, "dice").label("game_type"),
+            literal(1).label("plays"), GameHistory.reward,
+            *(case((GameHistory.dice_value == value, 1), else_=0).label(column)
+              for value, column in enumerate(DICE_COLUMNS, 1))
+        )
+        daily = select(
+            GameHistoryDaily.day, GameHistoryDaily.user_id, GameHistoryDaily.game_type,
+            GameHistoryDaily.plays, GameHistoryDaily.reward,
+            *(getattr(GameHistoryDaily, column) for column in DICE_COLUMNS)
+        )
+        if user_id is not None:
+            raw = raw.where(GameHistory.user_id == user_id)
+            daily = daily.where(GameHistoryDaily.user_id == user_id)
+        if since is not None:
+            raw = raw.where(GameHistory.played_at >= since)
+            daily = daily.where(GameHistoryDaily.day >= since.replace(hour=0, minute=0, second=0, microsecond=0))
+        return union_all(raw, daily).subquery()
+    
+    @guarded("read")
+    async def get_game_stats(self, user_id: Optional[int] = None, since: Optional[datetime] = None) -> Dict:
+        """Get plays, reward total and dice value distribution, from raw and compacted history.
+        
+        With ``since``, compacted days are included from the start of the
+        day ``since`` falls on.
+        """
+        from sqlalchemy import func, select
+        
+        tiers = self._game_history_tiers(user_id, since)
+        stmt = select(
+            func.coalesce(func.sum(tiers.c.plays), 0), func.coalesce(func.sum(tiers.c.reward), 0.0),
+            *(func.coalesce(func.sum(tiers.c[column]), 0) for column in DICE_COLUMNS)
+        )
+        
+        async with self.session_factory() as session:
+            plays, reward, *dice = (await session.execute(stmt)).one()
+        return {
+            "plays": int(plays),
+            "reward": float(reward),
+            "dice": {value: int(count) for value, count in enumerate(dice, 1)},
+        }
+    
+    async def get_user_game_stats(self, user_id: int) -> Dict:
+        """Get a user's all-time game stats for the profile, from cache when possible.
+        
+        record_dice_roll publishes UserUpdated, which drops the cached stats.
+        """
+        stats = self.game_stats.get(user_id)
+        if stats is None:
+            generation = self.game_stats.generation
+            stats = await self.get_game_stats(user_id)
+            self.game_stats.put(user_id, stats, generation)
+        return stats
+    
+    async def load_eligibility_index(self, chunk_size: int = 10000) -> int:
+        """Bulk load the current tenant's eligibility index from the users table.
+        
+        The new index replaces the old one when loading finishes, so updates
+        made to the old index meanwhile are lost; call this at startup.
+        Returns the number of indexed users.
+        """
+        from sqlalchemy import select
+        
+        stmt = select(
+            User.user_id, User.last_dice_roll, User.last_daily_bonus, User.daily_rolls_count
+        ).order_by(User.user_id)
+        
+        index = EligibilityIndex()
+        async with self.session_factory() as session:
+            result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+            async for partition in result.partitions(chunk_size):
+                index.extend(partition)
+        
+        self._eligibility[current_tenant.get()] = index
+        return len(index)
+    
+    async def iter_table_rows(self, table_name: str, start: Optional[datetime] = None,
+                              end: Optional[datetime] = None,
+                              chunk_size: int = 1000,
+                              after_id: Optional[int] = None) -> AsyncGenerator[List[Dict], None]:
+        """Stream rows of an exportable table in fixed-size chunks, in id order.
+        
+        Rows are fetched through a server-side cursor, so only one chunk is
+        held in memory at a time. ``start`` is inclusive, ``end`` exclusive;
+        ``after_id`` skips rows up to and including that id.
+        """
+        from sqlalchemy import select
+        
+        model, date_column = EXPORT_TABLES[table_name]
+        stmt = select(*model.__table__.columns).order_by(model.id)
+        if start:
+            stmt = stmt.where(date_column >= start)
+        if end:
+            stmt = stmt.where(date_column < end)
+        if after_id:
+            stmt = stmt.where(model.id > after_id)
+        
+        async with self.session_factory() as session:
+            result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+            async for partition in result.mappings().partitions(chunk_size):
+                yield [dict(row) for row in partition]
 
 
 # Global database instance
@@ -0,0 +1,116 @@
+"""
+Compact in-memory index of dice roll and daily bonus eligibility.
+"""
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Daily roll counts are stored in one byte
+MAX_ROLL_COUNT = 255
+
+
+class Eligibility(NamedTuple):
+    """Cooldown state of a user.
+
+    Has the User fields read by can_roll_dice, get_daily_rolls and
+    can_claim_daily_bonus, so it can be passed to them in place of a user.
+    """
+    last_dice_roll: Optional[datetime]
+    last_daily_bonus: Optional[datetime]
+    daily_rolls_count: int
+
+
+def _to_seconds(value: Optional[datetime]) -> int:
+    """Convert a naive UTC datetime to whole epoch seconds (0 for None)."""
+    if value is None:
+        return 0
+    return int((value - _EPOCH).total_seconds())
+
+
+def _from_seconds(seconds: int) -> Optional[datetime]:
+    """Convert epoch seconds back to a naive UTC datetime."""
+    return _EPOCH + timedelta(seconds=seconds) if seconds else None
+
+
+class EligibilityIndex:
+    """Cooldown state of all users in parallel packed arrays.
+
+    Users are addressed by their position in a sorted array of Telegram
+    user ids (found with bisect), so an entry costs 17 bytes: the user id,
+    the last roll and last bonus as 32-bit epoch seconds and a one-byte
+    daily roll count. Timestamps are truncated to whole seconds, which can
+    only make a cooldown look shorter than it is.
+
+    The index only answers "too soon" without a database round trip.
+    Updates from other processes are not seen, so an index that looks
+    eligible must still be confirmed by the database write path, which
+    checks the locked row.
+    """
+
+    def __init__(self):
+        self._user_ids = array("q")
+        self._last_rolls = array("I")
+        self._last_bonuses = array("I")
+        self._roll_counts = array("B")
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+    def _position(self, user_id: int) -> int:
+        """Get the position of a user in the arrays, or -1 if missing."""
+        position = bisect_left(self._user_ids, user_id)
+        if position < len(self._user_ids) and self._user_ids[position] == user_id:
+            return position
+        return -1
+
+    def get(self, user_id: int) -> Optional[Eligibility]:
+        """Get the cooldown state of a user, or None if not indexed."""
+        position = self._position(user_id)
+        if position < 0:
+            return None
+        return Eligibility(
+            _from_seconds(self._last_rolls[position]),
+            _from_seconds(self._last_bonuses[position]),
+            self._roll_counts[position],
+        )
+
+    def update(self, user):
+        """Store the cooldown state of a user row or snapshot, adding it if missing."""
+        last_roll = _to_seconds(user.last_dice_roll)
+        last_bonus = _to_seconds(user.last_daily_bonus)
+        roll_count = min(user.daily_rolls_count or 0, MAX_ROLL_COUNT)
+
+        position = bisect_left(self._user_ids, user.user_id)
+        if position < len(self._user_ids) and self._user_ids[position] == user.user_id:
+            self._last_rolls[position] = last_roll
+            self._last_bonuses[position] = last_bonus
+            self._roll_counts[position] = roll_count
+        else:
+            self._user_ids.insert(position, user.user_id)
+            self._last_rolls.insert(position, last_roll)
+            self._last_bonuses.insert(position, last_bonus)
+            self._roll_counts.insert(position, roll_count)
+
+    def extend(self, rows: Iterable):
+        """Append (user_id, last_dice_roll, last_daily_bonus, daily_rolls_count) rows.
+
+        Rows must be sorted by user_id and follow the users already indexed.
+        """
+        for user_id, last_dice_roll, last_daily_bonus, daily_rolls_count in rows:
+            if self._user_ids and user_id <= self._user_ids[-1]:
+                raise ValueError(f"Rows must be sorted by user_id (got {user_id} after {self._user_ids[-1]})")
+            self._user_ids.append(user_id)
+            self._last_rolls.append(_to_seconds(last_dice_roll))
+            self._last_bonuses.append(_to_seconds(last_daily_bonus))
+            self._roll_counts.append(min(daily_rolls_count or 0, MAX_ROLL_COUNT))
+
+    def stats(self) -> Dict[str, int]:
+        """Get index size and memory use of the arrays."""
+        arrays = (self._user_ids, self._last_rolls, self._last_bonuses, self._roll_counts)
+        return {
+            "size": len(self._user_ids),
+            "bytes": sum(values.itemsize * len(values) for values in arrays),
+        }
@@ -0,0 +1,180 @@
+"""
+Cross-process event bus built on Postgres LISTEN/NOTIFY.
+"""
+import asyncio
+import json
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Type, Union
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.orm import Session
+from .tenancy import current_tenant, use_tenant
+from utils.logger import logger
+
+EVENT_CHANNEL = "bot_events"
+
+# Reconnect backoff of the listener connection (seconds)
+LISTEN_RETRY_MIN = 1
+LISTEN_RETRY_MAX = 60
+
+# Seconds between health checks of an idle listener connection
+LISTEN_KEEPALIVE = 30
+
+
+@dataclass(frozen=True)
+class ConfigChanged:
+    """A config value changed; key None means any key."""
+    name = "config_changed"
+    key: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class UserUpdated:
+    """A user row changed; user_id None means any user."""
+    name = "user_updated"
+    user_id: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class WithdrawalChanged:
+    """A withdrawal request was created or changed status."""
+    name = "withdrawal_changed"
+    request_id: int
+    user_id: int
+    status: str
+
+
+EVENT_TYPES: Dict[str, Type] = {
+    event_type.name: event_type for event_type in (ConfigChanged, UserUpdated, WithdrawalChanged)
+}
+
+# Events dispatched after a reconnect, when notifications may have been missed
+RESYNC_EVENTS = (ConfigChanged(), UserUpdated())
+
+
+class EventBus:
+    """Publish typed events on commit and deliver them to subscribers.
+
+    Events published in a session are sent with pg_notify, so Postgres
+    delivers them to other processes only if the transaction commits. The
+    publishing process dispatches them to its own subscribers right after
+    commit and ignores its own notifications. On SQLite (single process)
+    events are only dispatched in-process.
+
+    Subscribers are plain functions called on the event loop; they must be
+    quick and must not do I/O (e.g. drop a cache entry). Notifications carry
+    the publisher's tenant, and subscribers run with it as current_tenant.
+    """
+
+    def __init__(self, notify: bool = True):
+        self.notify = notify
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.connected = False
+        self._subscribers: Dict[Type, List[Callable]] = {}
+
+    def subscribe(self, event_type: Type, callback: Callable):
+        """Call callback with every event of the given type."""
+        self._subscribers.setdefault(event_type, []).append(callback)
+
+    def dispatch(self, event):
+        """Deliver an event to in-process subscribers."""
+        for callback in self._subscribers.get(type(event), []):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Event subscriber {callback.__name__} failed on {event}: {e}")
+
+    def payload(self, event) -> str:
+        """Get the notification payload of an event."""
+        return json.dumps({
+            "type": event.name,
+            "origin": self.origin,
+            "tenant": current_tenant.get(),
+            "data": asdict(event),
+        })
+
+    async def publish(self, session: Union[AsyncSession, AsyncConnection], event, notified: bool = False):
+        """Publish an event when the session's (or connection's) transaction commits.
+
+        Pass notified=True when the caller already sent pg_notify(EVENT_CHANNEL,
+        payload(event)) as part of its own statement, to save a round trip.
+        """
+        if self.notify and not notified:
+            await session.execute(select(func.pg_notify(EVENT_CHANNEL, self.payload(event))))
+        if isinstance(session, AsyncSession):
+            session.sync_session.info.setdefault("pending_events", []).append((self, event))
+
+    def _on_notification(self, connection, pid, channel, payload):
+        """Dispatch an event received from another process."""
+        try:
+            message = json.loads(payload)
+            if message["origin"] == self.origin:
+                return
+            with use_tenant(message.get("tenant")):
+                self.dispatch(EVENT_TYPES[message["type"]](**message["data"]))
+        except Exception as e:
+            logger.error(f"Invalid event notification {payload!r}: {e}")
+
+    async def listen(self, url):
+        """Receive events from other processes, reconnecting on failure.
+
+        Notifications sent while disconnected are lost, so every reconnect
+        dispatches RESYNC_EVENTS to make subscribers drop cached state.
+        """
+        import asyncpg
+
+        dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+        retry_delay = LISTEN_RETRY_MIN
+        first_connect = True
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                terminated = asyncio.Event()
+                connection.add_termination_listener(lambda _: terminated.set())
+                await connection.add_listener(EVENT_CHANNEL, self._on_notification)
+
+                self.connected = True
+                retry_delay = LISTEN_RETRY_MIN
+                logger.info(f"Listening for events on channel {EVENT_CHANNEL}")
+                if not first_connect:
+                    for resync_event in RESYNC_EVENTS:
+                        self.dispatch(resync_event)
+                first_connect = False
+
+                # Wait for the connection to drop, checking it while idle
+                while not terminated.is_set():
+                    try:
+                        await asyncio.wait_for(terminated.wait(), LISTEN_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        await connection.execute("SELECT 1")
+                logger.warning("Event listener connection closed")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event listener failed: {e}")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+
+            logger.info(f"Reconnecting event listener in {retry_delay}s")
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, LISTEN_RETRY_MAX)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending_events(session):
+    """Dispatch events published in a committed transaction."""
+    for bus, pending_event in session.info.pop("pending_events", []):
+        bus.dispatch(pending_event)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_events(session):
+    """Drop events published in a rolled back transaction."""
+    session.info.pop("pending_events", None)
@@ -3,7 +3,7 @@ Database models for the Telegram bot.
 """
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Index, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -28,6 +28,27 @@ class User(Base):
     last_daily_bonus = Column(DateTime, nullable=True)
     daily_rolls_count = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
+    reminders_enabled = Column(Boolean, nullable=True)  # Opt-in "bonus ready" reminders
+    
+    __table_args__ = (
+        # Reminder schedules are rebuilt from opted-in users only
+        Index(
+            "ix_users_reminders_enabled", "user_id",
+            postgresql_where=text("reminders_enabled = true"),
+            sqlite_where=text("reminders_enabled = 1"),
+        ),
+        # Admin search: trigram indexes on Postgres, case-insensitive prefix indexes on SQLite
+        Index(
+            "ix_users_username_trgm", "username",
+            postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_users_first_name_trgm", "first_name",
+            postgresql_using="gin", postgresql_ops={"first_name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index("ix_users_username_nocase", text("username COLLATE NOCASE")).ddl_if(dialect="sqlite"),
+        Index("ix_users_first_name_nocase", text("first_name COLLATE NOCASE")).ddl_if(dialect="sqlite"),
+    )
     
     # Relationships
     transactions = relationship("Transaction", back_populates="user")
@@ -44,10 +65,15 @@ class Transaction(Base):
     transaction_type = Column(String(50), nullable=False)  # game, bonus, referral, withdrawal
     amount = Column(Float, nullable=False)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     user = relationship("User", back_populates="transactions")
+    
+    __table_args__ = (
+        # Keyset pagination of a user's history
+        Index("ix_transactions_user_created_id", "user_id", "created_at", "id"),
+    )
 
 
 class GameHistory(Base):
@@ -63,6 +89,34 @@ class GameHistory(Base):
     
     # Relationships
     user = relationship("User", back_populates="game_history")
+    
+    __table_args__ = (
+        # History of a user, and the rows due for downsampling
+        Index("ix_game_history_user_played", "user_id", "played_at"),
+    )
+
+
+class GameHistoryDaily(Base):
+    """Per-user daily aggregate of game history rows older than the raw retention."""
+    __tablename__ = "game_history_daily"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    game_type = Column(String(50), nullable=False)
+    plays = Column(Integer, default=0)
+    reward = Column(Float, default=0.0)
+    # Dice value distribution
+    dice_1 = Column(Integer, default=0)
+    dice_2 = Column(Integer, default=0)
+    dice_3 = Column(Integer, default=0)
+    dice_4 = Column(Integer, default=0)
+    dice_5 = Column(Integer, default=0)
+    dice_6 = Column(Integer, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "game_type", name="uq_game_history_daily_user_day_game"),
+    )
 
 
 class WithdrawRequest(Base):
@@ -72,13 +126,20 @@ class WithdrawRequest(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     amount = Column(Float, nullable=False)
-    status = Column(String(20), default="pending")  # pending, paid, rejected
-    created_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String(20), default="pending")  # pending, processing, paid, rejected
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     processed_at = Column(DateTime, nullable=True)
     admin_notes = Column(Text, nullable=True)
+    claimed_by = Column(String(100), nullable=True)  # Worker processing the request
+    lease_expires_at = Column(DateTime, nullable=True)
     
     # Relationships
     user = relationship("User", back_populates="withdraw_requests")
+    
+    __table_args__ = (
+        # Recent withdrawals of a user (admin search)
+        Index("ix_withdraw_requests_user_created", "user_id", "created_at"),
+    )
 
 
 class Config(Base):
@@ -88,4 +149,54 @@ class Config(Base):
     id = Column(Integer, primary_key=True, index=True)
     key = Column(String(100), unique=True, nullable=False)
     value = Column(Text, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Watermark(Base):
+    """Watermark model for tracking progress of incremental jobs."""
+    __tablename__ = "watermarks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, nullable=False)
+    last_id = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ActivityRollup(Base):
+    """Activity rollup model for pre-aggregated time-series metrics."""
+    __tablename__ = "activity_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String(10), nullable=False)  # hour, day
+    bucket = Column(DateTime, nullable=False)
+    metric = Column(String(50), nullable=False)
+    value = Column(Float, default=0.0)
+    
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket", "metric", name="uq_activity_rollups_bucket_metric"),
+    )
+
+
+class DailyActiveUser(Base):
+    """Daily active user model for counting distinct users per day."""
+    __tablename__ = "daily_active_users"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("day", "user_id", name="uq_daily_active_users_day_user"),
+    )
+
+
+class LedgerCheckpoint(Base):
+    """Ledger checkpoint model for incremental balance reconciliation."""
+    __tablename__ = "ledger_checkpoints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, unique=True, nullable=False)
+    last_transaction_id = Column(Integer, default=0)
+    balance_at_checkpoint = Column(Float, default=0.0)
+    drift = Column(Float, default=0.0)  # Total unexplained balance change found so far
+    checked_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,25 @@
+"""
+Tenant selection for serving several bots from one database.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Schema of the bot whose update or job is being processed; None is the
+# default schema, used by the main bot (BOT_TOKEN) and by scripts
+current_tenant: ContextVar[Optional[str]] = ContextVar("current_tenant", default=None)
+
+
+def tenant_schema(bot_id: int) -> str:
+    """Get the database schema name of a white-label bot."""
+    return f"bot_{bot_id}"
+
+
+@contextmanager
+def use_tenant(tenant: Optional[str]) -> Iterator[None]:
+    """Run database operations of the block in a tenant's schema."""
+    token = current_tenant.set(tenant)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
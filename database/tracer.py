@@ -0,0 +1,161 @@
+"""
+Per-update query tracing and query budgets.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from config import QUERY_BUDGET
+from utils.logger import logger
+from utils.routing import handler_name
+from .db import engine
+
+# Statement text kept per traced query for budget reports
+STATEMENT_PREVIEW = 200
+
+
+class QueryBudgetExceeded(Exception):
+    """A handler or block ran more queries than its budget allows."""
+
+
+class QueryTrace:
+    """Queries run while a trace is active.
+
+    ``statements`` counts cursor executions: an executemany counts once, so
+    budgets do not penalise batching. ``parameter_sets`` counts the rows of
+    parameters they sent.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.statements = 0
+        self.parameter_sets = 0
+        self.seconds = 0.0
+        self.queries: List[str] = []
+
+    def summary(self) -> str:
+        """Get a one-line summary of the trace."""
+        return f"{self.statements} statements, {self.parameter_sets} parameter sets, {self.seconds * 1000:.1f}ms"
+
+    def report(self) -> str:
+        """Get the summary followed by the traced statements."""
+        lines = [self.summary()]
+        lines.extend(f"  {index}. {query}" for index, query in enumerate(self.queries, 1))
+        return "\n".join(lines)
+
+
+# Trace of the update (or block) being processed
+current_trace: ContextVar[Optional[QueryTrace]] = ContextVar("current_trace", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Count a statement of the current trace."""
+    trace = current_trace.get()
+    if trace is None:
+        return
+    trace.statements += 1
+    trace.parameter_sets += len(parameters) if executemany and parameters else 1
+    trace.queries.append(" ".join(statement.split())[:STATEMENT_PREVIEW])
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Add the statement's execution time to the current trace."""
+    trace = current_trace.get()
+    started = conn.info.get("query_started_at")
+    if trace is None or not started:
+        return
+    trace.seconds += time.perf_counter() - started.pop()
+
+
+@contextmanager
+def trace_queries(name: Optional[str] = None) -> Iterator[QueryTrace]:
+    """Trace the queries run inside the block (including awaited calls)."""
+    trace = QueryTrace(name)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int, name: Optional[str] = None) -> Iterator[QueryTrace]:
+    """Fail if the block runs more than limit statements.
+
+    For tests::
+
+        with assert_max_queries(2):
+            await db.claim_daily_bonus(user_id, 100)
+    """
+    with trace_queries(name) as trace:
+        yield trace
+    if trace.statements > limit:
+        raise AssertionError(f"{name or 'Block'} ran more than {limit} queries: {trace.report()}")
+
+
+class QueryTracer(BaseMiddleware):
+    """Trace the queries of each handler and enforce query budgets.
+
+    Registered as an inner middleware, so traces are attributed to the
+    handler that processed the update. Totals are kept per handler. A
+    handler whose update ran more statements than its budget
+    (QUERY_BUDGET in config.py) is logged, or fails with
+    QueryBudgetExceeded when the mode is "raise" (for development and CI).
+    """
+
+    def __init__(self, budget: Dict[str, Any] = QUERY_BUDGET):
+        self.default_limit = budget["default"]
+        self.limits: Dict[str, int] = dict(budget.get("handlers", {}))
+        self.mode = budget.get("mode", "log")
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def limit_for(self, name: str) -> int:
+        """Get the statement budget of a handler."""
+        return self.limits.get(name, self.default_limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = handler_name(data) or "unknown"
+
+        with trace_queries(name) as trace:
+            result = await handler(event, data)
+
+        stats = self.stats.setdefault(name, {"updates": 0, "statements": 0, "parameter_sets": 0,
+                                             "seconds": 0.0, "max_statements": 0, "over_budget": 0})
+        stats["updates"] += 1
+        stats["statements"] += trace.statements
+        stats["parameter_sets"] += trace.parameter_sets
+        stats["seconds"] += trace.seconds
+        stats["max_statements"] = max(stats["max_statements"], trace.statements)
+
+        limit = self.limit_for(name)
+        if trace.statements > limit:
+            stats["over_budget"] += 1
+            message = f"Handler {name} exceeded its query budget of {limit}: {trace.report()}"
+            if self.mode == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return result
+
+    def top_handlers(self, limit: int = 10) -> List[tuple]:
+        """Get (handler, stats) sorted by average statements per update."""
+        return sorted(
+            self.stats.items(),
+            key=lambda item: item[1]["statements"] / item[1]["updates"],
+            reverse=True
+        )[:limit]
+
+
+# Global query tracer instance
+query_tracer = QueryTracer()
@@ -0,0 +1,233 @@
+"""
+Incremental Parquet export of the transaction ledger and game history.
+Appends rows added since the last run to date-partitioned Parquet files,
+so analytics can run on columnar files instead of the production database.
+
+Usage:
+    python export_parquet.py
+    python export_parquet.py --out /data/analytics --compact
+    python export_parquet.py --tables game_history --bot-id 123456789
+
+Layout:
+    <out>/<table>/date=YYYY-MM-DD/part-<first id>-<last id>.parquet
+    <out>/_watermarks.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Boolean, DateTime, Float, Integer
+from database.db import db, EXPORT_TABLES, ROLLUP_LAG_SECONDS
+from database.tenancy import tenant_schema, use_tenant
+from utils.logger import logger
+
+# Tables exported to Parquet
+PARQUET_TABLES = ("transactions", "game_history")
+
+# Rows fetched from the database per round trip
+FETCH_SIZE = 10000
+
+# Rows collected before Parquet files are written
+BATCH_ROWS = 200000
+
+WATERMARK_FILE = "_watermarks.json"
+PART_PATTERN = re.compile(r"^part-(\d+)-(\d+)\.parquet$")
+
+
+def arrow_schema(table_name: str) -> pa.Schema:
+    """Build the Arrow schema of a table from its model columns."""
+    model, _ = EXPORT_TABLES[table_name]
+    fields = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, Integer):
+            field_type = pa.int64()
+        elif isinstance(column.type, Float):
+            field_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            field_type = pa.timestamp("us")
+        elif isinstance(column.type, Boolean):
+            field_type = pa.bool_()
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(column.name, field_type))
+    return pa.schema(fields)
+
+
+def read_watermarks(out_dir: str) -> Dict[str, int]:
+    """Read the last exported id of each table."""
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as stream:
+        return {name: entry["last_id"] for name, entry in json.load(stream).items()}
+
+
+def write_watermarks(out_dir: str, watermarks: Dict[str, int]):
+    """Atomically replace the watermark file."""
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    updated_at = datetime.utcnow().isoformat()
+    with open(f"{path}.tmp", "w", encoding="utf-8") as stream:
+        json.dump({name: {"last_id": last_id, "updated_at": updated_at} for name, last_id in watermarks.items()},
+                  stream, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def list_parts(table_dir: str) -> Dict[str, List[Tuple[int, int, str]]]:
+    """Get (first id, last id, path) of the part files of each date partition."""
+    partitions = {}
+    if not os.path.isdir(table_dir):
+        return partitions
+    for partition in sorted(os.listdir(table_dir)):
+        partition_dir = os.path.join(table_dir, partition)
+        if not partition.startswith("date=") or not os.path.isdir(partition_dir):
+            continue
+        parts = []
+        for name in os.listdir(partition_dir):
+            match = PART_PATTERN.match(name)
+            if match:
+                parts.append((int(match.group(1)), int(match.group(2)), os.path.join(partition_dir, name)))
+        partitions[partition] = sorted(parts)
+    return partitions
+
+
+def write_part(table: pa.Table, partition_dir: str):
+    """Write a table of rows sorted by id as one part file, atomically."""
+    ids = table.column("id")
+    path = os.path.join(partition_dir, f"part-{ids[0].as_py()}-{ids[-1].as_py()}.parquet")
+    os.makedirs(partition_dir, exist_ok=True)
+    pq.write_table(table, f"{path}.tmp", compression="zstd")
+    os.replace(f"{path}.tmp", path)
+
+
+def write_batch(rows: List[Dict], schema: pa.Schema, table_dir: str, date_column: str) -> int:
+    """Write a batch of rows sorted by id to one new part file per date."""
+    by_date: Dict[str, List[Dict]] = {}
+    for row in rows:
+        day = row[date_column].date().isoformat() if row[date_column] else "unknown"
+        by_date.setdefault(day, []).append(row)
+
+    for day, day_rows in by_date.items():
+        write_part(pa.Table.from_pylist(day_rows, schema=schema), os.path.join(table_dir, f"date={day}"))
+    return len(by_date)
+
+
+async def export_table(table_name: str, out_dir: str, after_id: int) -> Tuple[int, int]:
+    """Export rows of a table added after after_id.
+
+    Rows younger than ROLLUP_LAG_SECONDS are left for the next run, so rows
+    that commit slightly out of id order are not skipped. Each batch is
+    written before the watermark moves past it; the watermark is also
+    saved in the database, where game history compaction waits for it.
+    Returns the number of exported rows and the new watermark.
+    """
+    _, date_column = EXPORT_TABLES[table_name]
+    schema = arrow_schema(table_name)
+    table_dir = os.path.join(out_dir, table_name)
+    cutoff = datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+
+    # Part files written by a run that stopped before saving its watermark
+    for parts in list_parts(table_dir).values():
+        for _, last_id, _ in parts:
+            after_id = max(after_id, last_id)
+
+    exported = 0
+    batch: List[Dict] = []
+
+    async def flush():
+        nonlocal exported, after_id, batch
+        # Parquet encoding is CPU-bound, keep it off the event loop
+        files = await asyncio.to_thread(write_batch, batch, schema, table_dir, date_column.name)
+        exported += len(batch)
+        after_id = batch[-1]["id"]
+        watermarks = read_watermarks(out_dir)
+        watermarks[table_name] = after_id
+        write_watermarks(out_dir, watermarks)
+        # Lets game history compaction delete the rows written so far
+        await db.save_export_watermark(table_name, after_id)
+        logger.info(f"Exported {len(batch)} {table_name} rows into {files} files (up to id {after_id})")
+        batch = []
+
+    async for rows in db.iter_table_rows(table_name, end=cutoff, chunk_size=FETCH_SIZE, after_id=after_id):
+        batch.extend(rows)
+        if len(batch) >= BATCH_ROWS:
+            await flush()
+    if batch:
+        await flush()
+
+    return exported, after_id
+
+
+def compact_table(table_dir: str, schema: pa.Schema, min_files: int = 2) -> int:
+    """Merge the part files of each date partition into a single file.
+
+    The merged file is written before the parts are removed. Parts whose id
+    range is covered by another file (left by an interrupted compaction)
+    are removed without being merged again. Returns the number of removed
+    part files.
+    """
+    removed = 0
+    for partition, parts in list_parts(table_dir).items():
+        kept = []
+        for first_id, last_id, path in parts:
+            if any(other_first <= first_id and last_id <= other_last and other_path != path
+                   for other_first, other_last, other_path in parts):
+                os.remove(path)
+                removed += 1
+            else:
+                kept.append((first_id, last_id, path))
+
+        if len(kept) < min_files:
+            continue
+
+        table = pa.concat_tables([pq.read_table(path, schema=schema) for _, _, path in kept])
+        write_part(table.sort_by("id"), os.path.join(table_dir, partition))
+        for _, _, path in kept:
+            os.remove(path)
+        removed += len(kept)
+        logger.info(f"Compacted {len(kept)} files of {table_dir}/{partition}")
+    return removed
+
+
+async def main():
+    """Main export function."""
+    parser = argparse.ArgumentParser(description="Export new ledger and game rows to Parquet.")
+    parser.add_argument("--out", default="analytics", help="Output directory (default: analytics)")
+    parser.add_argument("--tables", nargs="+", choices=PARQUET_TABLES, default=list(PARQUET_TABLES),
+                        help="Tables to export (default: all)")
+    parser.add_argument("--compact", action="store_true", help="Merge part files of each date partition")
+    parser.add_argument("--bot-id", type=int, help="Export the schema of a white-label bot (Postgres only)")
+    args = parser.parse_args()
+
+    if args.bot_id and db.is_sqlite:
+        parser.error("--bot-id requires PostgreSQL")
+    tenant = tenant_schema(args.bot_id) if args.bot_id else None
+    out_dir = os.path.join(args.out, tenant) if tenant else args.out
+    os.makedirs(out_dir, exist_ok=True)
+
+    try:
+        with use_tenant(tenant):
+            for table_name in args.tables:
+                started_at = time.monotonic()
+                after_id = read_watermarks(out_dir).get(table_name, 0)
+                exported, last_id = await export_table(table_name, out_dir, after_id)
+                print(f"✅ {table_name}: exported {exported} rows in {time.monotonic() - started_at:.1f}s "
+                      f"(watermark {last_id})")
+
+                if args.compact:
+                    removed = await asyncio.to_thread(
+                        compact_table, os.path.join(out_dir, table_name), arrow_schema(table_name)
+                    )
+                    print(f"🗜️ {table_name}: compacted {removed} part files")
+    except Exception as e:
+        logger.error(f"❌ Parquet export failed: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
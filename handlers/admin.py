@@ -1,25 +1,47 @@
 """
 Admin-related handlers for the Telegram bot.
 """
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+import html
+import os
+import tempfile
+from datetime import datetime, timedelta
+from aiogram import Router, Dispatcher
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import db
-from utils.helpers import is_admin, format_currency, format_user_profile, format_withdrawal_request
-from utils.keyboards import get_admin_panel_keyboard, get_settings_keyboard, get_cancel_keyboard
+from config import WITHDRAWAL_QUEUE
+from database.db import db, EXPORT_TABLES
+from database.tracer import query_tracer
+from utils.helpers import (
+    is_admin, format_currency, format_datetime, format_user_profile, format_withdrawal_request, format_sparkline,
+    get_withdrawal_worker, WITHDRAWAL_STATUS_EMOJI
+)
+from utils.keyboards import (
+    get_admin_panel_keyboard, get_settings_keyboard, get_cancel_keyboard, get_admin_withdrawal_keyboard,
+    get_pending_withdrawals_keyboard
+)
+from utils.export import export_table, EXPORT_FORMATS
 from utils.logger import logger
+from utils.middlewares import callback_coalescer, degraded_mode
+from utils.profiler import handler_profiler, handler_names, MAX_PROFILE_SECONDS
+from utils.routing import routes
 
 router = Router()
 
+# Users shown per /find search (one message)
+FIND_RESULTS = 5
+
+# Open withdrawal requests listed on the pending withdrawals screen
+PENDING_WITHDRAWALS_SHOWN = 20
+
 
 class AdminStates(StatesGroup):
     waiting_for_broadcast = State()
     waiting_for_setting_value = State()
 
 
-@router.message(F.text == "⚙️ Admin Panel")
+@routes.text("⚙️ Admin Panel")
 async def admin_panel_handler(message: Message):
     """Handle admin panel command."""
     user_id = message.from_user.id
@@ -29,12 +51,16 @@ async def admin_panel_handler(message: Message):
         return
     
     admin_text = "⚙️ <b>Admin Panel</b>\n\n"
-    admin_text += "Select an option below:"
+    admin_text += "Select an option below:\n\n"
+    admin_text += "📤 Exports: <code>/export transactions|game_history|withdraw_requests|users [csv|jsonl] [from YYYY-MM-DD] [to YYYY-MM-DD]</code>\n"
+    admin_text += "🔬 Profiling: <code>/profile SECONDS|UPDATESu [handler]</code>\n"
+    admin_text += "🧮 Query budgets: <code>/queries</code>\n"
+    admin_text += "🔎 Find users: <code>/find ID|@username|name</code>"
     
     await message.answer(admin_text, reply_markup=get_admin_panel_keyboard(), parse_mode="HTML")
 
 
-@router.callback_query(F.data == "admin_panel")
+@routes.callback("admin_panel")
 async def admin_panel_callback(callback: CallbackQuery):
     """Handle admin panel callback."""
     user_id = callback.from_user.id
@@ -50,7 +76,7 @@ async def admin_panel_callback(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_all_users")
+@routes.callback("admin_all_users")
 async def admin_all_users_callback(callback: CallbackQuery):
     """Handle admin all users callback."""
     user_id = callback.from_user.id
@@ -78,9 +104,12 @@ async def admin_all_users_callback(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_pending_withdrawals")
+@routes.callback("admin_pending_withdrawals")
 async def admin_pending_withdrawals_callback(callback: CallbackQuery):
-    """Handle admin pending withdrawals callback."""
+    """Handle admin pending withdrawals callback.
+    
+    Only lists open requests; taking a batch to work on is a separate button.
+    """
     user_id = callback.from_user.id
     
     if not is_admin(user_id):
@@ -90,21 +119,63 @@ async def admin_pending_withdrawals_callback(callback: CallbackQuery):
     withdrawals = await db.get_pending_withdrawals()
     
     if not withdrawals:
-        await callback.message.edit_text("💸 <b>Pending Withdrawals</b>\n\nNo pending withdrawals found.")
+        await callback.message.edit_text("💸 <b>Pending Withdrawals</b>\n\nNo pending withdrawals found.", parse_mode="HTML")
+        await callback.answer()
         return
     
-    withdrawals_text = "💸 <b>Pending Withdrawals</b>\n\n"
-    for withdrawal in withdrawals[:10]:  # Show first 10
-        withdrawals_text += f"🆔 Request #{withdrawal.id}\n"
-        withdrawals_text += f"👤 User: {withdrawal.user_id}\n"
-        withdrawals_text += f"💰 Amount: {format_currency(withdrawal.amount)}\n"
-        withdrawals_text += f"📅 Date: {withdrawal.created_at.strftime('%Y-%m-%d %H:%M')}\n\n"
+    worker = get_withdrawal_worker(user_id)
+    now = datetime.utcnow()
+    withdrawals_text = f"💸 <b>Pending Withdrawals</b> ({len(withdrawals)})\n\n"
+    for withdrawal in withdrawals[:PENDING_WITHDRAWALS_SHOWN]:
+        withdrawals_text += f"🆔 #{withdrawal.id} 👤 {withdrawal.user_id} 💰 {format_currency(withdrawal.amount)}"
+        if withdrawal.status == "processing" and withdrawal.lease_expires_at > now:
+            withdrawals_text += " (yours)" if withdrawal.claimed_by == worker else " 🔒"
+        withdrawals_text += "\n"
+    if len(withdrawals) > PENDING_WITHDRAWALS_SHOWN:
+        withdrawals_text += f"... and {len(withdrawals) - PENDING_WITHDRAWALS_SHOWN} more\n"
+    
+    lease_minutes = WITHDRAWAL_QUEUE["lease_seconds"] // 60
+    withdrawals_text += f"\nTake a batch to work on it for {lease_minutes} minutes; "
+    withdrawals_text += "other admins do not get the same requests."
+    await callback.message.edit_text(withdrawals_text, reply_markup=get_pending_withdrawals_keyboard(), parse_mode="HTML")
+    await callback.answer()
+
+
+@routes.callback("admin_take_withdrawals")
+@degraded_mode.money_action
+async def admin_take_withdrawals_callback(callback: CallbackQuery):
+    """Handle admin take withdrawals batch callback."""
+    user_id = callback.from_user.id
+    
+    if not is_admin(user_id):
+        await callback.answer("❌ Access denied. Admin only.")
+        return
     
+    # Claim a batch so parallel admins never get the same requests
+    withdrawals = await db.claim_withdrawals(get_withdrawal_worker(user_id))
+    
+    if not withdrawals:
+        await callback.message.edit_text("💸 <b>Pending Withdrawals</b>\n\nNo unclaimed withdrawals left.", parse_mode="HTML")
+        await callback.answer()
+        return
+    
+    lease_minutes = WITHDRAWAL_QUEUE["lease_seconds"] // 60
+    withdrawals_text = "💸 <b>Pending Withdrawals</b>\n\n"
+    withdrawals_text += f"Claimed {len(withdrawals)} request(s) for you for {lease_minutes} minutes. "
+    withdrawals_text += "Unfinished requests return to the queue afterwards."
     await callback.message.edit_text(withdrawals_text, reply_markup=get_cancel_keyboard(), parse_mode="HTML")
+    
+    for withdrawal in withdrawals:
+        request_text = f"🆔 Request #{withdrawal.id}\n"
+        request_text += f"👤 User: {withdrawal.user_id}\n"
+        request_text += f"💰 Amount: {format_currency(withdrawal.amount)}\n"
+        request_text += f"📅 Date: {withdrawal.created_at.strftime('%Y-%m-%d %H:%M')}"
+        await callback.message.answer(request_text, reply_markup=get_admin_withdrawal_keyboard(withdrawal.id))
+    
     await callback.answer()
 
 
-@router.callback_query(F.data == "admin_settings")
+@routes.callback("admin_settings")
 async def admin_settings_callback(callback: CallbackQuery):
     """Handle admin settings callback."""
     user_id = callback.from_user.id
@@ -132,8 +203,8 @@ async def admin_settings_callback(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("setting_"))
-async def admin_setting_callback(callback: CallbackQuery, state: FSMContext):
+@routes.callback_prefix("setting_")
+async def admin_setting_callback(callback: CallbackQuery, state: FSMContext, payload: str):
     """Handle admin setting modification callback."""
     user_id = callback.from_user.id
     
@@ -141,7 +212,7 @@ async def admin_setting_callback(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Access denied. Admin only.")
         return
     
-    setting_type = callback.data.replace("setting_", "")
+    setting_type = payload
     
     # Store setting type in state
     await state.update_data(setting_type=setting_type)
@@ -204,7 +275,7 @@ async def process_setting_value(message: Message, state: FSMContext):
         logger.error(f"Admin setting update error: {e}")
 
 
-@router.callback_query(F.data == "admin_broadcast")
+@routes.callback("admin_broadcast")
 async def admin_broadcast_callback(callback: CallbackQuery, state: FSMContext):
     """Handle admin broadcast callback."""
     user_id = callback.from_user.id
@@ -233,8 +304,7 @@ async def process_broadcast_message(message: Message, state: FSMContext):
     users = await db.get_all_users()
     
     # Send to all users
-    from aiogram import Bot
-    bot = Bot.get_current()
+    bot = message.bot
     
     sent_count = 0
     failed_count = 0
@@ -258,7 +328,7 @@ async def process_broadcast_message(message: Message, state: FSMContext):
     logger.info(f"Admin {user_id} sent broadcast to {sent_count} users")
 
 
-@router.callback_query(F.data == "admin_stats")
+@routes.callback("admin_stats")
 async def admin_stats_callback(callback: CallbackQuery):
     """Handle admin stats callback."""
     user_id = callback.from_user.id
@@ -286,14 +356,259 @@ async def admin_stats_callback(callback: CallbackQuery):
     stats_text += f"💎 Total Earned: {format_currency(total_earned)}\n"
     stats_text += f"⏳ Pending Withdrawals: {pending_withdrawals}\n"
     stats_text += f"💸 Pending Amount: {format_currency(pending_amount)}\n"
+    stats_text += f"🔁 Duplicate Taps Absorbed: {callback_coalescer.stats['coalesced']}\n"
+    stats_text += f"🗃️ User Cache Hit Rate: {db.user_cache.stats()['hit_rate']:.1%}\n"
+    eligibility_stats = db.eligibility.stats()
+    stats_text += f"🗂️ Eligibility Index: {eligibility_stats['size']} users ({eligibility_stats['bytes'] / 1024:.0f} KB)\n"
+    circuit_stats = db.circuit.stats
+    stats_text += (
+        f"🔌 Database: {'DEGRADED' if db.circuit.is_open else 'OK'} "
+        f"({circuit_stats['trips']} trips, {circuit_stats['timeouts']} timeouts, {circuit_stats['rejected']} rejected)\n"
+    )
     
     await callback.message.edit_text(stats_text, reply_markup=get_cancel_keyboard(), parse_mode="HTML")
     await callback.answer()
 
 
-@router.callback_query(F.data == "cancel_operation")
-async def cancel_operation_callback(callback: CallbackQuery, state: FSMContext):
-    """Handle cancel operation callback."""
-    await state.clear()
-    await callback.message.edit_text("❌ Operation cancelled.")
-    await callback.answer()
\ No newline at end of file
+@routes.callback("admin_trends")
+async def admin_trends_callback(callback: CallbackQuery):
+    """Handle admin trends callback."""
+    user_id = callback.from_user.id
+    
+    if not is_admin(user_id):
+        await callback.answer("❌ Access denied. Admin only.")
+        return
+    
+    now = datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    
+    daily = await db.get_rollups("day", today - timedelta(days=6))
+    hourly = await db.get_rollups("hour", current_hour - timedelta(hours=23))
+    
+    trends_text = "📈 <b>Trends (last 7 days)</b>\n\n"
+    for offset in range(6, -1, -1):
+        day = today - timedelta(days=offset)
+        metrics = daily.get(day, {})
+        trends_text += f"📅 <b>{day.strftime('%m-%d')}</b>: "
+        trends_text += f"👥 {int(metrics.get('active_users', 0))} active, "
+        trends_text += f"🆕 {int(metrics.get('new_users', 0))} new, "
+        trends_text += f"🎲 {int(metrics.get('game_count', 0))} rolls\n"
+        trends_text += f"🎁 {format_currency(metrics.get('bonus_amount', 0))} bonus, "
+        trends_text += f"💸 {format_currency(-metrics.get('withdrawal_amount', 0))} withdrawn\n"
+    
+    rolls_per_hour = [
+        hourly.get(current_hour - timedelta(hours=offset), {}).get("game_count", 0)
+        for offset in range(23, -1, -1)
+    ]
+    trends_text += f"\n🎲 Rolls per hour (24h): {format_sparkline(rolls_per_hour)}\n"
+    trends_text += f"Peak: {int(max(rolls_per_hour))} rolls/hour"
+    
+    await callback.message.edit_text(trends_text, reply_markup=get_cancel_keyboard(), parse_mode="HTML")
+    await callback.answer()
+
+
+@router.message(Command("export"))
+async def export_command(message: Message):
+    """Handle /export command."""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("❌ Access denied. Admin only.")
+        return
+    
+    args = message.text.split()[1:]
+    usage = "Usage: <code>/export transactions|game_history|withdraw_requests|users [csv|jsonl] [from YYYY-MM-DD] [to YYYY-MM-DD]</code>"
+    
+    if not args or args[0] not in EXPORT_TABLES:
+        await message.answer(f"📤 <b>Export</b>\n\n{usage}", parse_mode="HTML")
+        return
+    
+    table_name = args[0]
+    fmt = args[1] if len(args) > 1 else "csv"
+    
+    try:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(fmt)
+        start = datetime.strptime(args[2], "%Y-%m-%d") if len(args) > 2 else None
+        # The end date is inclusive for admins, exclusive for the query
+        end = datetime.strptime(args[3], "%Y-%m-%d") + timedelta(days=1) if len(args) > 3 else None
+    except ValueError:
+        await message.answer(f"❌ Invalid export arguments.\n\n{usage}", parse_mode="HTML")
+        return
+    
+    await message.answer(f"⏳ Exporting {table_name}...")
+    
+    path = None
+    try:
+        path, row_count = await export_table(table_name, fmt, start, end)
+        
+        period = ""
+        if start or end:
+            period = f"_{args[2] if start else 'start'}_{args[3] if end else 'now'}"
+        filename = f"{table_name}{period}.{fmt}.gz"
+        
+        await message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📤 {table_name}: {row_count} rows"
+        )
+        logger.info(f"Admin {user_id} exported {row_count} rows from {table_name}")
+        
+    except Exception as e:
+        await message.answer("❌ Export failed. Please try again.")
+        logger.error(f"Export error: {e}")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+@router.message(Command("profile"))
+async def profile_command(message: Message, dispatcher: Dispatcher):
+    """Handle /profile command."""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("❌ Access denied. Admin only.")
+        return
+    
+    args = message.text.split()[1:]
+    usage = (
+        "Usage: <code>/profile SECONDS|UPDATESu [handler]</code>\n"
+        "Examples: <code>/profile 30</code>, <code>/profile 50u roll_dice_callback</code>"
+    )
+    
+    try:
+        if not args:
+            raise ValueError("missing limit")
+        if args[0].endswith("u"):
+            duration, max_updates = MAX_PROFILE_SECONDS, int(args[0][:-1])
+        else:
+            duration, max_updates = float(args[0].rstrip("s")), None
+        if duration <= 0 or (max_updates is not None and max_updates <= 0):
+            raise ValueError("limit must be positive")
+    except ValueError:
+        await message.answer(f"🔬 <b>Profiler</b>\n\n{usage}", parse_mode="HTML")
+        return
+    
+    handler_name = args[1] if len(args) > 1 else None
+    if handler_name and handler_name not in handler_names(dispatcher):
+        await message.answer(f"❌ Unknown handler: <code>{handler_name}</code>", parse_mode="HTML")
+        return
+    
+    if handler_profiler.running:
+        await message.answer("⏳ A profiling session is already running.")
+        return
+    
+    handler_profiler.start(
+        [dispatcher.message, dispatcher.callback_query], duration, max_updates, handler_name
+    )
+    limit = f"{max_updates} updates" if max_updates else f"{duration:g}s"
+    await message.answer(f"🔬 Profiling {handler_name or 'all handlers'} for {limit}...")
+    await handler_profiler.wait()
+    
+    sample_count = sum(handler_profiler.samples.values())
+    if not sample_count:
+        await message.answer(f"🔬 No samples collected ({handler_profiler.updates} updates profiled).")
+        return
+    
+    summary = f"🔬 <b>Profile Summary</b>\n\n"
+    summary += f"⏱️ {handler_profiler.elapsed:.1f}s, {handler_profiler.updates} updates, {sample_count} samples\n\n"
+    summary += "<b>Top functions (self / total):</b>\n"
+    for label, own, total in handler_profiler.top_functions():
+        summary += f"<code>{own / sample_count:5.1%} {total / sample_count:6.1%}  {label}</code>\n"
+    
+    fd, path = tempfile.mkstemp(prefix="profile_", suffix=".folded")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(handler_profiler.collapsed())
+        await message.answer_document(
+            FSInputFile(path, filename=f"profile_{datetime.utcnow():%Y%m%d_%H%M%S}.folded"),
+            caption="🔥 Collapsed stacks (flamegraph.pl / speedscope)"
+        )
+        await message.answer(summary, parse_mode="HTML")
+        logger.info(f"Admin {user_id} profiled {handler_name or 'all handlers'}: {sample_count} samples")
+    except Exception as e:
+        await message.answer("❌ Failed to send profile. Please try again.")
+        logger.error(f"Profile error: {e}")
+    finally:
+        os.remove(path)
+
+
+@router.message(Command("queries"))
+async def queries_command(message: Message):
+    """Handle /queries command."""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("❌ Access denied. Admin only.")
+        return
+    
+    top_handlers = query_tracer.top_handlers()
+    if not top_handlers:
+        await message.answer("🧮 No updates traced yet.")
+        return
+    
+    queries_text = "🧮 <b>Queries per Update</b>\n\n"
+    queries_text += "<b>Handler: avg / max statements, avg time, over budget</b>\n"
+    for name, stats in top_handlers:
+        updates = stats["updates"]
+        queries_text += (
+            f"<code>{name}</code>: {stats['statements'] / updates:.1f} / {stats['max_statements']} "
+            f"(budget {query_tracer.limit_for(name)}), {stats['seconds'] / updates * 1000:.1f}ms, "
+            f"{stats['over_budget']}/{updates}\n"
+        )
+    
+    await message.answer(queries_text, parse_mode="HTML")
+
+
+@router.message(Command("find"))
+async def find_command(message: Message):
+    """Handle /find command."""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        await message.answer("❌ Access denied. Admin only.")
+        return
+    
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await message.answer(
+            "🔎 <b>Find Users</b>\n\n"
+            "Usage: <code>/find ID|@username|name</code>\n"
+            "Examples: <code>/find 123456789</code>, <code>/find @john</code>, <code>/find john</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    try:
+        results = await db.search_users(query, limit=FIND_RESULTS)
+    except Exception as e:
+        await message.answer("❌ Search failed. Please try again.")
+        logger.error(f"User search error: {e}")
+        return
+    
+    if not results:
+        await message.answer(f"🔎 No users found for <code>{html.escape(query)}</code>.", parse_mode="HTML")
+        return
+    
+    entries = []
+    for user, withdrawals in results:
+        user_text = format_user_profile(user)
+        user_text += f"📛 Name: {html.escape(user.first_name or 'N/A')}\n"
+        user_text += "\n💸 <b>Recent Withdrawals</b>\n"
+        if not withdrawals:
+            user_text += "None\n"
+        for request in withdrawals:
+            emoji = WITHDRAWAL_STATUS_EMOJI.get(request.status, "❓")
+            user_text += (
+                f"{emoji} #{request.id} {format_currency(request.amount)} - {request.status.upper()} "
+                f"({format_datetime(request.created_at)})\n"
+            )
+        entries.append(user_text)
+    
+    await message.answer("\n".join(entries), parse_mode="HTML")
+
+
+def register_admin_handlers(dp: Dispatcher):
+    """Register admin handlers."""
+    dp.include_router(router)
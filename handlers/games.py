@@ -1,24 +1,28 @@
 """
 Game-related handlers for the Telegram bot.
 """
-from aiogram import Router, F
+from aiogram import Router, Dispatcher
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
 from database.db import db
-from utils.helpers import format_currency, can_roll_dice
+from utils.helpers import format_currency, can_roll_dice, get_daily_rolls
 from utils.keyboards import get_dice_keyboard
 from utils.logger import logger
+from utils.middlewares import degraded_mode
+from utils.reminders import reminder_scheduler
+from utils.routing import routes
 import random
-from datetime import datetime
 
 router = Router()
 
 
-@router.callback_query(F.data == "roll_dice")
+@routes.callback("roll_dice")
+@degraded_mode.money_action
 async def roll_dice_callback(callback: CallbackQuery, state: FSMContext):
     """Handle dice roll callback."""
     user_id = callback.from_user.id
-    user = await db.get_user(user_id)
+    # Answer cooldowns from the eligibility index without loading the user
+    user = db.eligibility.get(user_id) or await db.get_user_snapshot(user_id)
     
     if not user:
         await callback.answer("❌ User not found. Please use /start to register.")
@@ -34,7 +38,7 @@ async def roll_dice_callback(callback: CallbackQuery, state: FSMContext):
     
     # Check daily roll limit
     max_rolls = await db.get_config("max_daily_rolls", 10)
-    if user.daily_rolls_count >= max_rolls:
+    if get_daily_rolls(user) >= max_rolls:
         await callback.answer("🎲 You've reached your daily roll limit. Try again tomorrow!")
         return
     
@@ -42,37 +46,21 @@ async def roll_dice_callback(callback: CallbackQuery, state: FSMContext):
     dice_value = random.randint(1, 6)
     reward = dice_value * 10  # Basic reward calculation
     
-    # Update user balance
-    await db.update_user_balance(
-        user_id, 
-        reward, 
-        "game", 
-        f"Dice roll: {dice_value}"
-    )
-    
-    # Update user stats
-    user.last_dice_roll = datetime.utcnow()
-    user.daily_rolls_count += 1
-    await db.session_factory().commit()
+    # Credit reward and update roll stats; eligibility is checked again on the locked row
+    user = await db.record_dice_roll(user_id, dice_value, reward, cooldown, max_rolls)
+    if not user:
+        await callback.answer("⏳ Please wait before rolling again.")
+        return
     
-    # Create game history record
-    from database.models import GameHistory
-    async with db.session_factory() as session:
-        game_record = GameHistory(
-            user_id=user_id,
-            game_type="dice",
-            dice_value=dice_value,
-            reward=reward
-        )
-        session.add(game_record)
-        await session.commit()
+    if user.daily_rolls_count < max_rolls:
+        reminder_scheduler.schedule(user_id, "dice", user.last_dice_roll, cooldown)
     
     # Send result
     currency_symbol = await db.get_config("currency_symbol", "₦")
     result_text = f"🎲 <b>Dice Roll Result</b>\n\n"
     result_text += f"🎲 You rolled: <b>{dice_value}</b>\n"
     result_text += f"💰 Reward: {format_currency(reward, currency_symbol)}\n"
-    result_text += f"💎 New Balance: {format_currency(user.balance + reward, currency_symbol)}\n\n"
+    result_text += f"💎 New Balance: {format_currency(user.balance, currency_symbol)}\n\n"
     result_text += f"Daily Rolls: {user.daily_rolls_count}/{max_rolls}"
     
     # Check if user can roll again
@@ -91,9 +79,6 @@ async def roll_dice_callback(callback: CallbackQuery, state: FSMContext):
     logger.info(f"User {user_id} rolled dice: {dice_value}, reward: {reward}")
 
 
-@router.callback_query(F.data == "cancel_operation")
-async def cancel_operation_callback(callback: CallbackQuery, state: FSMContext):
-    """Handle cancel operation callback."""
-    await state.clear()
-    await callback.message.edit_text("❌ Operation cancelled.")
-    await callback.answer()
\ No newline at end of file
+def register_game_handlers(dp: Dispatcher):
+    """Register game handlers."""
+    dp.include_router(router)
@@ -1,15 +1,23 @@
 """
 User-related handlers for the Telegram bot.
 """
-from aiogram import Router, F
+from aiogram import Router, Dispatcher
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import db
-from utils.helpers import format_currency, format_user_profile, get_referral_link, is_admin
-from utils.keyboards import get_main_keyboard, get_admin_keyboard, get_dice_keyboard
+from config import ADMIN_ID
+from database.circuit import DatabaseUnavailable
+from database.db import db, WithdrawalError
+from utils.helpers import (
+    format_currency, format_user_profile, format_game_stats, get_referral_link, is_admin,
+    format_transaction, format_transaction_summary, encode_page_cursor, decode_page_cursor
+)
+from utils.keyboards import get_main_keyboard, get_admin_keyboard, get_dice_keyboard, get_transactions_keyboard
 from utils.logger import logger
+from utils.middlewares import degraded_mode, STALE_DATA_NOTICE
+from utils.routing import routes
+from utils.reminders import reminder_scheduler, BONUS_COOLDOWN
 
 router = Router()
 
@@ -32,41 +40,22 @@ async def start_command(message: Message, state: FSMContext):
         start_param = message.text.split()[1]
         referrer_id = int(start_param) if start_param.isdigit() else None
     
-    # Check if user exists
-    user = await db.get_user(user_id)
-    
-    if not user:
-        # Create new user
-        user = await db.create_user(
+    # Returning users are usually cached; otherwise try to register, which
+    # is a no-op for existing users
+    new_user = False
+    if not db.user_cache.get(user_id):
+        referral_reward = await db.get_config("referral_reward", 50)
+        registered = await db.register_user(
             user_id=user_id,
             username=username,
             first_name=first_name,
             last_name=last_name,
-            referrer_id=referrer_id
+            referrer_id=referrer_id,
+            referral_reward=referral_reward
         )
-        
-        # Handle referral bonus
-        if referrer_id:
-            referrer = await db.get_user(referrer_id)
-            if referrer:
-                referral_reward = await db.get_config("referral_reward", 50)
-                await db.update_user_balance(
-                    referrer_id, 
-                    referral_reward, 
-                    "referral", 
-                    f"Referral bonus for {username or user_id}"
-                )
-                referrer.referral_count += 1
-                await db.session_factory().commit()
-                
-                # Reward new user too
-                await db.update_user_balance(
-                    user_id, 
-                    referral_reward, 
-                    "referral", 
-                    f"Welcome bonus from referral"
-                )
-        
+        new_user = registered is not None
+    
+    if new_user:
         welcome_text = f"🎉 Welcome to the bot, {first_name}!\n\n"
         welcome_text += "You can earn rewards by playing games, claiming daily bonuses, and referring friends!\n\n"
         welcome_text += "Use the menu below to get started:"
@@ -83,25 +72,29 @@ async def start_command(message: Message, state: FSMContext):
     await state.clear()
 
 
-@router.message(F.text == "👤 Profile")
+@routes.text("👤 Profile")
 async def profile_handler(message: Message):
     """Handle profile command."""
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user_snapshot(user_id)
     
     if not user:
         await message.answer("❌ User not found. Please use /start to register.")
         return
     
     profile_text = format_user_profile(user)
+    if db.circuit.is_open:
+        profile_text += STALE_DATA_NOTICE
+    else:
+        profile_text += format_game_stats(await db.get_user_game_stats(user_id))
     await message.answer(profile_text, parse_mode="HTML")
 
 
-@router.message(F.text == "💰 Balance")
+@routes.text("💰 Balance")
 async def balance_handler(message: Message):
     """Handle balance command."""
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user_snapshot(user_id)
     
     if not user:
         await message.answer("❌ User not found. Please use /start to register.")
@@ -112,23 +105,24 @@ async def balance_handler(message: Message):
     balance_text += f"Current Balance: {format_currency(user.balance, currency_symbol)}\n"
     balance_text += f"Total Earned: {format_currency(user.total_earned, currency_symbol)}\n"
     balance_text += f"Referrals: {user.referral_count}\n"
+    if db.circuit.is_open:
+        balance_text += STALE_DATA_NOTICE
     
     await message.answer(balance_text, parse_mode="HTML")
 
 
-@router.message(F.text == "👥 Referrals")
+@routes.text("👥 Referrals")
 async def referrals_handler(message: Message):
     """Handle referrals command."""
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user_snapshot(user_id)
     
     if not user:
         await message.answer("❌ User not found. Please use /start to register.")
         return
     
     # Get bot username from bot info
-    from aiogram import Bot
-    bot = Bot.get_current()
+    bot = message.bot
     bot_info = await bot.get_me()
     bot_username = bot_info.username
     referral_link = get_referral_link(bot_username, user_id)
@@ -142,7 +136,34 @@ async def referrals_handler(message: Message):
     await message.answer(referrals_text, parse_mode="HTML")
 
 
-@router.message(F.text == "📜 Transactions")
+TRANSACTIONS_PAGE_SIZE = 10
+
+
+async def render_transactions_page(user_id: int, before: tuple = None, after: tuple = None):
+    """Render one page of transaction history and its navigation keyboard."""
+    transactions, has_older, has_newer = await db.get_user_transactions_page(
+        user_id, TRANSACTIONS_PAGE_SIZE, before=before, after=after
+    )
+    
+    if not transactions:
+        return "📜 <b>Transaction History</b>\n\nNo transactions found.", None
+    
+    currency_symbol = await db.get_config("currency_symbol", "₦")
+    totals = await db.get_user_transaction_summary(user_id)
+    
+    transactions_text = "📜 <b>Transaction History</b>\n\n"
+    transactions_text += f"{format_transaction_summary(totals, currency_symbol)}\n\n"
+    for transaction in transactions:
+        transactions_text += f"{format_transaction(transaction, currency_symbol)}\n\n"
+    
+    keyboard = get_transactions_keyboard(
+        older_cursor=encode_page_cursor(transactions[-1]) if has_older else None,
+        newer_cursor=encode_page_cursor(transactions[0]) if has_newer else None
+    )
+    return transactions_text, keyboard
+
+
+@routes.text("📜 Transactions")
 async def transactions_handler(message: Message):
     """Handle transactions command."""
     user_id = message.from_user.id
@@ -152,33 +173,27 @@ async def transactions_handler(message: Message):
         await message.answer("❌ User not found. Please use /start to register.")
         return
     
-    transactions = await db.get_user_transactions(user_id, 10)
-    
-    if not transactions:
-        await message.answer("📜 <b>Transaction History</b>\n\nNo transactions found.")
-        return
-    
-    transactions_text = "📜 <b>Recent Transactions</b>\n\n"
-    for transaction in transactions:
-        currency_symbol = await db.get_config("currency_symbol", "₦")
-        emoji_map = {
-            "game": "🎲",
-            "bonus": "🎁",
-            "referral": "👥",
-            "withdrawal": "💸"
-        }
-        
-        emoji = emoji_map.get(transaction.transaction_type, "💰")
-        amount_str = format_currency(transaction.amount, currency_symbol)
-        date_str = transaction.created_at.strftime("%m-%d %H:%M")
-        
-        transactions_text += f"{emoji} {amount_str} - {transaction.transaction_type.title()}\n"
-        transactions_text += f"📅 {date_str}\n\n"
-    
-    await message.answer(transactions_text, parse_mode="HTML")
+    transactions_text, keyboard = await render_transactions_page(user_id)
+    await message.answer(transactions_text, reply_markup=keyboard, parse_mode="HTML")
 
 
-@router.message(F.text == "ℹ️ Help")
+@routes.callback_prefix("tx_older_", decode_page_cursor)
+async def older_transactions_callback(callback: CallbackQuery, payload: tuple):
+    """Handle older transactions page callback."""
+    transactions_text, keyboard = await render_transactions_page(callback.from_user.id, before=payload)
+    await callback.message.edit_text(transactions_text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
+
+
+@routes.callback_prefix("tx_newer_", decode_page_cursor)
+async def newer_transactions_callback(callback: CallbackQuery, payload: tuple):
+    """Handle newer transactions page callback."""
+    transactions_text, keyboard = await render_transactions_page(callback.from_user.id, after=payload)
+    await callback.message.edit_text(transactions_text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
+
+
+@routes.text("ℹ️ Help")
 async def help_handler(message: Message):
     """Handle help command."""
     help_text = "ℹ️ <b>Bot Help</b>\n\n"
@@ -188,17 +203,18 @@ async def help_handler(message: Message):
     help_text += "💸 <b>Withdraw</b> - Request withdrawal of your earnings\n"
     help_text += "📜 <b>Transactions</b> - View your transaction history\n"
     help_text += "👥 <b>Referrals</b> - Get your referral link and stats\n"
-    help_text += "🎁 <b>Daily Bonus</b> - Claim your daily bonus\n\n"
+    help_text += "🎁 <b>Daily Bonus</b> - Claim your daily bonus\n"
+    help_text += "🔔 /reminders - Get a message when your bonus or next roll is ready\n\n"
     help_text += "For support, contact the admin."
     
     await message.answer(help_text, parse_mode="HTML")
 
 
-@router.message(F.text == "🎲 Play Game")
+@routes.text("🎲 Play Game")
 async def play_game_handler(message: Message):
     """Handle play game command."""
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    user = await db.get_user_snapshot(user_id)
     
     if not user:
         await message.answer("❌ User not found. Please use /start to register.")
@@ -214,13 +230,14 @@ async def play_game_handler(message: Message):
     
     # Check daily roll limit
     max_rolls = await db.get_config("max_daily_rolls", 10)
-    if user.daily_rolls_count >= max_rolls:
+    daily_rolls = get_daily_rolls(user)
+    if daily_rolls >= max_rolls:
         await message.answer("🎲 You've reached your daily roll limit. Try again tomorrow!")
         return
     
     game_text = "🎲 <b>Dice Game</b>\n\n"
     game_text += "Click the button below to roll the dice and earn rewards!\n"
-    game_text += f"Daily Rolls: {user.daily_rolls_count}/{max_rolls}\n\n"
+    game_text += f"Daily Rolls: {daily_rolls}/{max_rolls}\n\n"
     game_text += "Rewards:\n"
     game_text += "🎲 1 = 10 points\n"
     game_text += "🎲 2 = 20 points\n"
@@ -232,11 +249,13 @@ async def play_game_handler(message: Message):
     await message.answer(game_text, reply_markup=get_dice_keyboard(), parse_mode="HTML")
 
 
-@router.message(F.text == "🎁 Daily Bonus")
+@routes.text("🎁 Daily Bonus")
+@degraded_mode.money_action
 async def daily_bonus_handler(message: Message):
     """Handle daily bonus command."""
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
+    # Answer cooldowns from the eligibility index without loading the user
+    user = db.eligibility.get(user_id) or await db.get_user_snapshot(user_id)
     
     if not user:
         await message.answer("❌ User not found. Please use /start to register.")
@@ -249,30 +268,47 @@ async def daily_bonus_handler(message: Message):
         await message.answer(f"⏳ {message_text}")
         return
     
-    # Give daily bonus
+    # Give daily bonus; the claim is checked again on the locked row
     bonus_amount = await db.get_config("daily_bonus", 100)
-    await db.update_user_balance(
-        user_id, 
-        bonus_amount, 
-        "bonus", 
-        "Daily bonus"
-    )
+    user = await db.claim_daily_bonus(user_id, bonus_amount)
+    if not user:
+        await message.answer("⏳ Daily bonus already claimed.")
+        return
     
-    # Update last daily bonus time
-    from datetime import datetime
-    user.last_daily_bonus = datetime.utcnow()
-    await db.session_factory().commit()
+    reminder_scheduler.schedule(user_id, "bonus", user.last_daily_bonus, BONUS_COOLDOWN)
     
     currency_symbol = await db.get_config("currency_symbol", "₦")
     bonus_text = f"🎁 <b>Daily Bonus Claimed!</b>\n\n"
     bonus_text += f"You received {format_currency(bonus_amount, currency_symbol)}!\n"
-    bonus_text += f"New Balance: {format_currency(user.balance + bonus_amount, currency_symbol)}"
+    bonus_text += f"New Balance: {format_currency(user.balance, currency_symbol)}"
     
     await message.answer(bonus_text, parse_mode="HTML")
     logger.info(f"User {user_id} claimed daily bonus: {bonus_amount}")
 
 
-@router.message(F.text == "💸 Withdraw")
+@router.message(Command("reminders"))
+async def reminders_command(message: Message):
+    """Handle /reminders command."""
+    user_id = message.from_user.id
+    user = await db.get_user(user_id)
+    
+    if not user:
+        await message.answer("❌ User not found. Please use /start to register.")
+        return
+    
+    enabled = not user.reminders_enabled
+    user = await db.set_reminders(user_id, enabled)
+    await reminder_scheduler.set_enabled(user, enabled)
+    
+    if enabled:
+        await message.answer("🔔 Reminders are on. We'll message you when your daily bonus or next dice roll is ready.")
+    else:
+        await message.answer("🔕 Reminders are off.")
+    logger.info(f"User {user_id} turned reminders {'on' if enabled else 'off'}")
+
+
+@routes.text("💸 Withdraw")
+@degraded_mode.money_action
 async def withdraw_handler(message: Message, state: FSMContext):
     """Handle withdraw command."""
     user_id = message.from_user.id
@@ -304,59 +340,44 @@ async def withdraw_handler(message: Message, state: FSMContext):
 
 
 @router.message(WithdrawalStates.waiting_for_amount)
+@degraded_mode.money_action
 async def process_withdrawal_amount(message: Message, state: FSMContext):
     """Process withdrawal amount input."""
     user_id = message.from_user.id
-    user = await db.get_user(user_id)
     
     try:
         amount = float(message.text)
-        min_withdrawal = await db.get_config("min_withdrawal", 1000)
         currency_symbol = await db.get_config("currency_symbol", "₦")
         
-        if amount < min_withdrawal:
-            await message.answer(f"❌ Minimum withdrawal amount is {format_currency(min_withdrawal, currency_symbol)}")
-            return
-        
-        if amount > user.balance:
-            await message.answer(f"❌ Insufficient balance. Your balance: {format_currency(user.balance, currency_symbol)}")
+        try:
+            request_id = await db.request_withdrawal(user_id, amount)
+        except WithdrawalError as e:
+            if e.reason == "user_not_found":
+                await message.answer("❌ User not found. Please use /start to register.")
+                await state.clear()
+            elif e.reason == "invalid_amount":
+                await message.answer("❌ Please enter a valid amount")
+            elif e.reason == "insufficient_balance":
+                await message.answer(f"❌ Insufficient balance. Your balance: {format_currency(e.balance, currency_symbol)}")
+            else:
+                await message.answer(f"❌ Minimum withdrawal amount is {format_currency(e.minimum, currency_symbol)}")
             return
         
-        # Create withdrawal request
-        from database.models import WithdrawRequest
-        async with db.session_factory() as session:
-            withdraw_request = WithdrawRequest(
-                user_id=user_id,
-                amount=amount,
-                status="pending"
-            )
-            session.add(withdraw_request)
-            await session.commit()
-            await session.refresh(withdraw_request)
-        
-        # Deduct from balance
-        await db.update_user_balance(
-            user_id, 
-            -amount, 
-            "withdrawal", 
-            f"Withdrawal request #{withdraw_request.id}"
-        )
-        
         # Notify admin
-        admin_id = await db.get_config("ADMIN_ID", 0)
-        if admin_id:
-            from aiogram import Bot
-            bot = Bot.get_current()
+        if ADMIN_ID:
             admin_text = f"🔔 <b>New Withdrawal Request</b>\n\n"
-            admin_text += f"User: {user_id} (@{user.username or 'N/A'})\n"
+            admin_text += f"User: {user_id} (@{message.from_user.username or 'N/A'})\n"
             admin_text += f"Amount: {format_currency(amount, currency_symbol)}\n"
-            admin_text += f"Request ID: {withdraw_request.id}"
+            admin_text += f"Request ID: {request_id}"
             
-            await bot.send_message(admin_id, admin_text, parse_mode="HTML")
+            try:
+                await message.bot.send_message(ADMIN_ID, admin_text, parse_mode="HTML")
+            except Exception as e:
+                logger.error(f"Failed to notify admin of withdrawal request {request_id}: {e}")
         
         success_text = f"✅ <b>Withdrawal Request Submitted</b>\n\n"
         success_text += f"Amount: {format_currency(amount, currency_symbol)}\n"
-        success_text += f"Request ID: {withdraw_request.id}\n\n"
+        success_text += f"Request ID: {request_id}\n\n"
         success_text += "Your request will be processed within 24 hours."
         
         await message.answer(success_text, parse_mode="HTML")
@@ -366,10 +387,25 @@ async def process_withdrawal_amount(message: Message, state: FSMContext):
         
     except ValueError:
         await message.answer("❌ Please enter a valid amount (numbers only)")
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         await message.answer("❌ An error occurred. Please try again.")
         logger.error(f"Withdrawal error: {e}")
 
 
+@routes.callback("cancel_operation")
+async def cancel_operation_callback(callback: CallbackQuery, state: FSMContext):
+    """Handle cancel operation callback."""
+    await state.clear()
+    await callback.message.edit_text("❌ Operation cancelled.")
+    await callback.answer()
+
+
+def register_user_handlers(dp: Dispatcher):
+    """Register user handlers."""
+    dp.include_router(router)
+
+
 # Import the can_roll_dice and can_claim_daily_bonus functions
-from utils.helpers import can_roll_dice, can_claim_daily_bonus
\ No newline at end of file
+from utils.helpers import can_roll_dice, can_claim_daily_bonus, get_daily_rolls
\ No newline at end of file
@@ -1,18 +1,22 @@
 """
 Withdrawal-related handlers for the Telegram bot.
 """
-from aiogram import Router, F
+from aiogram import Router, Dispatcher
 from aiogram.types import CallbackQuery
+from database.circuit import DatabaseUnavailable
 from database.db import db
-from utils.helpers import is_admin, format_currency, format_withdrawal_request
+from utils.helpers import is_admin, format_currency, format_withdrawal_request, get_withdrawal_worker
 from utils.keyboards import get_admin_withdrawal_keyboard, get_cancel_keyboard
 from utils.logger import logger
+from utils.middlewares import degraded_mode
+from utils.routing import routes
 
 router = Router()
 
 
-@router.callback_query(F.data.startswith("approve_withdrawal_"))
-async def approve_withdrawal_callback(callback: CallbackQuery):
+@routes.callback_prefix("approve_withdrawal_", int)
+@degraded_mode.money_action
+async def approve_withdrawal_callback(callback: CallbackQuery, payload: int):
     """Handle approve withdrawal callback."""
     user_id = callback.from_user.id
     
@@ -20,35 +24,18 @@ async def approve_withdrawal_callback(callback: CallbackQuery):
         await callback.answer("❌ Access denied. Admin only.")
         return
     
-    request_id = int(callback.data.replace("approve_withdrawal_", ""))
+    request_id = payload
     
     try:
-        # Get withdrawal request
-        async with db.session_factory() as session:
-            from database.models import WithdrawRequest
-            from sqlalchemy import select
-            
-            stmt = select(WithdrawRequest).where(WithdrawRequest.id == request_id)
-            result = await session.execute(stmt)
-            withdraw_request = result.scalar_one_or_none()
-            
-            if not withdraw_request:
-                await callback.answer("❌ Withdrawal request not found.")
-                return
-            
-            if withdraw_request.status != "pending":
-                await callback.answer("❌ This withdrawal request has already been processed.")
-                return
-            
-            # Update status
-            withdraw_request.status = "paid"
-            from datetime import datetime
-            withdraw_request.processed_at = datetime.utcnow()
-            await session.commit()
+        # Mark paid, unless another admin already finished or holds the request
+        withdraw_request = await db.finish_withdrawal(request_id, get_withdrawal_worker(user_id), approve=True)
+        
+        if not withdraw_request:
+            await callback.answer("❌ This withdrawal request was already processed or is claimed by another admin.")
+            return
         
         # Notify user
-        from aiogram import Bot
-        bot = Bot.get_current()
+        bot = callback.bot
         
         currency_symbol = await db.get_config("currency_symbol", "₦")
         user_text = f"✅ <b>Withdrawal Approved</b>\n\n"
@@ -73,13 +60,16 @@ async def approve_withdrawal_callback(callback: CallbackQuery):
         
         logger.info(f"Admin {user_id} approved withdrawal request {request_id}")
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         await callback.answer("❌ An error occurred. Please try again.")
         logger.error(f"Withdrawal approval error: {e}")
 
 
-@router.callback_query(F.data.startswith("reject_withdrawal_"))
-async def reject_withdrawal_callback(callback: CallbackQuery):
+@routes.callback_prefix("reject_withdrawal_", int)
+@degraded_mode.money_action
+async def reject_withdrawal_callback(callback: CallbackQuery, payload: int):
     """Handle reject withdrawal callback."""
     user_id = callback.from_user.id
     
@@ -87,43 +77,19 @@ async def reject_withdrawal_callback(callback: CallbackQuery):
         await callback.answer("❌ Access denied. Admin only.")
         return
     
-    request_id = int(callback.data.replace("reject_withdrawal_", ""))
+    request_id = payload
     
     try:
-        # Get withdrawal request
-        async with db.session_factory() as session:
-            from database.models import WithdrawRequest
-            from sqlalchemy import select
-            
-            stmt = select(WithdrawRequest).where(WithdrawRequest.id == request_id)
-            result = await session.execute(stmt)
-            withdraw_request = result.scalar_one_or_none()
-            
-            if not withdraw_request:
-                await callback.answer("❌ Withdrawal request not found.")
-                return
-            
-            if withdraw_request.status != "pending":
-                await callback.answer("❌ This withdrawal request has already been processed.")
-                return
-            
-            # Update status
-            withdraw_request.status = "rejected"
-            from datetime import datetime
-            withdraw_request.processed_at = datetime.utcnow()
-            await session.commit()
-            
-            # Refund the amount to user balance
-            await db.update_user_balance(
-                withdraw_request.user_id,
-                withdraw_request.amount,
-                "withdrawal_refund",
-                f"Withdrawal request #{request_id} rejected - refunded"
-            )
+        # Mark rejected and refund in one transaction, unless another admin
+        # already finished or holds the request
+        withdraw_request = await db.finish_withdrawal(request_id, get_withdrawal_worker(user_id), approve=False)
+        
+        if not withdraw_request:
+            await callback.answer("❌ This withdrawal request was already processed or is claimed by another admin.")
+            return
         
         # Notify user
-        from aiogram import Bot
-        bot = Bot.get_current()
+        bot = callback.bot
         
         currency_symbol = await db.get_config("currency_symbol", "₦")
         user_text = f"❌ <b>Withdrawal Rejected</b>\n\n"
@@ -148,13 +114,13 @@ async def reject_withdrawal_callback(callback: CallbackQuery):
         
         logger.info(f"Admin {user_id} rejected withdrawal request {request_id}")
         
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         await callback.answer("❌ An error occurred. Please try again.")
         logger.error(f"Withdrawal rejection error: {e}")
 
 
-@router.callback_query(F.data == "cancel_operation")
-async def cancel_operation_callback(callback: CallbackQuery):
-    """Handle cancel operation callback."""
-    await callback.message.edit_text("❌ Operation cancelled.")
-    await callback.answer()
\ No newline at end of file
+def register_withdrawal_handlers(dp: Dispatcher):
+    """Register withdrawal handlers."""
+    dp.include_router(router)
@@ -0,0 +1,327 @@
+"""
+Bulk import script for users and balances.
+Streams a CSV or JSONL file into a staging table with COPY (batched inserts
+on SQLite) and merges it into the users table with set-based statements.
+
+Usage:
+    python import_users.py users.csv
+    python import_users.py backup.jsonl --batch-size 50000
+    python import_users.py users.csv --bot-id 123456789
+"""
+import argparse
+import asyncio
+import csv
+import json
+import time
+from datetime import datetime
+from typing import Iterator, List
+from sqlalchemy import text
+from database.db import db
+from database.events import UserUpdated
+from database.tenancy import current_tenant, tenant_schema, use_tenant
+from utils.logger import logger
+
+# Columns accepted in import files, in staging table order; referral_count is
+# recomputed from referrer_id instead of being imported
+IMPORT_COLUMNS = [
+    "user_id", "username", "first_name", "last_name", "balance",
+    "total_earned", "referral_count", "referrer_id", "join_date"
+]
+
+STAGING_COLUMNS = ["line_no"] + IMPORT_COLUMNS
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE import_users_staging (
+    line_no BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    username VARCHAR(255),
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    balance DOUBLE PRECISION,
+    total_earned DOUBLE PRECISION,
+    referral_count INTEGER,
+    referrer_id BIGINT,
+    join_date TIMESTAMP
+)
+"""
+
+STAGING_INSERT_SQL = f"""
+INSERT INTO import_users_staging ({", ".join(STAGING_COLUMNS)})
+VALUES ({", ".join(f":{column}" for column in STAGING_COLUMNS)})
+"""
+
+# Keep only the last row for each user_id in the file
+DEDUPLICATE_SQL = """
+CREATE TEMP TABLE import_users AS
+SELECT s.*
+FROM import_users_staging s
+JOIN (
+    SELECT user_id, MAX(line_no) AS line_no
+    FROM import_users_staging
+    GROUP BY user_id
+) latest ON latest.line_no = s.line_no
+"""
+
+# Referrers must be an existing or imported user other than the user itself
+INVALID_REFERRERS_SQL = """
+UPDATE import_users
+SET referrer_id = NULL
+WHERE referrer_id IS NOT NULL
+  AND (
+    referrer_id = user_id
+    OR (
+      NOT EXISTS (SELECT 1 FROM import_users r WHERE r.user_id = import_users.referrer_id)
+      AND NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = import_users.referrer_id)
+    )
+  )
+"""
+
+# Users whose referral count may change: imported users and their old and
+# new referrers
+AFFECTED_REFERRERS_SQL = """
+CREATE TEMP TABLE import_referrers AS
+SELECT user_id FROM import_users
+UNION
+SELECT referrer_id FROM import_users WHERE referrer_id IS NOT NULL
+UNION
+SELECT u.referrer_id
+FROM users u
+JOIN import_users s ON s.user_id = u.user_id
+WHERE u.referrer_id IS NOT NULL
+"""
+
+# Referral counts are recomputed from referrer_id after the merge rather
+# than taken from the file, in one pass over users
+REFERRAL_COUNTS_SQL = """
+CREATE TEMP TABLE import_referral_counts AS
+SELECT r.user_id, COUNT(u.user_id) AS referral_count
+FROM import_referrers r
+LEFT JOIN users u ON u.referrer_id = r.user_id
+GROUP BY r.user_id
+"""
+
+UPDATE_REFERRAL_COUNTS_SQL = """
+UPDATE users
+SET referral_count = (
+    SELECT c.referral_count FROM import_referral_counts c WHERE c.user_id = users.user_id
+)
+WHERE user_id IN (SELECT user_id FROM import_referral_counts)
+"""
+
+# Balance change per user, recorded as an opening-balance transaction
+BALANCE_DELTAS_SQL = """
+CREATE TEMP TABLE import_balance_deltas AS
+SELECT s.user_id, COALESCE(s.balance, 0) - COALESCE(u.balance, 0) AS amount
+FROM import_users s
+LEFT JOIN users u ON u.user_id = s.user_id
+"""
+
+UPSERT_USERS_SQL = """
+INSERT INTO users (
+    user_id, username, first_name, last_name, balance, total_earned,
+    referral_count, referrer_id, join_date, daily_rolls_count, is_active
+)
+SELECT
+    user_id, username, first_name, last_name, COALESCE(balance, 0),
+    COALESCE(total_earned, 0), 0, referrer_id,
+    COALESCE(join_date, :now), 0, TRUE
+FROM import_users
+WHERE TRUE
+ON CONFLICT (user_id) DO UPDATE SET
+    username = COALESCE(EXCLUDED.username, users.username),
+    first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+    last_name = COALESCE(EXCLUDED.last_name, users.last_name),
+    balance = EXCLUDED.balance,
+    total_earned = EXCLUDED.total_earned,
+    referrer_id = COALESCE(EXCLUDED.referrer_id, users.referrer_id)
+"""
+
+OPENING_BALANCE_SQL = """
+INSERT INTO transactions (user_id, transaction_type, amount, description, created_at)
+SELECT user_id, 'opening_balance', amount, 'Imported opening balance', :now
+FROM import_balance_deltas
+WHERE amount <> 0
+"""
+
+
+def _parse_int(value):
+    """Parse an optional integer field."""
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _parse_float(value):
+    """Parse an optional float field."""
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _parse_datetime(value):
+    """Parse an optional ISO-8601 datetime field."""
+    if value is None or value == "":
+        return None
+    return datetime.fromisoformat(value)
+
+
+def _parse_str(value):
+    """Parse an optional string field."""
+    if value is None or value == "":
+        return None
+    return str(value)
+
+
+FIELD_PARSERS = {
+    "user_id": _parse_int,
+    "username": _parse_str,
+    "first_name": _parse_str,
+    "last_name": _parse_str,
+    "balance": _parse_float,
+    "total_earned": _parse_float,
+    "referral_count": _parse_int,
+    "referrer_id": _parse_int,
+    "join_date": _parse_datetime,
+}
+
+
+def read_records(path: str, fmt: str) -> Iterator[dict]:
+    """Read raw records from a CSV or JSONL file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_batches(path: str, fmt: str, batch_size: int) -> Iterator[List[tuple]]:
+    """Read typed staging rows from an import file in batches."""
+    batch = []
+    for line_no, record in enumerate(read_records(path, fmt), start=1):
+        try:
+            row = [line_no] + [FIELD_PARSERS[column](record.get(column)) for column in IMPORT_COLUMNS]
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid record on line {line_no}: {e}") from e
+        if row[1] is None:
+            raise ValueError(f"Missing user_id on line {line_no}")
+
+        batch.append(tuple(row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+async def stage_batch(conn, batch: List[tuple]):
+    """Load one batch of rows into the staging table."""
+    if db.is_sqlite:
+        await conn.execute(text(STAGING_INSERT_SQL), [dict(zip(STAGING_COLUMNS, row)) for row in batch])
+        return
+
+    # The staging table was created through this connection, so the COPY
+    # runs inside the same transaction
+    raw_connection = await conn.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "import_users_staging", records=batch, columns=STAGING_COLUMNS
+    )
+
+
+async def import_users(path: str, fmt: str, batch_size: int = 10000):
+    """Import users from a file in a single transaction."""
+    started_at = time.monotonic()
+    staged = 0
+    now = datetime.utcnow()
+
+    async with db.bind.begin() as conn:
+        tenant = current_tenant.get()
+        if tenant is not None:
+            # The merge statements are raw SQL, which schema_translate_map
+            # does not rewrite
+            await conn.execute(text(f'SET LOCAL search_path TO "{tenant}"'))
+
+        await conn.execute(text(CREATE_STAGING_SQL))
+
+        for batch in read_batches(path, fmt, batch_size):
+            await stage_batch(conn, batch)
+            staged += len(batch)
+            elapsed = time.monotonic() - started_at
+            logger.info(f"Staged {staged} rows ({staged / max(elapsed, 1e-6):,.0f} rows/s)")
+
+        await conn.execute(text(DEDUPLICATE_SQL))
+        await conn.execute(text("CREATE UNIQUE INDEX ix_import_users_user_id ON import_users (user_id)"))
+        await conn.execute(text("ANALYZE import_users"))
+
+        result = await conn.execute(text(INVALID_REFERRERS_SQL))
+        invalid_referrers = result.rowcount
+
+        await conn.execute(text(BALANCE_DELTAS_SQL))
+        await conn.execute(text(AFFECTED_REFERRERS_SQL))
+
+        result = await conn.execute(text(UPSERT_USERS_SQL), {"now": now})
+        upserted = result.rowcount
+
+        await conn.execute(text(REFERRAL_COUNTS_SQL))
+        await conn.execute(text("CREATE UNIQUE INDEX ix_import_referral_counts_user_id ON import_referral_counts (user_id)"))
+        await conn.execute(text(UPDATE_REFERRAL_COUNTS_SQL))
+
+        result = await conn.execute(text(OPENING_BALANCE_SQL), {"now": now})
+        opening_balances = result.rowcount
+
+        # Running bots drop their cached users when the import commits
+        await db.events.publish(conn, UserUpdated())
+        
+        await conn.execute(text("DROP TABLE import_users_staging"))
+        await conn.execute(text("DROP TABLE import_users"))
+        await conn.execute(text("DROP TABLE import_balance_deltas"))
+        await conn.execute(text("DROP TABLE import_referrers"))
+        await conn.execute(text("DROP TABLE import_referral_counts"))
+
+    elapsed = time.monotonic() - started_at
+    logger.info(
+        f"Imported {upserted} users from {path} in {elapsed:.1f}s "
+        f"({staged} rows read, {invalid_referrers} invalid referrers cleared, "
+        f"{opening_balances} opening-balance transactions)"
+    )
+    return {
+        "rows": staged,
+        "users": upserted,
+        "invalid_referrers": invalid_referrers,
+        "opening_balances": opening_balances,
+        "seconds": elapsed,
+    }
+
+
+async def main():
+    """Main import function."""
+    parser = argparse.ArgumentParser(description="Bulk import users and balances.")
+    parser.add_argument("path", help="CSV or JSONL file with one user per row")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from file extension)")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per COPY batch")
+    parser.add_argument("--bot-id", type=int, help="Import into the schema of a white-label bot (Postgres only)")
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".json")) else "csv")
+    if args.bot_id and db.is_sqlite:
+        parser.error("--bot-id requires PostgreSQL")
+    tenant = tenant_schema(args.bot_id) if args.bot_id else None
+
+    try:
+        with use_tenant(tenant):
+            await db.create_tables()
+            result = await import_users(args.path, fmt, args.batch_size)
+        print(
+            f"✅ Imported {result['users']} users in {result['seconds']:.1f}s "
+            f"({result['invalid_referrers']} invalid referrers cleared, "
+            f"{result['opening_balances']} opening-balance transactions)"
+        )
+    except Exception as e:
+        logger.error(f"❌ Import failed: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
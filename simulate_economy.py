@@ -0,0 +1,300 @@
+"""
+Monte Carlo simulator for the bot economy.
+Forecasts payout liability for the current reward settings by simulating
+users' dice rolls, daily bonuses, referral chains and withdrawals over a
+number of days. All users of a day are simulated at once with NumPy.
+
+Settings are read from the live config table (use --offline for the
+defaults in config.py) and can be overridden on the command line.
+
+Usage:
+    python simulate_economy.py
+    python simulate_economy.py --users 1000000 --days 60 --daily-bonus 80
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass, replace
+import numpy as np
+from config import DEFAULT_CONFIG, DICE_REWARDS
+
+# Dice payouts: what roll_dice_callback pays today, and the unused
+# DICE_REWARDS table from config.py
+PAYOUT_TABLES = {
+    "handler": np.array([value * 10 for value in range(1, 7)], dtype=np.float64),
+    "config": np.array([DICE_REWARDS[value] for value in range(1, 7)], dtype=np.float64),
+}
+
+# Settings varied by the sensitivity analysis
+SENSITIVITY_SETTINGS = ("daily_bonus", "referral_reward", "dice_cooldown", "max_daily_rolls", "dice_payout_scale")
+SENSITIVITY_STEP = 0.10
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Reward settings of the bot."""
+    daily_bonus: float
+    referral_reward: float
+    dice_cooldown: int
+    max_daily_rolls: int
+    min_withdrawal: float
+    dice_payout_scale: float = 1.0
+
+
+@dataclass(frozen=True)
+class Behavior:
+    """Assumptions about how users behave."""
+    active_rate: float = 0.35  # share of users active on a given day
+    bonus_rate: float = 0.80  # share of active users claiming the daily bonus
+    roll_attempts: float = 6.0  # mean roll attempts per active day
+    session_minutes: float = 45.0  # time per day an active user keeps rolling
+    referral_rate: float = 0.02  # mean referrals per active user per day
+    withdraw_rate: float = 0.90  # share of eligible users withdrawing on a day
+    max_growth: float = 1.0  # referred users allowed, relative to the initial cohort
+
+
+async def load_settings() -> Settings:
+    """Load reward settings from the config table."""
+    from database.db import db
+
+    return Settings(
+        daily_bonus=await db.get_config("daily_bonus", float(DEFAULT_CONFIG["daily_bonus"])),
+        referral_reward=await db.get_config("referral_reward", float(DEFAULT_CONFIG["referral_reward"])),
+        dice_cooldown=int(await db.get_config("dice_cooldown", float(DEFAULT_CONFIG["dice_cooldown"]))),
+        max_daily_rolls=int(await db.get_config("max_daily_rolls", float(DEFAULT_CONFIG["max_daily_rolls"]))),
+        min_withdrawal=await db.get_config("min_withdrawal", float(DEFAULT_CONFIG["min_withdrawal"])),
+    )
+
+
+def default_settings() -> Settings:
+    """Get reward settings from the defaults in config.py."""
+    return Settings(
+        daily_bonus=float(DEFAULT_CONFIG["daily_bonus"]),
+        referral_reward=float(DEFAULT_CONFIG["referral_reward"]),
+        dice_cooldown=int(DEFAULT_CONFIG["dice_cooldown"]),
+        max_daily_rolls=int(DEFAULT_CONFIG["max_daily_rolls"]),
+        min_withdrawal=float(DEFAULT_CONFIG["min_withdrawal"]),
+    )
+
+
+def simulate_trial(settings: Settings, behavior: Behavior, payouts: np.ndarray,
+                   n_users: int, days: int, rng: np.random.Generator) -> dict:
+    """Simulate one trial of the economy.
+
+    Returns per-day payout totals and, per user ever registered, total
+    credited, total withdrawn and the first day the balance reached the
+    minimum withdrawal (-1 if never).
+    """
+    capacity = n_users + int(n_users * behavior.max_growth)
+    earned = np.zeros(capacity, dtype=np.float64)
+    balance = np.zeros(capacity, dtype=np.float64)
+    withdrawn = np.zeros(capacity, dtype=np.float64)
+    first_eligible_day = np.full(capacity, -1, dtype=np.int32)
+    population = n_users
+
+    # Rolls a user can make in one session with the cooldown in between
+    cooldown_cap = 1 + int(behavior.session_minutes * 60 // max(settings.dice_cooldown, 1))
+    roll_cap = max(0, min(settings.max_daily_rolls, cooldown_cap))
+    scaled_payouts = payouts * settings.dice_payout_scale
+
+    daily_payout = np.zeros(days, dtype=np.float64)
+    daily_withdrawn = np.zeros(days, dtype=np.float64)
+
+    # One stream per kind of draw, and draw sizes that do not depend on the
+    # settings, so runs with different settings see the same users, rolls
+    # and referrals
+    activity_rng, bonus_rng, dice_rng, referral_rng, withdraw_rng = rng.spawn(5)
+
+    for day in range(days):
+        # Only active users draw random numbers for the day
+        active = np.flatnonzero(activity_rng.random(population) < behavior.active_rate)
+        n_active = len(active)
+        credit = np.zeros(n_active, dtype=np.float64)
+
+        # Daily bonus
+        credit[bonus_rng.random(n_active) < behavior.bonus_rate] += settings.daily_bonus
+
+        # Dice rolls: one row of faces per roll number, masked by the rolls
+        # each user makes; a higher cap only adds rows
+        rolls = np.minimum(dice_rng.poisson(behavior.roll_attempts, n_active), roll_cap)
+        max_rolls = int(rolls.max()) if n_active else 0
+        if max_rolls:
+            faces = dice_rng.integers(0, 6, size=(max_rolls, n_active))
+            made = np.arange(max_rolls)[:, None] < rolls
+            credit += np.where(made, scaled_payouts[faces], 0.0).sum(axis=0)
+
+        # Referrals: both parties are credited, referred users join the cohort
+        referrals = referral_rng.poisson(behavior.referral_rate, n_active)
+        credit += referrals * settings.referral_reward
+        new_users = min(int(referrals.sum()), capacity - population)
+
+        earned[active] += credit
+        balance[active] += credit
+        daily_payout[day] += credit.sum()
+
+        if new_users:
+            earned[population:population + new_users] += settings.referral_reward
+            balance[population:population + new_users] += settings.referral_reward
+            daily_payout[day] += new_users * settings.referral_reward
+            population += new_users
+
+        # Users reaching the minimum withdrawal for the first time
+        eligible = np.flatnonzero(balance[:population] >= settings.min_withdrawal)
+        first_time = eligible[first_eligible_day[eligible] < 0]
+        first_eligible_day[first_time] = day
+
+        # Eligible users withdraw their whole balance
+        wants_to_withdraw = withdraw_rng.random(population) < behavior.withdraw_rate
+        withdrawing = eligible[wants_to_withdraw[eligible]]
+        amounts = balance[withdrawing]
+        withdrawn[withdrawing] += amounts
+        balance[withdrawing] = 0.0
+        daily_withdrawn[day] = amounts.sum()
+
+    return {
+        "daily_payout": daily_payout,
+        "daily_withdrawn": daily_withdrawn,
+        "earned": earned[:population],
+        "withdrawn": withdrawn[:population],
+        "first_eligible_day": first_eligible_day[:population],
+        "initial_users": n_users,
+    }
+
+
+def run_simulation(settings: Settings, behavior: Behavior, payouts: np.ndarray,
+                   n_users: int, days: int, trials: int, seed: int) -> list:
+    """Run several independent trials with a reproducible seed."""
+    rng = np.random.default_rng(seed)
+    return [simulate_trial(settings, behavior, payouts, n_users, days, rng) for _ in range(trials)]
+
+
+def summarize(results: list) -> dict:
+    """Summarize payout liability and withdrawal timing over trials."""
+    totals = np.array([result["daily_payout"].sum() for result in results])
+    withdrawals = np.array([result["daily_withdrawn"].sum() for result in results])
+    daily = np.concatenate([result["daily_payout"] for result in results])
+    earned = np.concatenate([result["earned"] for result in results])
+    first_day = np.concatenate([result["first_eligible_day"] for result in results])
+    reached = first_day[first_day >= 0]
+
+    return {
+        "expected_payout": totals.mean(),
+        "p95_payout": np.percentile(totals, 95),
+        "p99_payout": np.percentile(totals, 99),
+        "expected_withdrawn": withdrawals.mean(),
+        "p99_daily_payout": np.percentile(daily, 99),
+        "max_daily_payout": daily.max(),
+        "users": np.mean([len(result["earned"]) for result in results]),
+        "user_p50_earned": np.percentile(earned, 50),
+        "user_p99_earned": np.percentile(earned, 99),
+        "eligible_share": len(reached) / len(first_day),
+        "eligible_day_p50": np.percentile(reached, 50) + 1 if len(reached) else None,
+        "eligible_day_p90": np.percentile(reached, 90) + 1 if len(reached) else None,
+    }
+
+
+def sensitivity(settings: Settings, behavior: Behavior, payouts: np.ndarray,
+                n_users: int, days: int, trials: int, seed: int, baseline: float) -> dict:
+    """Get the change in expected payout for a 10% increase of each setting.
+
+    Every variant reuses the same seed and simulate_trial draws the same
+    random numbers whatever the settings, so the difference comes from the
+    setting rather than from sampling noise.
+    """
+    changes = {}
+    for name in SENSITIVITY_SETTINGS:
+        value = getattr(settings, name)
+        if isinstance(value, int):
+            changed = max(value + 1, int(round(value * (1 + SENSITIVITY_STEP))))
+        else:
+            changed = value * (1 + SENSITIVITY_STEP)
+        results = run_simulation(replace(settings, **{name: changed}), behavior, payouts, n_users, days, trials, seed)
+        expected = summarize(results)["expected_payout"]
+        changes[name] = (value, changed, (expected - baseline) / baseline if baseline else 0.0)
+    return changes
+
+
+def print_report(settings: Settings, summary: dict, changes: dict, currency_symbol: str,
+                 n_users: int, days: int, trials: int, elapsed: float):
+    """Print the simulation report."""
+    def money(amount):
+        return f"{currency_symbol}{amount:,.2f}"
+
+    print(f"🎲 Economy simulation: {n_users:,} users, {days} days, {trials} trials ({elapsed:.1f}s)")
+    print(f"⚙️ Daily bonus {money(settings.daily_bonus)}, referral reward {money(settings.referral_reward)}, "
+          f"dice cooldown {settings.dice_cooldown}s, max {settings.max_daily_rolls} rolls/day, "
+          f"min withdrawal {money(settings.min_withdrawal)}")
+    print()
+    print(f"💰 Expected payout: {money(summary['expected_payout'])}")
+    print(f"📈 Tail payout: p95 {money(summary['p95_payout'])}, p99 {money(summary['p99_payout'])}")
+    print(f"📅 Daily payout: p99 {money(summary['p99_daily_payout'])}, max {money(summary['max_daily_payout'])}")
+    print(f"💸 Expected withdrawals: {money(summary['expected_withdrawn'])}")
+    print(f"👥 Users at end (incl. referred): {summary['users']:,.0f}")
+    print(f"👤 Earned per user: p50 {money(summary['user_p50_earned'])}, p99 {money(summary['user_p99_earned'])}")
+    print(f"⏱️ Reached min withdrawal: {summary['eligible_share']:.1%} of users", end="")
+    if summary["eligible_day_p50"] is not None:
+        print(f", day p50 {summary['eligible_day_p50']:.0f}, p90 {summary['eligible_day_p90']:.0f}")
+    else:
+        print()
+
+    if changes:
+        print()
+        print(f"🔧 Sensitivity (+{SENSITIVITY_STEP:.0%} per setting → expected payout):")
+        for name, (value, changed, change) in changes.items():
+            print(f"   {name}: {value} → {changed:g}: {change:+.1%}")
+
+
+async def main():
+    """Main simulation function."""
+    parser = argparse.ArgumentParser(description="Forecast payout liability of the reward settings.")
+    parser.add_argument("--users", type=int, default=100000, help="Initial number of users")
+    parser.add_argument("--days", type=int, default=30, help="Days to simulate")
+    parser.add_argument("--trials", type=int, default=10, help="Independent trials for tail estimates")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--offline", action="store_true", help="Use config.py defaults instead of the config table")
+    parser.add_argument("--payout-table", choices=sorted(PAYOUT_TABLES), default="handler",
+                        help="Dice payouts: handler (dice value x 10) or config (DICE_REWARDS)")
+    parser.add_argument("--no-sensitivity", action="store_true", help="Skip the sensitivity analysis")
+    for name in ("daily_bonus", "referral_reward", "min_withdrawal", "dice_payout_scale"):
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, help=f"Override {name}")
+    for name in ("dice_cooldown", "max_daily_rolls"):
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, help=f"Override {name}")
+    for name, value in vars(Behavior()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value, help=f"Behavior: {name}")
+    args = parser.parse_args()
+
+    if args.offline:
+        settings = default_settings()
+        currency_symbol = DEFAULT_CONFIG["currency_symbol"]
+    else:
+        from database.db import db
+        settings = await load_settings()
+        currency_symbol = await db.get_config("currency_symbol", DEFAULT_CONFIG["currency_symbol"])
+
+    overrides = {
+        name: getattr(args, name)
+        for name in ("daily_bonus", "referral_reward", "min_withdrawal", "dice_payout_scale",
+                     "dice_cooldown", "max_daily_rolls")
+        if getattr(args, name) is not None
+    }
+    settings = replace(settings, **overrides)
+    behavior = Behavior(**{name: getattr(args, name) for name in vars(Behavior())})
+    payouts = PAYOUT_TABLES[args.payout_table]
+
+    started_at = time.monotonic()
+    results = run_simulation(settings, behavior, payouts, args.users, args.days, args.trials, args.seed)
+    summary = summarize(results)
+
+    changes = {}
+    if not args.no_sensitivity:
+        # Fewer trials are enough: variants share the random stream
+        changes = sensitivity(settings, behavior, payouts, args.users, args.days,
+                              max(1, args.trials // 4), args.seed,
+                              summarize(results[:max(1, args.trials // 4)])["expected_payout"])
+
+    print_report(settings, summary, changes, currency_symbol, args.users, args.days,
+                 args.trials, time.monotonic() - started_at)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
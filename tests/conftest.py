@@ -0,0 +1,78 @@
+"""
+Shared test fixtures.
+Tests run against a throwaway SQLite database; PostgreSQL-only paths
+(COPY, LISTEN/NOTIFY, trigram search) are not covered here.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+
+# Must be set before config is imported; .env does not override them
+os.environ["BOT_TOKEN"] = "123456:TEST"
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='bot-tests-')}/bot.db"
+os.environ["ADMIN_ID"] = "1"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.circuit import CircuitBreaker
+from database.db import db
+from database.models import Base
+
+USER_ID = 1001
+
+
+@pytest.fixture(scope="session")
+def loop():
+    """One event loop for all tests, so pooled connections stay usable."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(db.engine.dispose())
+    loop.close()
+
+
+@pytest.fixture
+def run(loop):
+    """Run a coroutine to completion on the test loop."""
+    return loop.run_until_complete
+
+
+@pytest.fixture
+def database(run):
+    """Empty database with default config and one registered user."""
+    async def reset():
+        async with db.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await db.create_tables()
+        await db.init_default_config()
+
+    db.circuit = CircuitBreaker(db._ping)
+    db.user_cache.clear()
+    db._config_cache.clear()
+    db.transaction_totals.clear()
+    db.game_stats.clear()
+    db._eligibility.clear()
+    run(reset())
+    run(db.create_user(USER_ID, "tester", "Test"))
+    return db
+
+
+def make_message(text: str = "", user_id: int = USER_ID) -> MagicMock:
+    """Get a fake incoming message whose replies are recorded by answer."""
+    message = MagicMock()
+    message.text = text
+    message.from_user.id = user_id
+    message.from_user.username = "tester"
+    message.answer = AsyncMock()
+    return message
+
+
+def make_callback(data: str = "", user_id: int = USER_ID) -> MagicMock:
+    """Get a fake callback query whose answers and edits are recorded."""
+    callback = MagicMock()
+    callback.data = data
+    callback.from_user.id = user_id
+    callback.answer = AsyncMock()
+    callback.message.edit_text = AsyncMock()
+    return callback
@@ -0,0 +1,39 @@
+"""
+Cache expiry without cross-process events (SQLite).
+"""
+import time
+from unittest.mock import patch
+from sqlalchemy import update
+from config import CACHE_SETTINGS
+from database.models import Config, User
+from conftest import USER_ID
+
+
+async def _edit_outside_bot(database):
+    """Change rows the way another process would, without publishing events."""
+    async with database.session_factory() as session:
+        await session.execute(update(User).where(User.user_id == USER_ID).values(balance=77))
+        await session.execute(update(Config).where(Config.key == "currency_symbol").values(value="$"))
+        await session.commit()
+
+
+def test_sqlite_uses_short_ttls(database):
+    assert database.user_cache.ttl == CACHE_SETTINGS["sqlite_ttl"]
+    assert database._config_ttl == CACHE_SETTINGS["sqlite_ttl"]
+    assert database.transaction_totals.ttl == CACHE_SETTINGS["sqlite_ttl"]
+
+
+def test_outside_edits_show_after_ttl(database, run):
+    run(database.get_user_snapshot(USER_ID))
+    run(database.get_config("currency_symbol", "₦"))
+    run(database.get_user_transaction_summary(USER_ID))
+    run(_edit_outside_bot(database))
+
+    assert run(database.get_user_snapshot(USER_ID)).balance == 0
+    assert run(database.get_config("currency_symbol", "₦")) == "₦"
+
+    later = time.monotonic() + CACHE_SETTINGS["sqlite_ttl"] + 1
+    with patch("time.monotonic", return_value=later):
+        assert run(database.get_user_snapshot(USER_ID)).balance == 77
+        assert run(database.get_config("currency_symbol", "₦")) == "$"
+        assert database.transaction_totals.get(USER_ID) is None
@@ -0,0 +1,99 @@
+"""
+Write timeouts of the database circuit breaker and how failed writes are reported.
+"""
+import asyncio
+from unittest.mock import AsyncMock, patch
+import pytest
+from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.circuit import DatabaseUnavailable
+from utils.middlewares import DegradedModeMiddleware, MONEY_UNAVAILABLE_TEXT, WRITE_UNKNOWN_TEXT
+from conftest import USER_ID
+
+WRITE_TIMEOUT = 0.2
+
+
+@pytest.fixture
+def circuit(database):
+    database.circuit.timeouts = {"read": WRITE_TIMEOUT, "write": WRITE_TIMEOUT}
+    return database.circuit
+
+
+async def _hold_write_lock(database, seconds):
+    async with database.write_session():
+        await asyncio.sleep(seconds)
+
+
+async def _queued_write(database):
+    holder = asyncio.create_task(_hold_write_lock(database, WRITE_TIMEOUT * 3))
+    await asyncio.sleep(0)
+    await database.update_user_balance(USER_ID, 5, "game", "Dice roll")
+    await holder
+
+
+def test_writer_queue_is_not_a_failure(database, run, circuit):
+    run(_queued_write(database))
+
+    assert run(database.get_user(USER_ID)).balance == 5
+    assert circuit.failures == 0
+    assert circuit.stats["timeouts"] == 0
+
+
+def test_slow_statement_times_out(database, run, circuit):
+    original = database._apply_balance_change
+
+    async def slow_apply(*args, **kwargs):
+        await asyncio.sleep(WRITE_TIMEOUT * 3)
+        return await original(*args, **kwargs)
+
+    with patch.object(database, "_apply_balance_change", slow_apply):
+        with pytest.raises(DatabaseUnavailable) as error:
+            run(database.update_user_balance(USER_ID, 5, "game", "Dice roll"))
+
+    assert error.value.reason == "timeout"
+    assert error.value.outcome_unknown
+    assert circuit.failures == 1
+    assert run(database.get_user(USER_ID)).balance == 0
+
+
+def test_commit_is_not_timed(database, run, circuit):
+    original = AsyncSession.commit
+
+    async def slow_commit(session):
+        session.sync_session.dispatch.before_commit(session.sync_session)
+        await asyncio.sleep(WRITE_TIMEOUT * 3)
+        return await original(session)
+
+    with patch.object(AsyncSession, "commit", slow_commit):
+        run(database.update_user_balance(USER_ID, 5, "game", "Dice roll"))
+
+    assert run(database.get_user(USER_ID)).balance == 5
+    assert circuit.failures == 0
+
+
+def test_unguarded_writes_are_not_timed(database, run, circuit):
+    # Background jobs use write_session() outside guarded calls
+    run(_hold_write_lock(database, WRITE_TIMEOUT * 2))
+
+
+def _message():
+    return Message.model_validate({
+        "message_id": 1, "date": 0, "text": "🎁 Daily Bonus",
+        "chat": {"id": USER_ID, "type": "private"},
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "Test"},
+    })
+
+
+@pytest.mark.parametrize("reason, text", [
+    ("timeout", WRITE_UNKNOWN_TEXT),
+    ("error", WRITE_UNKNOWN_TEXT),
+    ("circuit_open", MONEY_UNAVAILABLE_TEXT),
+])
+def test_failed_write_notice(run, reason, text):
+    async def handler(event, data):
+        raise DatabaseUnavailable("claim_daily_bonus", "write", reason)
+
+    with patch.object(Message, "answer", AsyncMock()) as answer:
+        run(DegradedModeMiddleware()(handler, _message(), {}))
+
+    assert answer.await_args.args[0] == text
@@ -0,0 +1,59 @@
+"""
+Packed eligibility index of roll and bonus cooldowns.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from database.eligibility import Eligibility, EligibilityIndex
+from conftest import USER_ID
+
+
+def _user(user_id, last_dice_roll=None, last_daily_bonus=None, daily_rolls_count=0):
+    return SimpleNamespace(user_id=user_id, last_dice_roll=last_dice_roll,
+                           last_daily_bonus=last_daily_bonus, daily_rolls_count=daily_rolls_count)
+
+
+def test_update_inserts_in_order_and_replaces():
+    index = EligibilityIndex()
+    rolled_at = datetime(2024, 5, 1, 12, 30, 15, 999999)
+    for user_id in (30, 10, 20):
+        index.update(_user(user_id))
+    index.update(_user(20, last_dice_roll=rolled_at, daily_rolls_count=300))
+
+    assert len(index) == 3
+    assert list(index._user_ids) == [10, 20, 30]
+    # Truncated to whole seconds, roll count clamped to one byte
+    assert index.get(20) == Eligibility(rolled_at.replace(microsecond=0), None, 255)
+    assert index.get(10) == Eligibility(None, None, 0)
+    assert index.get(15) is None
+    assert index.stats() == {"size": 3, "bytes": 3 * 17}
+
+
+def test_extend_requires_sorted_rows():
+    index = EligibilityIndex()
+    index.extend([(1, None, None, 0), (5, None, None, 2)])
+
+    with pytest.raises(ValueError):
+        index.extend([(3, None, None, 0)])
+    assert index.get(5).daily_rolls_count == 2
+
+
+def test_load_from_users_table(database, run):
+    for user_id in (3003, 3001, 3002):
+        run(database.create_user(user_id))
+    run(database.record_dice_roll(3002, 4, 40, cooldown=300, max_rolls=10))
+    database._eligibility.clear()
+
+    assert run(database.load_eligibility_index(chunk_size=2)) == 4
+    assert database.eligibility.get(3002).daily_rolls_count == 1
+    assert database.eligibility.get(3002).last_dice_roll is not None
+    assert database.eligibility.get(USER_ID) == Eligibility(None, None, 0)
+
+
+def test_stale_index_is_confirmed_by_the_locked_row(database, run):
+    assert run(database.record_dice_roll(USER_ID, 4, 40, cooldown=300, max_rolls=10)) is not None
+    # The index missed the roll (made by another process, say)
+    database.eligibility.update(_user(USER_ID))
+
+    assert run(database.record_dice_roll(USER_ID, 4, 40, cooldown=300, max_rolls=10)) is None
+    assert run(database.get_user(USER_ID)).balance == 40
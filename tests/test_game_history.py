@@ -0,0 +1,75 @@
+"""
+Game history compaction and stats over raw and daily rows.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from database.models import GameHistory, GameHistoryDaily
+from conftest import USER_ID
+
+OTHER_USER_ID = 2002
+
+
+async def _add_plays(database, plays):
+    """Insert raw plays given as (user_id, days ago, dice value)."""
+    now = datetime.utcnow()
+    async with database.session_factory() as session:
+        session.add_all(
+            GameHistory(user_id=user_id, dice_value=value, reward=value * 10,
+                        played_at=now - timedelta(days=days_ago))
+            for user_id, days_ago, value in plays
+        )
+        await session.commit()
+
+
+async def _count(database, model):
+    async with database.session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar()
+
+
+def _seed(database, run):
+    run(database.create_user(OTHER_USER_ID, "other"))
+    run(_add_plays(database, [
+        (USER_ID, 40, 6), (USER_ID, 40, 6), (USER_ID, 35, 1), (USER_ID, 1, 3),
+        (OTHER_USER_ID, 40, 2), (OTHER_USER_ID, 0, 5),
+    ]))
+
+
+def test_compaction_keeps_totals(database, run):
+    _seed(database, run)
+    before = run(database.get_game_stats(USER_ID))
+    everyone = run(database.get_game_stats())
+
+    folded = run(database.compact_game_history(raw_days=30, batch_size=2))
+
+    assert folded == 4
+    assert run(_count(database, GameHistory)) == 2
+    # Two days for USER_ID, one for OTHER_USER_ID
+    assert run(_count(database, GameHistoryDaily)) == 3
+    assert run(database.get_game_stats(USER_ID)) == before
+    assert run(database.get_game_stats()) == everyone
+    assert before == {"plays": 4, "reward": 160.0, "dice": {1: 1, 2: 0, 3: 1, 4: 0, 5: 0, 6: 2}}
+
+
+def test_compaction_is_resumable(database, run):
+    _seed(database, run)
+    run(database.compact_game_history(raw_days=30))
+    # Nothing left to fold; a second run changes nothing
+    assert run(database.compact_game_history(raw_days=30)) == 0
+    assert run(database.get_game_stats(USER_ID))["plays"] == 4
+
+
+def test_stats_since_include_compacted_days(database, run):
+    _seed(database, run)
+    run(database.compact_game_history(raw_days=30))
+
+    since = datetime.utcnow() - timedelta(days=36)
+    assert run(database.get_game_stats(USER_ID, since=since))["plays"] == 2
+
+
+def test_cached_stats_dropped_by_compaction(database, run):
+    _seed(database, run)
+    run(database.get_user_game_stats(USER_ID))
+    assert database.game_stats.get(USER_ID) is not None
+
+    run(database.compact_game_history(raw_days=30))
+    assert database.game_stats.get(USER_ID) is None
@@ -0,0 +1,86 @@
+"""
+Bulk user import.
+"""
+import json
+import pytest
+from sqlalchemy import select
+from database.models import Transaction, User
+from import_users import import_users
+from conftest import USER_ID
+
+
+async def _users(database):
+    async with database.session_factory() as session:
+        result = await session.execute(select(User))
+        return {user.user_id: user for user in result.scalars()}
+
+
+async def _opening_balances(database):
+    async with database.session_factory() as session:
+        result = await session.execute(
+            select(Transaction.user_id, Transaction.amount).where(Transaction.transaction_type == "opening_balance")
+        )
+        return dict(result.all())
+
+
+@pytest.fixture
+def import_file(tmp_path):
+    """Write records to a JSONL file and return its path."""
+    def write(records):
+        path = tmp_path / "users.jsonl"
+        path.write_text("".join(json.dumps(record) + "\n" for record in records))
+        return str(path)
+    return write
+
+
+def test_import_merges_users(database, run, import_file, tmp_path):
+    run(database.update_user_balance(USER_ID, 100, "bonus", "Bonus"))
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "user_id,username,balance,referrer_id,join_date\n"
+        f"{USER_ID},renamed,250,,\n"
+        "3001,new,40,9999,2024-01-02T03:04:05\n"
+        "3002,dup,1,,\n"
+        "3002,,5,,\n"
+    )
+
+    result = run(import_users(str(path), "csv", batch_size=2))
+
+    assert result["rows"] == 4
+    assert result["users"] == 3
+    assert result["invalid_referrers"] == 1
+    users = run(_users(database))
+    assert users[USER_ID].username == "renamed"
+    assert users[USER_ID].first_name == "Test"
+    assert users[3001].referrer_id is None
+    # The last row of a user wins
+    assert users[3002].balance == 5
+    assert run(_opening_balances(database)) == {USER_ID: 150, 3001: 40, 3002: 5}
+
+
+def test_referral_counts_are_recomputed(database, run, import_file):
+    run(database.create_user(3001, "referred", referrer_id=USER_ID))
+    path = import_file([
+        {"user_id": USER_ID, "referral_count": 50},
+        # Moves from USER_ID to a new referrer
+        {"user_id": 3001, "referrer_id": 3003, "referral_count": 7},
+        {"user_id": 3002, "referrer_id": 3003},
+        {"user_id": 3003, "referral_count": 0},
+    ])
+
+    run(import_users(path, "jsonl"))
+
+    users = run(_users(database))
+    assert {user_id: user.referral_count for user_id, user in users.items()} == {
+        USER_ID: 0, 3001: 0, 3002: 0, 3003: 2,
+    }
+
+
+def test_progress_is_logged(database, run, import_file, capsys, caplog):
+    path = import_file([{"user_id": 3000 + n} for n in range(3)])
+
+    with caplog.at_level("INFO"):
+        run(import_users(path, "jsonl", batch_size=2))
+
+    assert capsys.readouterr().out == ""
+    assert sum("Staged" in message for message in caplog.messages) == 2
@@ -0,0 +1,77 @@
+"""
+Ledger reconciliation and the per-tenant alert job.
+"""
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from sqlalchemy import update
+import bot as bot_module
+from config import ADMIN_ID
+from database.models import Transaction, User
+from conftest import USER_ID
+
+
+@pytest.fixture
+def ledger(database):
+    """Database whose reconciliation also sees transactions made just now."""
+    with patch("database.db.ROLLUP_LAG_SECONDS", -60):
+        yield database
+
+
+async def _set_balance(database, balance):
+    async with database.session_factory() as session:
+        await session.execute(update(User).where(User.user_id == USER_ID).values(balance=balance))
+        await session.commit()
+
+
+async def _add_transaction(database, amount, days_ago=1):
+    async with database.session_factory() as session:
+        session.add(Transaction(user_id=USER_ID, transaction_type="bonus", amount=amount,
+                                created_at=datetime.utcnow() - timedelta(days=days_ago)))
+        await session.commit()
+
+
+def test_consistent_ledger(ledger, run):
+    run(ledger.update_user_balance(USER_ID, 100, "bonus", "Bonus"))
+    run(ledger.update_user_balance(USER_ID, -40, "game", "Dice roll"))
+
+    assert run(ledger.reconcile_ledger()) == []
+    assert run(ledger.reconcile_ledger()) == []
+
+
+def test_sweep_finds_balance_changed_without_transaction(ledger, run):
+    run(ledger.update_user_balance(USER_ID, 100, "bonus", "Bonus"))
+    run(ledger.reconcile_ledger())
+
+    run(_set_balance(ledger, 250))
+    mismatches = run(ledger.reconcile_ledger())
+
+    assert mismatches == [{"user_id": USER_ID, "expected": 100.0, "actual": 250.0, "difference": 150.0}]
+    # The checkpoint moved on, so the same difference is reported once
+    assert run(ledger.reconcile_ledger()) == []
+
+
+def test_transaction_batch_finds_unapplied_transaction(ledger, run):
+    run(ledger.update_user_balance(USER_ID, 100, "bonus", "Bonus"))
+    run(_add_transaction(ledger, 30))
+
+    with patch.object(ledger, "_reconcile_sweep", AsyncMock(return_value=[])):
+        mismatches = run(ledger.reconcile_ledger(batch_size=1))
+
+    assert [mismatch["difference"] for mismatch in mismatches] == [-30.0]
+
+
+def test_failing_tenant_does_not_skip_the_others(database, run):
+    mismatch = {"user_id": USER_ID, "expected": 0.0, "actual": 5.0, "difference": 5.0}
+    tenant_bots = [MagicMock(send_message=AsyncMock()) for _ in range(2)]
+
+    with patch.object(bot_module, "tenants", [(tenant_bots[0], "tenant_a"), (tenant_bots[1], "tenant_b")]), \
+            patch.object(database, "reconcile_ledger", AsyncMock(side_effect=[RuntimeError("schema"), [mismatch]])), \
+            patch.object(bot_module.bot, "send_message", AsyncMock()) as send_message:
+        run(bot_module.reconcile_ledger())
+
+    # Alerts go through the main bot, labelled with the tenant
+    assert send_message.await_count == 1
+    assert send_message.await_args.args[0] == ADMIN_ID
+    assert "(tenant_b)" in send_message.await_args.args[1]
+    assert not any(tenant_bot.send_message.called for tenant_bot in tenant_bots)
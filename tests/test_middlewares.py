@@ -0,0 +1,56 @@
+"""
+Update middlewares.
+"""
+import asyncio
+from unittest.mock import MagicMock
+from utils.middlewares import CallbackCoalescingMiddleware
+from conftest import make_callback
+
+HANDLER_SECONDS = 0.1
+
+
+def test_duplicate_taps_share_one_handler_run(run):
+    coalescer = CallbackCoalescingMiddleware()
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event)
+        await asyncio.sleep(HANDLER_SECONDS)
+        return "done"
+
+    async def tap(delay):
+        await asyncio.sleep(delay)
+        callback = make_callback("roll_dice")
+        callback.message.message_id = 7
+        return await coalescer(handler, callback, {"bot": MagicMock(id=1)})
+
+    async def taps():
+        return await asyncio.gather(tap(0), tap(0.01), tap(0.05), tap(0.08))
+
+    results = run(taps())
+
+    assert results == ["done"] * 4
+    assert len(calls) == 1
+    assert coalescer.stats["executed"] == 1
+    assert coalescer.stats["coalesced"] == 3
+    # Each follower saved one handler run, however long it waited
+    assert 3 * HANDLER_SECONDS <= coalescer.stats["saved_seconds"] < 3 * HANDLER_SECONDS + 0.05
+
+
+def test_taps_on_other_buttons_run_separately(run):
+    coalescer = CallbackCoalescingMiddleware()
+
+    async def handler(event, data):
+        await asyncio.sleep(0.01)
+        return event.data
+
+    async def tap(data):
+        callback = make_callback(data)
+        callback.message.message_id = 7
+        return await coalescer(handler, callback, {"bot": MagicMock(id=1)})
+
+    async def taps():
+        return await asyncio.gather(tap("roll_dice"), tap("daily_bonus"))
+
+    assert run(taps()) == ["roll_dice", "daily_bonus"]
+    assert coalescer.stats["coalesced"] == 0
@@ -0,0 +1,72 @@
+"""
+Live handler profiler.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from aiogram import Router
+from utils.profiler import HandlerProfiler
+
+
+def _busy(seconds):
+    """Burn CPU on the event loop thread."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def profiled_handler(event, data):
+    for _ in range(5):
+        _busy(0.01)
+        await asyncio.sleep(0.005)
+
+
+async def other_handler(event, data):
+    for _ in range(5):
+        _busy(0.01)
+        await asyncio.sleep(0.005)
+
+
+async def background_job():
+    for _ in range(5):
+        _busy(0.01)
+        await asyncio.sleep(0.005)
+
+
+def _sampled_functions(profiler):
+    return {label.split(":")[-1] for stack in profiler.samples for label in stack}
+
+
+def test_filtered_session_only_samples_that_handler(run):
+    profiler = HandlerProfiler(interval=0.001)
+
+    async def session():
+        profiler.start([Router().message], duration=10, handler_name="profiled_handler")
+        await asyncio.gather(
+            profiler(profiled_handler, None, {"handler": SimpleNamespace(callback=profiled_handler)}),
+            profiler(other_handler, None, {"handler": SimpleNamespace(callback=other_handler)}),
+            background_job(),
+        )
+        profiler.stop()
+
+    run(session())
+
+    functions = _sampled_functions(profiler)
+    assert "profiled_handler" in functions
+    assert "other_handler" not in functions
+    assert "background_job" not in functions
+    assert profiler.updates == 1
+
+
+def test_session_stops_after_max_updates(run):
+    profiler = HandlerProfiler(interval=0.001)
+
+    async def session():
+        profiler.start([Router().message], duration=10, max_updates=2)
+        for _ in range(2):
+            await profiler(profiled_handler, None, {"handler": SimpleNamespace(callback=profiled_handler)})
+
+    run(session())
+
+    assert not profiler.running
+    assert profiler.top_functions()[0][0].endswith(":_busy")
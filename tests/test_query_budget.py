@@ -0,0 +1,92 @@
+"""
+Query budgets of the hot handlers.
+Config values are warmed first: in production they are cached for an hour.
+"""
+import pytest
+from sqlalchemy import insert
+from config import DEFAULT_CONFIG
+from database.models import Transaction
+from database.tracer import assert_max_queries
+from handlers.games import roll_dice_callback
+from handlers.user import balance_handler, daily_bonus_handler, profile_handler, render_transactions_page, transactions_handler
+from conftest import USER_ID, make_callback, make_message
+
+
+@pytest.fixture
+def warm_config(database, run):
+    """Load every config value into the config cache."""
+    for key, value in DEFAULT_CONFIG.items():
+        run(database.get_config(key, value))
+    return database
+
+
+def test_dice_roll(warm_config, run):
+    # Lock the user row, update it, insert game history and the ledger entry
+    with assert_max_queries(4, "roll_dice_callback"):
+        run(roll_dice_callback(make_callback("roll_dice"), None))
+
+    # Cooldown answered from the eligibility index
+    callback = make_callback("roll_dice")
+    with assert_max_queries(0, "roll_dice_callback on cooldown"):
+        run(roll_dice_callback(callback, None))
+    assert callback.answer.await_args.args[0].startswith("⏳")
+
+
+def test_daily_bonus(warm_config, run):
+    with assert_max_queries(3, "daily_bonus_handler"):
+        run(daily_bonus_handler(make_message("🎁 Daily Bonus")))
+
+    message = make_message("🎁 Daily Bonus")
+    with assert_max_queries(0, "daily_bonus_handler on cooldown"):
+        run(daily_bonus_handler(message))
+    assert message.answer.await_args.args[0].startswith("⏳")
+
+
+def test_profile_and_balance(warm_config, run):
+    # Game stats are read once, then served with the snapshot from cache
+    run(profile_handler(make_message("👤 Profile")))
+    message = make_message("👤 Profile")
+    with assert_max_queries(0, "profile_handler"):
+        run(profile_handler(message))
+    with assert_max_queries(0, "balance_handler"):
+        run(balance_handler(make_message("💰 Balance")))
+
+    # A roll drops the cached stats
+    run(roll_dice_callback(make_callback("roll_dice"), None))
+    message = make_message("👤 Profile")
+    run(profile_handler(message))
+    assert "Rolls: 1\n" in message.answer.await_args.args[0]
+
+
+def test_transactions_page(warm_config, run):
+    for _ in range(15):
+        run(warm_config.update_user_balance(USER_ID, 5, "game", "Dice roll"))
+
+    # User check, first page and per-type totals
+    with assert_max_queries(3, "transactions_handler"):
+        run(transactions_handler(make_message("📜 Transactions")))
+
+    # Paging reuses the cached totals
+    transactions, _, _ = run(warm_config.get_user_transactions_page(USER_ID, 10))
+    cursor = (transactions[-1].created_at, transactions[-1].id)
+    with assert_max_queries(1, "render_transactions_page"):
+        text, _ = run(render_transactions_page(USER_ID, before=cursor))
+    assert "Game: ₦75.00" in text
+
+    # A new transaction drops the cached totals
+    run(warm_config.update_user_balance(USER_ID, 7, "bonus", "Bonus"))
+    text, _ = run(render_transactions_page(USER_ID))
+    assert "Bonus: ₦7.00" in text
+
+
+def test_executemany_counts_once(database, run):
+    async def insert_batch():
+        async with database.write_session() as session:
+            await session.execute(insert(Transaction), [
+                {"user_id": USER_ID, "transaction_type": "game", "amount": 1} for _ in range(50)
+            ])
+            await session.commit()
+
+    with assert_max_queries(1, "batched insert") as trace:
+        run(insert_batch())
+    assert trace.parameter_sets == 50
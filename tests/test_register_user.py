@@ -0,0 +1,73 @@
+"""
+Referral signup in one transaction.
+"""
+import re
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+from database.models import Transaction
+from conftest import USER_ID
+
+NEW_USER_ID = 3001
+
+
+async def _referral_transactions(database):
+    async with database.session_factory() as session:
+        result = await session.execute(
+            select(Transaction.user_id, Transaction.amount).where(Transaction.transaction_type == "referral")
+        )
+        return sorted(result.all())
+
+
+def test_referral_credits_both_users(database, run):
+    snapshot = run(database.register_user(NEW_USER_ID, "new", referrer_id=USER_ID, referral_reward=50))
+
+    assert snapshot.balance == 50
+    referrer = run(database.get_user(USER_ID))
+    assert (referrer.balance, referrer.total_earned, referrer.referral_count) == (50, 50, 1)
+    assert run(database.get_user(NEW_USER_ID)).referrer_id == USER_ID
+    assert run(_referral_transactions(database)) == [(USER_ID, 50), (NEW_USER_ID, 50)]
+
+
+def test_existing_user_is_not_credited_again(database, run):
+    run(database.register_user(NEW_USER_ID, "new", referrer_id=USER_ID, referral_reward=50))
+
+    assert run(database.register_user(NEW_USER_ID, "new", referrer_id=USER_ID, referral_reward=50)) is None
+    assert run(database.get_user(USER_ID)).referral_count == 1
+    assert len(run(_referral_transactions(database))) == 2
+
+
+def test_unknown_or_own_referrer_is_dropped(database, run):
+    assert run(database.register_user(NEW_USER_ID, "new", referrer_id=9999, referral_reward=50)).balance == 0
+    assert run(database.register_user(NEW_USER_ID + 1, "self", referrer_id=NEW_USER_ID + 1, referral_reward=50)).balance == 0
+
+    assert run(database.get_user(NEW_USER_ID)).referrer_id is None
+    assert run(database.get_user(NEW_USER_ID + 1)).referrer_id is None
+    assert run(_referral_transactions(database)) == []
+
+
+def test_postgres_registration_is_one_statement(database, run):
+    session = MagicMock(commit=AsyncMock(), rollback=AsyncMock())
+    session.execute = AsyncMock(return_value=MagicMock(one=MagicMock(return_value=(True, True, 2, "", ""))))
+
+    @asynccontextmanager
+    async def write_session():
+        yield session
+
+    with patch.object(database, "is_sqlite", False), patch.object(database, "write_session", write_session):
+        snapshot = run(database.register_user(NEW_USER_ID, "new", referrer_id=USER_ID, referral_reward=50))
+
+    assert snapshot.balance == 50
+    assert session.execute.await_count == 1
+    sql = str(session.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+    # The referrer is only credited through a row the insert returned, and
+    # the welcome row only if the referrer was credited
+    assert "WITH new_user AS \n(INSERT INTO users" in sql
+    assert "ON CONFLICT (user_id) DO NOTHING RETURNING users.user_id, users.referrer_id" in sql
+    assert "credited AS \n(UPDATE users SET" in sql
+    assert "WHERE users.user_id = new_user.referrer_id RETURNING users.user_id" in sql
+    assert "EXISTS (SELECT credited.user_id \nFROM credited)" in sql
+    assert sql.count("(SELECT pg_notify(") == 2
+    assert re.search(r"AS pg_notify_\d+ \nFROM new_user\)", sql)
+    assert re.search(r"AS pg_notify_\d+ \nFROM credited\)", sql)
@@ -0,0 +1,109 @@
+"""
+Timing wheel and "bonus ready" reminders.
+"""
+import math
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from aiogram.exceptions import TelegramForbiddenError
+from sqlalchemy import update
+from database.models import User
+from utils.reminders import BONUS_COOLDOWN, REMINDER_TEXTS, ReminderScheduler, TimingWheel
+from conftest import USER_ID
+
+OTHER_USER_ID = 2002
+
+
+def _fire_ticks(wheel, until):
+    """Advance the wheel one tick at a time and get the tick each key fired on."""
+    fired = {}
+    for tick in range(1, until + 1):
+        for key in wheel.advance(tick):
+            fired[key] = tick
+    return fired
+
+
+def test_keys_fire_on_their_tick_at_every_level():
+    # Level spans of 1, 4 and 16 ticks; keys beyond 64 ticks wait in the top level
+    wheel = TimingWheel(slots=4, levels=3, now=0)
+    delays = [1, 3, 4, 5, 15, 16, 17, 63, 64, 65, 150, 2.5]
+    for delay in delays:
+        wheel.schedule(delay, delay)
+
+    assert _fire_ticks(wheel, 200) == {delay: math.ceil(delay) for delay in delays}
+    assert len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    wheel = TimingWheel(slots=4, levels=3, now=0)
+    wheel.schedule("moved", 10)
+    wheel.schedule("cancelled", 10)
+    wheel.schedule("moved", 30)
+    wheel.cancel("cancelled")
+
+    assert _fire_ticks(wheel, 40) == {"moved": 30}
+
+
+def test_overdue_key_fires_on_next_advance():
+    wheel = TimingWheel(now=100)
+    wheel.schedule("late", 50)
+    assert wheel.advance(100) == ["late"]
+
+
+async def _set_user(database, user_id, **values):
+    async with database.session_factory() as session:
+        await session.execute(update(User).where(User.user_id == user_id).values(**values))
+        await session.commit()
+
+
+@pytest.fixture
+def scheduler(database, run):
+    """Scheduler with USER_ID and OTHER_USER_ID opted in and a fake bot."""
+    run(database.create_user(OTHER_USER_ID, "other"))
+    for user_id in (USER_ID, OTHER_USER_ID):
+        run(_set_user(database, user_id, reminders_enabled=True))
+    scheduler = ReminderScheduler(rate=1000)
+    run(scheduler.rebuild(MagicMock(send_message=AsyncMock())))
+    return scheduler
+
+
+def _bonus_due(scheduler, user_id):
+    scheduler.schedule(user_id, "bonus", datetime.utcnow() - timedelta(seconds=BONUS_COOLDOWN + 1), BONUS_COOLDOWN)
+
+
+def test_due_reminders_are_rechecked_before_sending(database, run, scheduler):
+    claimed_long_ago = datetime.utcnow() - timedelta(days=2)
+    run(_set_user(database, USER_ID, last_daily_bonus=claimed_long_ago))
+    # Claimed again in another process after the reminder was scheduled
+    run(_set_user(database, OTHER_USER_ID, last_daily_bonus=datetime.utcnow()))
+    for user_id in (USER_ID, OTHER_USER_ID):
+        _bonus_due(scheduler, user_id)
+
+    run(scheduler.send_due())
+
+    bot = scheduler._bots[None]
+    bot.send_message.assert_awaited_once_with(USER_ID, REMINDER_TEXTS["bonus"])
+    assert scheduler.stats["sent"] == 1
+    assert scheduler.stats["skipped"] == 1
+
+
+def test_only_opted_in_users_are_scheduled(database, run, scheduler):
+    run(database.create_user(3001, "not opted in"))
+    scheduler.schedule(3001, "bonus", datetime.utcnow(), BONUS_COOLDOWN)
+    assert len(scheduler.wheel) == 0
+
+    run(scheduler.set_enabled(run(database.get_user(USER_ID)), False))
+    _bonus_due(scheduler, USER_ID)
+    assert len(scheduler.wheel) == 0
+
+
+def test_blocked_user_stops_getting_reminders(database, run, scheduler):
+    run(_set_user(database, USER_ID, last_daily_bonus=datetime.utcnow() - timedelta(days=2)))
+    scheduler._bots[None].send_message.side_effect = TelegramForbiddenError(MagicMock(), "bot was blocked")
+    _bonus_due(scheduler, USER_ID)
+
+    run(scheduler.send_due())
+
+    assert run(database.get_user(USER_ID)).reminders_enabled is False
+    _bonus_due(scheduler, USER_ID)
+    assert len(scheduler.wheel) == 0
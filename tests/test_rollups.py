@@ -0,0 +1,69 @@
+"""
+Incremental activity rollups.
+"""
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from sqlalchemy import func, select
+from database.models import DailyActiveUser, Transaction
+from conftest import USER_ID
+
+OTHER_USER_ID = 2002
+
+
+@pytest.fixture
+def rollups(database):
+    """Database whose rollups also take rows made just now."""
+    with patch("database.db.ROLLUP_LAG_SECONDS", -60):
+        yield database
+
+
+def _today():
+    now = datetime.utcnow()
+    return datetime(now.year, now.month, now.day)
+
+
+async def _add_transaction(database, user_id, amount, days_ago):
+    async with database.session_factory() as session:
+        session.add(Transaction(user_id=user_id, transaction_type="bonus", amount=amount,
+                                created_at=datetime.utcnow() - timedelta(days=days_ago)))
+        await session.commit()
+
+
+async def _active_user_days(database):
+    async with database.session_factory() as session:
+        result = await session.execute(select(DailyActiveUser.day).distinct())
+        return sorted(database._as_datetime(day) for day in result.scalars())
+
+
+def test_rollups_count_each_row_once(rollups, run):
+    run(rollups.create_user(OTHER_USER_ID, "other"))
+    for user_id, amount in [(USER_ID, 10), (USER_ID, 5), (OTHER_USER_ID, 20)]:
+        run(rollups.update_user_balance(user_id, amount, "bonus", "Bonus"))
+
+    assert run(rollups.refresh_rollups(batch_size=2)) == 5
+    assert run(rollups.refresh_rollups()) == 0
+
+    day = run(rollups.get_rollups("day", _today()))[_today()]
+    assert day["bonus_count"] == 3
+    assert day["bonus_amount"] == 35
+    assert day["active_users"] == 2
+    assert day["new_users"] == 2
+    hours = run(rollups.get_rollups("hour", _today())).values()
+    assert sum(hour["bonus_count"] for hour in hours) == 3
+
+
+def test_finished_days_of_active_users_are_dropped(rollups, run):
+    run(_add_transaction(rollups, USER_ID, 10, days_ago=5))
+    run(rollups.update_user_balance(USER_ID, 10, "bonus", "Bonus"))
+    run(rollups.refresh_rollups())
+
+    assert run(_active_user_days(rollups)) == [_today()]
+    old_day = _today() - timedelta(days=5)
+    assert run(rollups.get_rollups("day", old_day))[old_day]["active_users"] == 1
+
+    # Today's rows are kept, so a second transaction today is not a new active user
+    run(rollups.update_user_balance(USER_ID, 10, "bonus", "Bonus"))
+    run(rollups.refresh_rollups())
+    assert run(rollups.get_rollups("day", _today()))[_today()]["active_users"] == 1
+
@@ -0,0 +1,106 @@
+"""
+Compiled routing table.
+"""
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from aiogram.types import CallbackQuery
+from utils.routing import PrefixTrie, Route, RoutingTable, routes
+
+
+def _route(name):
+    return Route(name, MagicMock())
+
+
+def test_trie_matches_longest_prefix():
+    trie = PrefixTrie()
+    for prefix in ("tx_", "tx_older_", "setting_"):
+        trie.insert(prefix, _route(prefix))
+
+    assert [(route.name, rest) for route, rest in [trie.match("tx_older_abc"), trie.match("tx_newer_abc")]] == [
+        ("tx_older_", "abc"), ("tx_", "newer_abc"),
+    ]
+    assert trie.match("tx") is None
+    assert trie.match("roll_dice") is None
+    assert trie.insert("tx_", _route("again")).name == "tx_"
+
+
+@pytest.fixture
+def table():
+    """Routing table with exact, prefix and text routes recording their calls."""
+    table = RoutingTable()
+    calls = []
+
+    @table.callback("approve_all")
+    async def approve_all(callback):
+        calls.append(("approve_all", None))
+
+    @table.callback_prefix("approve_", int)
+    async def approve_one(callback, payload):
+        calls.append(("approve_one", payload))
+
+    @table.text("💰 Balance")
+    async def balance(message, state):
+        calls.append(("balance", state))
+
+    table.calls = calls
+    return table
+
+
+def _callback(data):
+    callback = MagicMock(spec=CallbackQuery)
+    callback.data = data
+    callback.answer = AsyncMock()
+    return callback
+
+
+async def _route_callback(table, callback, **data):
+    match = await table._match_callback(callback)
+    if match:
+        await table._dispatch(callback, **match, **data)
+    return match
+
+
+def test_exact_data_wins_over_prefix(table, run):
+    run(_route_callback(table, _callback("approve_all")))
+    run(_route_callback(table, _callback("approve_42"), bot=MagicMock()))
+
+    assert table.calls == [("approve_all", None), ("approve_one", 42)]
+
+
+def test_invalid_payload_is_answered(table, run):
+    callback = _callback("approve_abc")
+    run(_route_callback(table, callback))
+
+    assert table.calls == []
+    callback.answer.assert_awaited_once_with("❌ Invalid request.")
+
+
+def test_unrouted_updates_fall_through(table, run):
+    assert run(_route_callback(table, _callback("roll_dice"))) is False
+    assert run(table._match_text(MagicMock(text="🎲 Games"))) is False
+
+
+def test_text_route_gets_the_arguments_it_accepts(table, run):
+    message = MagicMock(text="💰 Balance")
+    match = run(table._match_text(message))
+    run(table._dispatch(message, **match, state="state", bot=MagicMock()))
+
+    assert table.calls == [("balance", "state")]
+
+
+def test_duplicates_keep_the_first_handler(table, run):
+    @table.callback("approve_all")
+    async def approve_all_again(callback):
+        pass
+
+    assert not table.check()
+    assert "approve_all_again" in table.duplicates[0]
+    run(_route_callback(table, _callback("approve_all")))
+    assert table.calls == [("approve_all", None)]
+
+
+def test_bot_routes_have_no_duplicates():
+    import bot  # noqa: F401  registers every handler
+
+    assert routes.check()
+    assert {"roll_dice_callback", "approve_withdrawal_callback", "balance_handler"} <= set(routes.names())
@@ -0,0 +1,33 @@
+"""
+Economy simulator: variants of the settings share the random draws.
+"""
+from dataclasses import replace
+import numpy as np
+import pytest
+from simulate_economy import PAYOUT_TABLES, Behavior, default_settings, run_simulation
+
+
+def _daily_payouts(settings, seed=7):
+    results = run_simulation(settings, Behavior(), PAYOUT_TABLES["handler"], n_users=2000, days=10, trials=2, seed=seed)
+    return np.concatenate([result["daily_payout"] for result in results])
+
+
+@pytest.mark.parametrize("base, change", [
+    ({"max_daily_rolls": 8, "dice_cooldown": 60}, {"max_daily_rolls": 12}),
+    ({"max_daily_rolls": 50, "dice_cooldown": 600}, {"dice_cooldown": 300}),
+    ({}, {"daily_bonus": 150.0}),
+    ({}, {"referral_reward": 80.0}),
+])
+def test_more_generous_setting_never_pays_less(base, change):
+    # Nobody withdraws, so every day's payout only depends on the settings
+    settings = replace(default_settings(), min_withdrawal=1e12, **base)
+    baseline = _daily_payouts(settings)
+    variant = _daily_payouts(replace(settings, **change))
+
+    assert (variant >= baseline).all()
+    assert variant.sum() > baseline.sum()
+
+def test_same_seed_same_result():
+    settings = default_settings()
+    assert (_daily_payouts(settings) == _daily_payouts(settings)).all()
+    assert (_daily_payouts(settings) != _daily_payouts(settings, seed=8)).any()
@@ -0,0 +1,92 @@
+"""
+Withdrawal request lifecycle.
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from sqlalchemy import select
+from config import ADMIN_ID
+from database.models import Transaction, WithdrawRequest
+from handlers.admin import admin_pending_withdrawals_callback, admin_take_withdrawals_callback
+from handlers.user import process_withdrawal_amount
+from conftest import USER_ID, make_callback, make_message
+
+
+@pytest.fixture
+def request_id(database, run):
+    """A pending 1500 withdrawal of a user who had 2000."""
+    run(database.update_user_balance(USER_ID, 2000, "bonus", "Funding"))
+    return run(database.request_withdrawal(USER_ID, 1500))
+
+
+async def _refunds(database):
+    async with database.session_factory() as session:
+        result = await session.execute(
+            select(Transaction).where(Transaction.transaction_type == "withdrawal_refund")
+        )
+        return result.scalars().all()
+
+
+async def _status(database, request_id):
+    async with database.session_factory() as session:
+        return (await session.get(WithdrawRequest, request_id)).status
+
+
+def test_reject_refunds(database, run, request_id):
+    request = run(database.finish_withdrawal(request_id, "admin", approve=False))
+
+    assert request.status == "rejected"
+    assert run(database.get_user(USER_ID)).balance == 2000
+    assert len(run(_refunds(database))) == 1
+
+
+def test_reject_of_missing_user_is_not_refunded(database, run, request_id):
+    with patch.object(database, "_get_user_row", AsyncMock(return_value=None)):
+        request = run(database.finish_withdrawal(request_id, "admin", approve=False))
+
+    assert request.status == "rejected"
+    assert run(_status(database, request_id)) == "rejected"
+    assert run(_refunds(database)) == []
+
+
+def test_finish_is_idempotent(database, run, request_id):
+    assert run(database.finish_withdrawal(request_id, "admin", approve=True)).status == "paid"
+    assert run(database.finish_withdrawal(request_id, "admin", approve=False)) is None
+    assert run(database.get_user(USER_ID)).balance == 500
+
+
+@pytest.mark.parametrize("text", ["nan", "inf", "-5", "0"])
+def test_invalid_amount_message(database, run, text):
+    message = make_message(text)
+    state = MagicMock(clear=AsyncMock())
+
+    run(process_withdrawal_amount(message, state))
+
+    assert message.answer.await_args.args[0] == "❌ Please enter a valid amount"
+
+
+@pytest.mark.parametrize("admin_id, notified", [(0, False), (42, True)])
+def test_admin_notified_only_when_configured(database, run, admin_id, notified):
+    run(database.update_user_balance(USER_ID, 2000, "bonus", "Funding"))
+    message = make_message("1500")
+    message.bot.send_message = AsyncMock()
+
+    with patch("handlers.user.ADMIN_ID", admin_id):
+        run(process_withdrawal_amount(message, MagicMock(clear=AsyncMock())))
+
+    assert message.bot.send_message.called == notified
+    assert "Withdrawal Request Submitted" in message.answer.await_args.args[0]
+
+
+def test_listing_pending_withdrawals_claims_nothing(database, run, request_id):
+    # Viewing the list again (or by another admin) still shows the request
+    for _ in range(2):
+        callback = make_callback("admin_pending_withdrawals", user_id=ADMIN_ID)
+        run(admin_pending_withdrawals_callback(callback))
+        assert f"#{request_id}" in callback.message.edit_text.await_args.args[0]
+    assert run(_status(database, request_id)) == "pending"
+
+    callback = make_callback("admin_take_withdrawals", user_id=ADMIN_ID)
+    callback.message.answer = AsyncMock()
+    run(admin_take_withdrawals_callback(callback))
+    assert run(_status(database, request_id)) == "processing"
+    assert callback.message.answer.await_count == 1
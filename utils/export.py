@@ -0,0 +1,71 @@
+"""
+Streaming data export for admins.
+"""
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from database.db import db, EXPORT_TABLES
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_CHUNK_SIZE = 5000
+
+
+def _serialize(value):
+    """Convert a database value to an export-friendly value."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _write_chunk(stream, fmt: str, columns: List[str], rows: List[Dict]):
+    """Write one chunk of rows to an open export stream."""
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerows([[_serialize(row[column]) for column in columns] for row in rows])
+    else:
+        stream.writelines(
+            json.dumps({column: _serialize(row[column]) for column in columns}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+
+async def export_table(table_name: str, fmt: str = "csv", start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Tuple[str, int]:
+    """Export a table to a gzip-compressed temp file.
+
+    Rows are streamed from the database in chunks and written as they
+    arrive, so memory use does not depend on the size of the export.
+    Returns the file path and the number of exported rows; the caller
+    is responsible for removing the file.
+    """
+    if table_name not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export table: {table_name}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    model, _ = EXPORT_TABLES[table_name]
+    columns = [column.name for column in model.__table__.columns]
+
+    fd, path = tempfile.mkstemp(prefix=f"{table_name}_", suffix=f".{fmt}.gz")
+    os.close(fd)
+
+    row_count = 0
+    try:
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as stream:
+            if fmt == "csv":
+                csv.writer(stream).writerow(columns)
+
+            async for rows in db.iter_table_rows(table_name, start, end, EXPORT_CHUNK_SIZE):
+                # Compression is CPU-bound, keep it off the event loop
+                await asyncio.to_thread(_write_chunk, stream, fmt, columns, rows)
+                row_count += len(rows)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return path, row_count
@@ -2,6 +2,7 @@
 Helper functions for the Telegram bot.
 """
 from datetime import datetime, timedelta
+from typing import Optional
 from config import ADMIN_ID
 
 
@@ -37,6 +38,14 @@ def can_roll_dice(user, cooldown_seconds: int = 300) -> tuple[bool, str]:
     return True, ""
 
 
+def get_daily_rolls(user, now: datetime = None) -> int:
+    """Get number of dice rolls the user made today (UTC)."""
+    now = now or datetime.utcnow()
+    if not user.last_dice_roll or user.last_dice_roll.date() != now.date():
+        return 0
+    return user.daily_rolls_count or 0
+
+
 def can_claim_daily_bonus(user) -> tuple[bool, str]:
     """Check if user can claim daily bonus."""
     if not user.last_daily_bonus:
@@ -74,36 +83,102 @@ def format_user_profile(user) -> str:
     profile += f"💰 Balance: {format_currency(user.balance)}\n"
     profile += f"💎 Total Earned: {format_currency(user.total_earned)}\n"
     profile += f"👥 Referrals: {user.referral_count}\n"
-    profile += f"🎲 Daily Rolls: {user.daily_rolls_count}\n"
+    profile += f"🎲 Daily Rolls: {get_daily_rolls(user)}\n"
     
     return profile
 
 
-def format_transaction(transaction) -> str:
+TRANSACTION_EMOJI = {
+    "game": "🎲",
+    "bonus": "🎁",
+    "referral": "👥",
+    "withdrawal": "💸"
+}
+
+WITHDRAWAL_STATUS_EMOJI = {
+    "pending": "⏳",
+    "processing": "🔄",
+    "paid": "✅",
+    "rejected": "❌"
+}
+
+CURSOR_EPOCH = datetime(1970, 1, 1)
+
+
+def format_transaction(transaction, currency_symbol: str = "₦") -> str:
     """Format transaction for display."""
-    emoji_map = {
-        "game": "🎲",
-        "bonus": "🎁",
-        "referral": "👥",
-        "withdrawal": "💸"
-    }
-    
-    emoji = emoji_map.get(transaction.transaction_type, "💰")
-    amount_str = format_currency(transaction.amount)
+    emoji = TRANSACTION_EMOJI.get(transaction.transaction_type, "💰")
+    amount_str = format_currency(transaction.amount, currency_symbol)
     date_str = format_datetime(transaction.created_at)
     
     return f"{emoji} {amount_str} - {transaction.transaction_type.title()}\n📅 {date_str}"
 
 
+def format_transaction_summary(totals: dict, currency_symbol: str = "₦") -> str:
+    """Format per-type transaction totals as a single line."""
+    return " · ".join(
+        f"{TRANSACTION_EMOJI.get(transaction_type, '💰')} {transaction_type.replace('_', ' ').title()}: "
+        f"{format_currency(total, currency_symbol)}"
+        for transaction_type, total in sorted(totals.items())
+    )
+
+
+def encode_page_cursor(transaction) -> str:
+    """Encode a transaction's (created_at, id) keyset cursor for callback data."""
+    microseconds = (transaction.created_at - CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{microseconds}_{transaction.id}"
+
+
+def decode_page_cursor(cursor: str) -> tuple:
+    """Decode a keyset cursor produced by encode_page_cursor."""
+    microseconds, transaction_id = cursor.split("_")
+    return CURSOR_EPOCH + timedelta(microseconds=int(microseconds)), int(transaction_id)
+
+
+def format_sparkline(values: list) -> str:
+    """Format a series of numbers as a unicode sparkline."""
+    bars = "▁▂▃▄▅▆▇█"
+    if not values:
+        return ""
+    top = max(values)
+    if top <= 0:
+        return bars[0] * len(values)
+    return "".join(bars[min(int(value / top * (len(bars) - 1)), len(bars) - 1)] for value in values)
+
+
+def format_game_stats(stats: dict) -> str:
+    """Format a user's game totals and dice value distribution."""
+    faces = "⚀⚁⚂⚃⚄⚅"
+    text = f"\n🎲 <b>Games</b>\n"
+    text += f"Rolls: {stats['plays']}\n"
+    text += f"Won: {format_currency(stats['reward'])}\n"
+    if stats["plays"]:
+        text += " ".join(f"{faces[value - 1]} {count}" for value, count in sorted(stats["dice"].items())) + "\n"
+    return text
+
+
+def format_ledger_alert(mismatches: list, currency_symbol: str = "₦", tenant: Optional[str] = None,
+                        limit: int = 20) -> str:
+    """Format ledger reconciliation mismatches for the admin alert, naming the tenant schema if any."""
+    text = f"⚠️ <b>Ledger Mismatch</b>" + (f" ({tenant})" if tenant else "") + "\n\n"
+    text += f"{len(mismatches)} balance(s) do not match their transactions:\n\n"
+    for mismatch in mismatches[:limit]:
+        text += f"👤 {mismatch['user_id']}: balance {format_currency(mismatch['actual'], currency_symbol)}, "
+        text += f"ledger {format_currency(mismatch['expected'], currency_symbol)} "
+        text += f"({mismatch['difference']:+,.2f})\n"
+    if len(mismatches) > limit:
+        text += f"\n...and {len(mismatches) - limit} more (see logs)"
+    return text
+
+
+def get_withdrawal_worker(admin_id: int) -> str:
+    """Get the withdrawal queue worker name of an admin."""
+    return f"admin:{admin_id}"
+
+
 def format_withdrawal_request(request) -> str:
     """Format withdrawal request for admin display."""
-    status_emoji = {
-        "pending": "⏳",
-        "paid": "✅",
-        "rejected": "❌"
-    }
-    
-    emoji = status_emoji.get(request.status, "❓")
+    emoji = WITHDRAWAL_STATUS_EMOJI.get(request.status, "❓")
     amount_str = format_currency(request.amount)
     date_str = format_datetime(request.created_at)
     
@@ -45,6 +45,23 @@ def get_dice_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+def get_transactions_keyboard(older_cursor: str = None, newer_cursor: str = None) -> InlineKeyboardMarkup:
+    """Get transaction history navigation keyboard."""
+    buttons = []
+    if newer_cursor:
+        buttons.append(InlineKeyboardButton(text="⬅️ Newer", callback_data=f"tx_newer_{newer_cursor}"))
+    if older_cursor:
+        buttons.append(InlineKeyboardButton(text="Older ➡️", callback_data=f"tx_older_{older_cursor}"))
+    
+    if not buttons:
+        return None
+    
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[buttons]
+    )
+    return keyboard
+
+
 def get_withdrawal_keyboard() -> InlineKeyboardMarkup:
     """Get withdrawal confirmation keyboard."""
     keyboard = InlineKeyboardMarkup(
@@ -71,6 +88,17 @@ def get_admin_withdrawal_keyboard(request_id: int) -> InlineKeyboardMarkup:
     return keyboard
 
 
+def get_pending_withdrawals_keyboard() -> InlineKeyboardMarkup:
+    """Get pending withdrawals list keyboard."""
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📥 Take Batch", callback_data="admin_take_withdrawals")],
+            [InlineKeyboardButton(text="❌ Cancel", callback_data="cancel_operation")]
+        ]
+    )
+    return keyboard
+
+
 def get_admin_panel_keyboard() -> InlineKeyboardMarkup:
     """Get admin panel keyboard."""
     keyboard = InlineKeyboardMarkup(
@@ -79,7 +107,8 @@ def get_admin_panel_keyboard() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="💸 Pending Withdrawals", callback_data="admin_pending_withdrawals")],
             [InlineKeyboardButton(text="⚙️ Settings", callback_data="admin_settings")],
             [InlineKeyboardButton(text="📢 Broadcast", callback_data="admin_broadcast")],
-            [InlineKeyboardButton(text="📊 Statistics", callback_data="admin_stats")]
+            [InlineKeyboardButton(text="📊 Statistics", callback_data="admin_stats")],
+            [InlineKeyboardButton(text="📈 Trends", callback_data="admin_trends")]
         ]
     )
     return keyboard
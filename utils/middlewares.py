@@ -0,0 +1,170 @@
+"""
+Middlewares for the Telegram bot.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, Union
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from database.circuit import DatabaseUnavailable
+from database.db import db
+from database.tenancy import use_tenant
+from utils.logger import logger
+from utils.routing import handler_name
+
+MONEY_UNAVAILABLE_TEXT = "⚠️ Balance changes, games and withdrawals are temporarily unavailable. Please try again in a few minutes."
+WRITE_UNKNOWN_TEXT = "⚠️ We couldn't confirm that your last action went through. Please check your balance before trying again."
+DEGRADED_TEXT = "⚠️ We're having technical difficulties. Please try again in a few minutes."
+STALE_DATA_NOTICE = "\n⚠️ <i>Showing last known data; some features are temporarily unavailable.</i>"
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Run each update in the database schema of the bot that received it.
+
+    Bots without a registered tenant (the main bot) use the default schema.
+    """
+
+    def __init__(self):
+        self._tenants: Dict[int, Optional[str]] = {}
+
+    def register(self, bot_id: int, tenant: Optional[str]):
+        """Map a bot to its tenant schema."""
+        self._tenants[bot_id] = tenant
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        with use_tenant(self._tenants.get(data["bot"].id)):
+            return await handler(event, data)
+
+
+class CallbackCoalescingMiddleware(BaseMiddleware):
+    """Run identical in-flight callbacks only once.
+
+    Repeated taps on the same button of the same message by the same user
+    are attached to the handler run that is already in progress. They wait
+    for its result and are answered with an empty callback answer instead
+    of executing the handler (and its database round trips) again.
+    """
+
+    def __init__(self):
+        # Futures resolve to the leader's (result, handler seconds)
+        self._in_flight: Dict[Tuple[int, int, str, Union[int, str]], asyncio.Future] = {}
+        self.stats = {
+            "executed": 0,
+            "coalesced": 0,
+            "failed": 0,
+            "saved_seconds": 0.0,
+        }
+
+    @staticmethod
+    def _key(event: CallbackQuery, bot_id: int) -> Tuple[int, int, str, Union[int, str]]:
+        """Build the (bot_id, user_id, callback_data, message_id) coalescing key."""
+        message_id = event.message.message_id if event.message else event.inline_message_id
+        return bot_id, event.from_user.id, event.data, message_id
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        key = self._key(event, data["bot"].id)
+        in_flight = self._in_flight.get(key)
+
+        if in_flight:
+            # Duplicate tap: wait for the running handler and answer cheaply
+            self.stats["coalesced"] += 1
+            result, handler_seconds = await asyncio.shield(in_flight)
+            # The handler work this tap did not repeat
+            self.stats["saved_seconds"] += handler_seconds
+            try:
+                await event.answer()
+            except Exception as e:
+                logger.debug(f"Failed to answer coalesced callback {event.data}: {e}")
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        started_at = time.monotonic()
+        self.stats["executed"] += 1
+        result = None
+        try:
+            result = await handler(event, data)
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            # Followers only need to know the leader finished; errors are
+            # raised (and logged) once, by the leader.
+            del self._in_flight[key]
+            future.set_result((result, time.monotonic() - started_at))
+
+
+class DegradedModeMiddleware(BaseMiddleware):
+    """Answer users at once while the database circuit is open.
+
+    Handlers marked with ``money_action`` are not run at all while the
+    circuit is open; users are told that money actions are unavailable.
+    Read-only screens still run and are served from cached data where the
+    database layer has it; updates that fail with DatabaseUnavailable get a
+    short notice instead of no answer. A write that failed after reaching
+    the database is reported as unconfirmed, not as not applied.
+    """
+
+    def __init__(self):
+        self.money_handlers: Set[str] = set()
+        self.stats = {"rejected": 0, "failed": 0}
+
+    def money_action(self, handler: Callable) -> Callable:
+        """Mark a handler that moves money (rejected outright in degraded mode)."""
+        self.money_handlers.add(handler.__name__)
+        return handler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        money_action = handler_name(data) in self.money_handlers
+        if money_action and db.circuit.is_open:
+            self.stats["rejected"] += 1
+            await self._notify(event, MONEY_UNAVAILABLE_TEXT)
+            return None
+
+        try:
+            return await handler(event, data)
+        except DatabaseUnavailable as e:
+            self.stats["failed"] += 1
+            logger.warning(f"Update answered in degraded mode: {e}")
+            if e.outcome_unknown:
+                # The write may have been committed; a blind retry could apply it twice
+                text = WRITE_UNKNOWN_TEXT
+            elif money_action or e.kind == "write":
+                text = MONEY_UNAVAILABLE_TEXT
+            else:
+                text = DEGRADED_TEXT
+            await self._notify(event, text)
+            return None
+
+    @staticmethod
+    async def _notify(event: TelegramObject, text: str):
+        """Tell the user that the request cannot be served right now."""
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(text, show_alert=True)
+            elif isinstance(event, Message):
+                await event.answer(text)
+        except Exception as e:
+            logger.debug(f"Failed to send degraded mode notice: {e}")
+
+
+# Global middleware instances
+tenant_middleware = TenantMiddleware()
+callback_coalescer = CallbackCoalescingMiddleware()
+degraded_mode = DegradedModeMiddleware()
@@ -0,0 +1,182 @@
+"""
+Sampling profiler for live handlers.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from utils.logger import logger
+from utils.routing import handler_name, routes
+
+# Seconds between two stack samples
+PROFILE_INTERVAL = 0.005
+
+# Upper bound for a single profiling session
+MAX_PROFILE_SECONDS = 300
+
+
+def _frame_label(frame) -> str:
+    """Build a flamegraph frame label like handlers/games.py:roll_dice_callback."""
+    code = frame.f_code
+    path = code.co_filename
+    parent = os.path.basename(os.path.dirname(path))
+    return f"{parent}/{os.path.basename(path)}:{code.co_name}"
+
+
+class HandlerProfiler(BaseMiddleware):
+    """Sample the event loop thread's stack while handlers are running.
+
+    The profiler is registered as an inner middleware only for the length
+    of a session and unregistered afterwards, so it costs nothing while
+    idle. A background thread samples the stack of the event loop thread
+    every PROFILE_INTERVAL seconds and keeps only stacks that run inside a
+    profiled handler call, so other handlers and background jobs running
+    while it awaits are not charged to it. Time a handler spends awaiting
+    I/O is not sampled (query time is on /queries).
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.handler_name: Optional[str] = None
+        self.max_updates: Optional[int] = None
+        self.updates = 0
+        self.started_at = 0.0
+        self.elapsed = 0.0
+        # Frames of the middleware calls wrapping profiled handlers
+        self._frames: Set[Any] = set()
+        self._observers: List[Any] = []
+        self._loop_thread_id: Optional[int] = None
+        self._stop_sampling = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._done: Optional[asyncio.Event] = None
+        self._timeout: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether a profiling session is in progress."""
+        return self._thread is not None
+
+    def start(self, observers: Iterable[Any], duration: float,
+              max_updates: Optional[int] = None, handler_name: Optional[str] = None):
+        """Start a session on the given event observers.
+
+        The session ends after duration seconds or after max_updates
+        profiled updates, whichever comes first.
+        """
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+
+        self.samples = Counter()
+        self.handler_name = handler_name
+        self.max_updates = max_updates
+        self.updates = 0
+        self.started_at = time.monotonic()
+        self.elapsed = 0.0
+        self._frames = set()
+        self._loop_thread_id = threading.get_ident()
+        self._done = asyncio.Event()
+
+        self._observers = list(observers)
+        for observer in self._observers:
+            observer.middleware(self)
+
+        self._stop_sampling.clear()
+        self._thread = threading.Thread(target=self._sample, name="handler-profiler", daemon=True)
+        self._thread.start()
+        self._timeout = asyncio.get_running_loop().call_later(min(duration, MAX_PROFILE_SECONDS), self.stop)
+        logger.info(f"Profiler started ({duration}s, {max_updates or 'any'} updates, handler {handler_name or 'any'})")
+
+    def stop(self):
+        """End the session and unregister the middleware."""
+        if not self.running:
+            return
+
+        for observer in self._observers:
+            observer.middleware.unregister(self)
+        self._observers = []
+
+        self._stop_sampling.set()
+        self._thread.join()
+        self._thread = None
+        self._timeout.cancel()
+        self.elapsed = time.monotonic() - self.started_at
+        self._done.set()
+        logger.info(f"Profiler stopped: {sum(self.samples.values())} samples, {self.updates} updates")
+
+    async def wait(self):
+        """Wait until the current session ends."""
+        if self._done:
+            await self._done.wait()
+
+    def _sample(self):
+        """Sampling loop of the background thread."""
+        while not self._stop_sampling.wait(self.interval):
+            profiled = self._frames.copy()
+            if not profiled:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = []
+            inside = False
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                inside = inside or frame in profiled
+                frame = frame.f_back
+            if inside:
+                stack.reverse()
+                self.samples[tuple(stack)] += 1
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if self.handler_name and handler_name(data) != self.handler_name:
+            return await handler(event, data)
+
+        # While the handler runs, this coroutine's frame is on the loop
+        # thread's stack; samples without it belong to other tasks
+        frame = sys._getframe()
+        self._frames.add(frame)
+        try:
+            return await handler(event, data)
+        finally:
+            self._frames.discard(frame)
+            self.updates += 1
+            if self.max_updates and self.updates >= self.max_updates:
+                self.stop()
+
+    def collapsed(self) -> str:
+        """Get samples in collapsed-stack format (flamegraph.pl, speedscope)."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def top_functions(self, limit: int = 15) -> List[Tuple[str, int, int]]:
+        """Get (function, self samples, total samples) sorted by self samples."""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        return [(label, count, total[label]) for label, count in own.most_common(limit)]
+
+
+def handler_names(router) -> List[str]:
+    """Get names of message and callback handlers of a router and its sub-routers."""
+    names = set(routes.names())
+    for child in router.chain_tail:
+        if child is routes.router:
+            continue
+        for observer in (child.message, child.callback_query):
+            names.update(handler.callback.__name__ for handler in observer.handlers)
+    return sorted(names)
+
+
+# Global handler profiler instance
+handler_profiler = HandlerProfiler()
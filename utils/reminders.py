@@ -0,0 +1,217 @@
+"""
+Opt-in "bonus ready" reminders scheduled on a hierarchical timing wheel.
+"""
+import asyncio
+import math
+import time
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+from config import REMINDER_SETTINGS
+from database.db import db
+from database.tenancy import current_tenant, use_tenant
+from utils.logger import logger
+
+# Seconds between the daily bonus and the next one
+BONUS_COOLDOWN = 86400
+
+REMINDER_TEXTS = {
+    "dice": "🎲 Your dice cooldown is over! Come back and roll again.\n\nTurn reminders off with /reminders",
+    "bonus": "🎁 Your daily bonus is ready to claim!\n\nTurn reminders off with /reminders",
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch_seconds(value: datetime) -> float:
+    """Convert a naive UTC datetime to epoch seconds."""
+    return (value - _EPOCH).total_seconds()
+
+
+class TimingWheel:
+    """Hierarchical timing wheel with O(1) schedule and cancel.
+
+    Level 0 has one slot per tick; a slot of level n spans slots**n ticks.
+    A key is placed on the lowest level whose span covers its delay and
+    moves down a level each time the wheel reaches its slot, so every key
+    is touched at most once per level. Keys further away than the top
+    level's span wait in the top level and are placed again on each turn.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4, now: Optional[float] = None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._current = int((time.time() if now is None else now) // tick)
+        self._wheels: List[List[Set[Hashable]]] = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._due: Dict[Hashable, Tuple[int, Set[Hashable]]] = {}
+        self._ready: Set[Hashable] = set()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, key: Hashable, due_at: float):
+        """Schedule key at epoch time due_at, replacing its previous time."""
+        self.cancel(key)
+        self._place(key, math.ceil(due_at / self.tick))
+
+    def cancel(self, key: Hashable):
+        """Remove key from the wheel if it is scheduled."""
+        entry = self._due.pop(key, None)
+        if entry:
+            entry[1].discard(key)
+
+    def _place(self, key: Hashable, due_tick: int):
+        """Put key into the slot that the wheel reaches no later than due_tick."""
+        delay = due_tick - self._current
+        if delay <= 0:
+            slot = self._ready
+        else:
+            level = 0
+            while level < self.levels - 1 and delay >= self.slots ** (level + 1):
+                level += 1
+            slot = self._wheels[level][(due_tick // self.slots ** level) % self.slots]
+        slot.add(key)
+        self._due[key] = (due_tick, slot)
+
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """Move the wheel to now and pop all keys that are due."""
+        target = int((time.time() if now is None else now) // self.tick)
+        while self._current < target:
+            self._current += 1
+            # Cascade higher levels first, so keys moving down to level 0
+            # can still fire on this tick
+            for level in range(self.levels - 1, 0, -1):
+                span = self.slots ** level
+                if self._current % span == 0:
+                    index = (self._current // span) % self.slots
+                    slot = self._wheels[level][index]
+                    self._wheels[level][index] = set()
+                    for key in slot:
+                        self._place(key, self._due[key][0])
+            slot = self._wheels[0][self._current % self.slots]
+            for key in slot:
+                self._due[key] = (self._due[key][0], self._ready)
+            self._ready |= slot
+            slot.clear()
+
+        due = list(self._ready)
+        for key in due:
+            del self._due[key]
+        self._ready = set()
+        return due
+
+
+class ReminderScheduler:
+    """Send reminders when the dice cooldown or the daily bonus expires.
+
+    Every successful roll or bonus of an opted-in user schedules one key
+    (tenant, user_id, kind) on the timing wheel. Due keys are popped once
+    per tick, re-checked against the database in batches (users may have
+    acted in another process or turned reminders off) and sent at no more
+    than the configured rate. The wheel lives in memory and is rebuilt from
+    opted-in users on startup; reminders that fell due while the bot was
+    down are skipped.
+    """
+
+    def __init__(self, tick: float = REMINDER_SETTINGS["tick"], rate: float = REMINDER_SETTINGS["rate"],
+                 batch_size: int = REMINDER_SETTINGS["batch_size"]):
+        self.wheel = TimingWheel(tick)
+        self.rate = rate
+        self.batch_size = batch_size
+        self.stats = {"scheduled": 0, "sent": 0, "skipped": 0, "failed": 0}
+        self._bots: Dict[Optional[str], Bot] = {}
+        # Opted-in users by tenant; only their actions are scheduled
+        self._enabled: Dict[Optional[str], Set[int]] = {}
+
+    def schedule(self, user_id: int, kind: str, last_action: Optional[datetime], cooldown: int):
+        """Schedule a reminder for the current tenant, if the user opted in."""
+        tenant = current_tenant.get()
+        if last_action is None or user_id not in self._enabled.get(tenant, ()):
+            return
+        self.wheel.schedule((tenant, user_id, kind), _epoch_seconds(last_action) + cooldown)
+        self.stats["scheduled"] += 1
+
+    async def set_enabled(self, user, enabled: bool):
+        """Start or stop reminders of a user (row or snapshot) of the current tenant."""
+        tenant = current_tenant.get()
+        enabled_users = self._enabled.setdefault(tenant, set())
+        if not enabled:
+            enabled_users.discard(user.user_id)
+            for kind in REMINDER_TEXTS:
+                self.wheel.cancel((tenant, user.user_id, kind))
+            return
+
+        enabled_users.add(user.user_id)
+        dice_cooldown = await db.get_config("dice_cooldown", 300)
+        self._schedule_pending(user.user_id, user.last_dice_roll, user.last_daily_bonus, dice_cooldown)
+
+    def _schedule_pending(self, user_id: int, last_dice_roll: Optional[datetime],
+                          last_daily_bonus: Optional[datetime], dice_cooldown: int):
+        """Schedule the reminders of a user whose cooldowns have not expired yet."""
+        now = datetime.utcnow()
+        if last_dice_roll and (now - last_dice_roll).total_seconds() < dice_cooldown:
+            self.schedule(user_id, "dice", last_dice_roll, dice_cooldown)
+        if last_daily_bonus and (now - last_daily_bonus).total_seconds() < BONUS_COOLDOWN:
+            self.schedule(user_id, "bonus", last_daily_bonus, BONUS_COOLDOWN)
+
+    async def rebuild(self, bot: Bot) -> int:
+        """Load opted-in users of the current tenant and schedule their reminders."""
+        tenant = current_tenant.get()
+        self._bots[tenant] = bot
+        rows = await db.get_reminder_users()
+        self._enabled[tenant] = {row.user_id for row in rows}
+
+        dice_cooldown = await db.get_config("dice_cooldown", 300)
+        for user_id, last_dice_roll, last_daily_bonus in rows:
+            self._schedule_pending(user_id, last_dice_roll, last_daily_bonus, dice_cooldown)
+        return len(rows)
+
+    async def send_due(self):
+        """Pop due reminders and send them; run every tick."""
+        if db.circuit.is_open:
+            # Due keys stay on the wheel and are sent once the database is back
+            return
+        batches: Dict[Tuple[Optional[str], str], List[int]] = {}
+        for tenant, user_id, kind in self.wheel.advance():
+            batches.setdefault((tenant, kind), []).append(user_id)
+
+        for (tenant, kind), user_ids in batches.items():
+            with use_tenant(tenant):
+                for start in range(0, len(user_ids), self.batch_size):
+                    await self._send_batch(kind, user_ids[start:start + self.batch_size])
+
+    async def _send_batch(self, kind: str, user_ids: List[int]):
+        """Send reminders of one kind to the users of a batch that are still eligible."""
+        if kind == "dice":
+            cooldown = await db.get_config("dice_cooldown", 300)
+            max_rolls = await db.get_config("max_daily_rolls", 10)
+        else:
+            cooldown, max_rolls = BONUS_COOLDOWN, None
+
+        try:
+            eligible = await db.get_due_reminders(kind, user_ids, cooldown, max_rolls)
+        except Exception as e:
+            self.stats["failed"] += len(user_ids)
+            logger.error(f"Failed to check {len(user_ids)} due {kind} reminders: {e}")
+            return
+        self.stats["skipped"] += len(user_ids) - len(eligible)
+
+        bot = self._bots[current_tenant.get()]
+        for user_id in eligible:
+            try:
+                await bot.send_message(user_id, REMINDER_TEXTS[kind])
+                self.stats["sent"] += 1
+            except TelegramForbiddenError:
+                # The user blocked the bot; stop reminding them
+                self._enabled.get(current_tenant.get(), set()).discard(user_id)
+                await db.set_reminders(user_id, False)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Failed to send {kind} reminder to user {user_id}: {e}")
+            await asyncio.sleep(1 / self.rate)
+
+
+# Global reminder scheduler instance
+reminder_scheduler = ReminderScheduler()
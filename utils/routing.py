@@ -0,0 +1,160 @@
+"""
+Compiled routing table for callback data and keyboard texts.
+"""
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.types import CallbackQuery, Message
+from utils.logger import logger
+
+
+class Route(NamedTuple):
+    """A handler registered in the routing table."""
+    name: str
+    handler: CallableObject
+    parse: Optional[Callable[[str], Any]] = None
+
+
+class PrefixTrie:
+    """Character trie of callback data prefixes.
+
+    Matching walks the callback data once, so its cost depends on the
+    length of the data, not on the number of registered prefixes. The
+    longest registered prefix wins.
+    """
+
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+
+    def insert(self, prefix: str, route: Route) -> Optional[Route]:
+        """Add a prefix; returns the route it replaced, if any."""
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        replaced = node.get(None)
+        node[None] = route
+        return replaced
+
+    def match(self, data: str) -> Optional[Tuple[Route, str]]:
+        """Get the route of the longest matching prefix and the rest of the data."""
+        node = self._root
+        found = None
+        for index, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found = (node[None], data[index + 1:])
+        return found
+
+
+class RoutingTable:
+    """Dispatch callbacks and keyboard texts with lookups instead of filter walks.
+
+    Exact callback data and message texts are dict lookups, callback data
+    prefixes go through a PrefixTrie and their payload (the rest of the
+    data) is parsed before the handler is called. The table is served by
+    one router with one handler per event type, included before the
+    other routers; updates without a route fall through to them.
+
+    Handlers receive the same keyword arguments as regular aiogram
+    handlers, plus ``payload`` for prefix routes. Registering the same
+    data, prefix or text twice keeps the first handler and is reported.
+    """
+
+    def __init__(self, name: str = "routes"):
+        self.router = Router(name=name)
+        self.duplicates: List[str] = []
+        self._callbacks: Dict[str, Route] = {}
+        self._prefixes = PrefixTrie()
+        self._prefix_routes: Dict[str, Route] = {}
+        self._texts: Dict[str, Route] = {}
+        self.router.callback_query.register(self._dispatch, self._match_callback)
+        self.router.message.register(self._dispatch, self._match_text)
+
+    def _add(self, table: Dict[str, Route], kind: str, key: str, handler: Callable,
+             parse: Optional[Callable[[str], Any]] = None):
+        """Add a route unless the key is taken."""
+        existing = table.get(key)
+        if existing:
+            duplicate = f"{kind} {key!r}: {handler.__name__} (already handled by {existing.name})"
+            self.duplicates.append(duplicate)
+            logger.warning(f"Duplicate route for {duplicate}")
+            return
+        table[key] = Route(handler.__name__, CallableObject(handler), parse)
+
+    def callback(self, data: str):
+        """Route callbacks whose data equals data."""
+        def decorator(handler: Callable) -> Callable:
+            self._add(self._callbacks, "callback", data, handler)
+            return handler
+        return decorator
+
+    def callback_prefix(self, prefix: str, parse: Callable[[str], Any] = str):
+        """Route callbacks whose data starts with prefix, passing parse(rest) as payload."""
+        def decorator(handler: Callable) -> Callable:
+            self._add(self._prefix_routes, "callback prefix", prefix, handler, parse)
+            self._prefixes.insert(prefix, self._prefix_routes[prefix])
+            return handler
+        return decorator
+
+    def text(self, text: str):
+        """Route messages whose text equals text."""
+        def decorator(handler: Callable) -> Callable:
+            self._add(self._texts, "text", text, handler)
+            return handler
+        return decorator
+
+    def names(self) -> List[str]:
+        """Get names of all routed handlers."""
+        routes = [*self._callbacks.values(), *self._prefix_routes.values(), *self._texts.values()]
+        return sorted({route.name for route in routes})
+
+    def check(self) -> bool:
+        """Report duplicate registrations; returns True if there are none."""
+        for duplicate in self.duplicates:
+            logger.error(f"Duplicate route ignored: {duplicate}")
+        return not self.duplicates
+
+    async def _match_callback(self, callback: CallbackQuery):
+        """Filter: find the route of a callback."""
+        data = callback.data
+        if data is None:
+            return False
+        route = self._callbacks.get(data)
+        if route:
+            return {"route": route, "route_value": None}
+        match = self._prefixes.match(data)
+        if match:
+            return {"route": match[0], "route_value": match[1]}
+        return False
+
+    async def _match_text(self, message: Message):
+        """Filter: find the route of a message text."""
+        route = self._texts.get(message.text) if message.text else None
+        return {"route": route, "route_value": None} if route else False
+
+    async def _dispatch(self, event, route: Route, route_value: Optional[str], **data):
+        """Call the routed handler with the keyword arguments it accepts."""
+        if route.parse is not None:
+            try:
+                data["payload"] = route.parse(route_value)
+            except ValueError:
+                logger.debug(f"Invalid payload {route_value!r} for {route.name}")
+                if isinstance(event, CallbackQuery):
+                    await event.answer("❌ Invalid request.")
+                return None
+        return await route.handler.call(event, **data)
+
+
+def handler_name(data: Dict[str, Any]) -> Optional[str]:
+    """Get the name of the handler processing an update, from middleware data."""
+    route = data.get("route")
+    if route:
+        return route.name
+    handler_object = data.get("handler")
+    return handler_object.callback.__name__ if handler_object else None
+
+
+# Global routing table instance
+routes = RoutingTable()
@@ -0,0 +1,43 @@
+"""
+Background task helpers for the Telegram bot.
+"""
+import asyncio
+from typing import Awaitable, Callable, List
+from utils.logger import logger
+
+# Running background tasks, cancelled on shutdown
+background_tasks: List[asyncio.Task] = []
+
+
+async def run_periodic(job: Callable[[], Awaitable], interval: float, name: str):
+    """Run a job forever, waiting interval seconds between runs."""
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background job {name} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_background(coro: Awaitable, name: str) -> asyncio.Task:
+    """Start a long-running background task, cancelled on shutdown."""
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.append(task)
+    return task
+
+
+def start_periodic(job: Callable[[], Awaitable], interval: float, name: str) -> asyncio.Task:
+    """Start a periodic background job."""
+    task = start_background(run_periodic(job, interval, name), name)
+    logger.info(f"Background job {name} started (every {interval}s)")
+    return task
+
+
+async def stop_background_tasks():
+    """Cancel all background jobs and wait for them to finish."""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()